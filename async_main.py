@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+"""
+The bot, receiving requests on asyncio rather than a thread per request.
+Run this instead of main.py to use it; the two are interchangeable.
+
+Both are the same main.VoteBot, with the same polls, store, scheduler, rosters and Home tab.
+Only the listeners differ: here they're coroutines, which ack() and hand the bot's work to its WorkQueue,
+or run it in a thread, so one event loop handles many concurrent requests.
+
+Like main.py, importing this module has no side effects; slack_bolt is only imported when the app is built.
+"""
+
+import asyncio
+import logging
+import re
+
+import util.metrics
+import util.users
+from main import VoteBot, load_config
+from util.dedupe import dedupe_async_bolt
+from views import ActionIds, CallbackIds
+
+
+def create_async_app(config: dict | None = None, restore: bool = True) -> VoteBot:
+    """
+    As main.create_app(), on a slack_bolt AsyncApp.
+    The bot's own API calls (e.g. through its SlackDispatcher) are made from worker threads, with a sync WebClient.
+    :param config: Defaults to the contents of config.json.
+    :param restore: Whether to load the bot's state too. If not, call VoteBot.restore() before handling requests.
+    :return:
+    """
+    from slack_bolt.async_app import AsyncApp
+    from slack_sdk import WebClient
+    from slack_sdk.http_retry.builtin_async_handlers import AsyncRateLimitErrorRetryHandler
+    from slack_sdk.web.async_client import AsyncWebClient
+
+    if config is None:
+        config = load_config()
+
+    base_url = config.get("slack_api_url", WebClient.BASE_URL)
+    app = AsyncApp(client=AsyncWebClient(token=config["SLACK_BOT_TOKEN"], base_url=base_url))
+    # Wait for Retry-After and retry, when Slack rate limits the listeners' own calls, e.g. views.publish.
+    app.client.retry_handlers.append(AsyncRateLimitErrorRetryHandler(max_retry_count=3))
+    util.metrics.instrument_async_bolt(app)
+
+    bot = VoteBot(config, app, client=WebClient(token=config["SLACK_BOT_TOKEN"], base_url=base_url))
+    dedupe_async_bolt(app, bot.deduplicator)
+    register_async_listeners(app, bot)
+    bot.register_stats()
+
+    if restore:
+        bot.restore(workers=config.get("restore_workers", 8))
+
+    return bot
+
+
+def register_async_listeners(app, bot: VoteBot) -> None:
+    """
+    As main.register_listeners() and home_tab.register(), for an AsyncApp.
+    :param app: slack_bolt.async_app.AsyncApp
+    :param bot:
+    :return:
+    """
+
+    @app.event("member_joined_channel")
+    @app.event("member_left_channel")
+    @app.event("user_change")
+    async def handle_membership_change(event):
+        # May look people up in the directory, so keep it off the event loop.
+        await asyncio.to_thread(util.users.rosters.handle_event, event)
+
+    @app.command("/newvote")
+    async def handle_newvote(ack, body):
+        await ack()
+        bot.work_queue.submit("newvote.views_open", bot.open_newvote_modal, body)
+
+    @app.action(ActionIds.VOTE_TYPE)
+    async def handle_action_id(ack, body):
+        await ack()
+        bot.work_queue.submit("vote_type.views_update", bot.update_newvote_modal, body)
+
+    @app.view(CallbackIds.NEW_VOTE)
+    async def handle_newvote_submission(ack, body):
+        await ack()
+        bot.submit_request("newvote.create", bot.create_poll, body)
+
+    @app.action(re.compile(f"^{ActionIds.CAST_VOTE}_"))
+    async def handle_cast_vote(ack, body):
+        await ack()
+        bot.submit_request("vote.cast", bot.cast_vote, body)
+
+    @app.event("app_home_opened")
+    async def update_home_tab(client, event, logger):
+        user_id = event["user"]
+        view, key = await asyncio.to_thread(bot.home.view_to_publish, user_id)
+        if view is None:
+            return
+
+        try:
+            await client.views_publish(user_id=user_id, view=view)
+            bot.home.published(user_id, key)
+
+        except Exception as e:
+            logger.error(f"Error publishing home tab: {e}")
+
+
+async def main(bot: VoteBot) -> None:
+    from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+
+    stop = bot.start()
+    try:
+        await AsyncSocketModeHandler(bot.app, bot.config["SLACK_APP_TOKEN"]).start_async()
+    finally:
+        bot.shutdown(stop)
+
+
+# Start listening for commands
+if __name__ == "__main__":
+    main_config = load_config()
+    logging.basicConfig(level=main_config.get("log_level", "INFO"))
+    asyncio.run(main(create_async_app(main_config)))
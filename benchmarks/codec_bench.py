@@ -0,0 +1,64 @@
+"""
+Compares the speed and size of the Poll serialisation formats.
+
+    python -m benchmarks.codec_bench [voters] [events]
+
+jsonpickle is included if it's installed.
+"""
+import json
+import random
+import sys
+import timeit
+
+from datetime import datetime, timedelta
+
+from vote import codec
+from vote.enums import VoteChoice, PollType
+from vote.poll import Poll
+from vote.slackuser import SlackUser
+
+try:
+    import jsonpickle
+except ImportError:
+    jsonpickle = None
+
+
+def make_poll(n_voters: int, n_events: int) -> Poll:
+    people = [SlackUser.intern(f"U{i:010d}") for i in range(n_voters)]
+    poll = Poll(poll_type=PollType.COMMITTEE_APPROVAL,
+                created_by=people[0],
+                public_text="MOTION: Approve Jane Doe's application for concession membership",
+                private_text="",
+                # More approvers than voters, so that the poll stays open.
+                number_of_people_who_must_vote=n_voters + 1,
+                people_who_can_vote=people,
+                closes_at=datetime.utcnow() + timedelta(days=7),
+                )
+
+    rng = random.Random(0)
+    for _ in range(n_events):
+        poll.cast_vote(rng.choice(people), rng.choice(list(VoteChoice)))
+
+    return poll
+
+
+def bench(name, encode, decode, poll, number) -> None:
+    data = encode(poll)
+    encode_time = timeit.timeit(lambda: encode(poll), number=number) / number
+    decode_time = timeit.timeit(lambda: decode(data), number=number) / number
+    print(f"{name:<12} {len(data):>10,} bytes  encode {encode_time * 1000:8.2f} ms  decode {decode_time * 1000:8.2f} ms")
+
+
+def main(n_voters: int = 2000, n_events: int = 20000, number: int = 5) -> None:
+    poll = make_poll(n_voters, n_events)
+    print(f"Poll with {n_voters:,} voters and {n_events:,} events, mean of {number} runs:")
+
+    bench("binary", codec.encode, codec.decode, poll, number)
+    bench("json", lambda p: json.dumps(p.to_json_dict()), codec.decode_json, poll, number)
+    bench("json stream", lambda p: "".join(codec.iter_json(p)), codec.decode_json, poll, number)
+    if jsonpickle is not None:
+        bench("jsonpickle", jsonpickle.encode, jsonpickle.decode, poll, number)
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:3]])
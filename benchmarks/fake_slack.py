@@ -0,0 +1,235 @@
+"""
+An in-process stand-in for the Slack Web API, for benchmarks.
+
+FakeSlack serves a synthetic workspace over HTTP on localhost, so the real slack_sdk WebClient can talk to it
+by pointing its base_url at FakeSlack.base_url. Each request can be delayed, to simulate network latency,
+and a fraction of requests can be answered with 429 Too Many Requests, to exercise rate limit handling.
+"""
+from __future__ import annotations
+
+import json
+import random
+import threading
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qsl, urlparse
+
+
+class Workspace:
+    """
+    Synthetic users and channels.
+    Every user is in channel C0000000000 (i.e. #general); other channels get a random sample of members.
+    """
+
+    def __init__(self, n_users: int = 2000, n_channels: int = 200, channel_size: int = 12, seed: int = 0) -> None:
+        rng = random.Random(seed)
+
+        self.users = [
+            {
+                "id": f"U{i:010d}",
+                "name": f"user{i}",
+                "real_name": f"User {i}",
+                "is_bot": False,
+                "is_app_user": False,
+                "profile": {"display_name": f"user{i}", "real_name": f"User {i}"},
+            }
+            for i in range(n_users)
+        ]
+        self.users_by_id = {u["id"]: u for u in self.users}
+
+        user_ids = list(self.users_by_id)
+        self.channels: Dict[str, List[str]] = {"C0000000000": user_ids}
+        for i in range(1, n_channels):
+            self.channels[f"C{i:010d}"] = rng.sample(user_ids, min(channel_size, n_users))
+
+
+class FakeSlack:
+    """
+    Serves Workspace over the subset of the Slack Web API that the bot uses.
+
+    Messages posted with chat.postMessage are kept in messages, keyed by (channel, ts),
+    and updated by chat.update, so benchmarks can find the polls they've created.
+    """
+
+    def __init__(self,
+                 workspace: Workspace,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 rate_limit_fraction: float = 0.0,
+                 retry_after: int = 1,
+                 page_size: int = 200,
+                 seed: int = 0,
+                 ) -> None:
+        """
+        :param workspace:
+        :param latency: Seconds to wait before answering each request.
+        :param jitter: Up to this many extra seconds are added to latency, at random.
+        :param rate_limit_fraction: Fraction of requests, between 0 and 1, answered with 429 Too Many Requests.
+        :param retry_after: Seconds given in the Retry-After header of 429 responses.
+        :param page_size: Maximum items per page of paginated methods.
+        :param seed:
+        """
+        self.workspace = workspace
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_fraction = rate_limit_fraction
+        self.retry_after = retry_after
+        self.page_size = page_size
+
+        self.calls: Counter = Counter()
+        self.rate_limited: Counter = Counter()
+        self.messages: Dict[tuple, dict] = dict()
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ts = 1_600_000_000
+
+        self._methods: Dict[str, Callable[[dict], dict]] = {
+            "auth.test": self._auth_test,
+            "users.info": self._users_info,
+            "users.list": self._users_list,
+            "conversations.members": self._conversations_members,
+            "conversations.open": self._conversations_open,
+            "chat.postMessage": self._chat_post_message,
+            "chat.update": self._chat_update,
+            "chat.postEphemeral": self._ok,
+            "views.open": self._view,
+            "views.update": self._view,
+            "views.publish": self._view,
+        }
+
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/"
+
+    def start(self) -> FakeSlack:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake._handle(self, dict(parse_qsl(urlparse(self.path).query)))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    args = json.loads(body or "{}")
+                else:
+                    args = dict(parse_qsl(body))
+                args.update(parse_qsl(urlparse(self.path).query))
+                fake._handle(self, args)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-slack", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self.rate_limited.clear()
+
+    def _handle(self, request: BaseHTTPRequestHandler, args: dict) -> None:
+        method = urlparse(request.path).path.rsplit("/", 1)[-1]
+
+        with self._lock:
+            self.calls[method] += 1
+            delay = self.latency + self._rng.random() * self.jitter
+            limited = self._rng.random() < self.rate_limit_fraction
+            if limited:
+                self.rate_limited[method] += 1
+
+        if delay:
+            time.sleep(delay)
+
+        if limited:
+            self._respond(request, 429, {"ok": False, "error": "ratelimited"}, {"Retry-After": str(self.retry_after)})
+            return
+
+        handler = self._methods.get(method)
+        if handler is None:
+            self._respond(request, 200, {"ok": False, "error": "unknown_method"})
+            return
+
+        try:
+            self._respond(request, 200, dict(handler(args), ok=True))
+        except KeyError as e:
+            self._respond(request, 200, {"ok": False, "error": f"not_found: {e}"})
+
+    @staticmethod
+    def _respond(request: BaseHTTPRequestHandler, status: int, data: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(data).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json; charset=utf-8")
+        request.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(body)
+
+    def _page(self, items: list, key: str, args: dict) -> dict:
+        start = int(args.get("cursor") or 0)
+        limit = min(int(args.get("limit") or self.page_size), self.page_size)
+        next_cursor = str(start + limit) if start + limit < len(items) else ""
+        return {key: items[start:start + limit], "response_metadata": {"next_cursor": next_cursor}}
+
+    def _next_ts(self) -> str:
+        with self._lock:
+            self._ts += 1
+            return f"{self._ts}.000100"
+
+    def _ok(self, args: dict) -> dict:
+        return {}
+
+    def _auth_test(self, args: dict) -> dict:
+        return {"user_id": "UBOT000000", "bot_id": "BBOT000000", "team_id": "T0000000000", "team": "Fake"}
+
+    def _users_info(self, args: dict) -> dict:
+        return {"user": self.workspace.users_by_id[args["user"]]}
+
+    def _users_list(self, args: dict) -> dict:
+        return self._page(self.workspace.users, "members", args)
+
+    def _conversations_members(self, args: dict) -> dict:
+        return self._page(self.workspace.channels[args["channel"]], "members", args)
+
+    def _conversations_open(self, args: dict) -> dict:
+        return {"channel": {"id": "D" + args["users"].split(",")[0][1:]}}
+
+    def _chat_post_message(self, args: dict) -> dict:
+        ts = self._next_ts()
+        message = {"ts": ts, "text": args.get("text", ""), "blocks": self._blocks(args)}
+        self.messages[(args["channel"], ts)] = message
+        return {"channel": args["channel"], "ts": ts, "message": message}
+
+    def _chat_update(self, args: dict) -> dict:
+        message = self.messages[(args["channel"], args["ts"])]
+        message.update(text=args.get("text", ""), blocks=self._blocks(args))
+        return {"channel": args["channel"], "ts": args["ts"]}
+
+    @staticmethod
+    def _blocks(args: dict) -> list:
+        # JSON requests carry blocks as a list, form-encoded ones as a JSON string.
+        blocks = args.get("blocks", [])
+        return json.loads(blocks) if isinstance(blocks, str) else blocks
+
+    def _view(self, args: dict) -> dict:
+        view = args.get("view")
+        if isinstance(view, str):
+            view = json.loads(view)
+        return {"view": dict(view or {}, id=f"V{self._next_ts()}", hash=self._next_ts())}
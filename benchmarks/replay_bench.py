@@ -0,0 +1,197 @@
+"""
+Replays generated Slack interactions through the real listeners in main.py, against benchmarks.fake_slack,
+and reports throughput, ack latency and Slack API calls per interaction.
+
+    python -m benchmarks.replay_bench [interactions] [latency_seconds] [rate_limit_fraction]
+
+The bot is built in a temporary directory, so its cache and poll store start empty,
+and nothing talks to the real Slack.
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+from slack_bolt.request import BoltRequest
+
+from benchmarks.fake_slack import FakeSlack, Workspace
+from main import create_app
+
+TEAM_ID = "T0000000000"
+
+
+def command_newvote(user_id: str, channel_id: str) -> dict:
+    return {
+        "command": "/newvote",
+        "text": "",
+        "team_id": TEAM_ID,
+        "user_id": user_id,
+        "channel_id": channel_id,
+        "trigger_id": f"trigger-{random.random()}",
+    }
+
+
+def view_state(vote_type: str, text: str = "", approvers: int = 2, required: List[str] = ()) -> dict:
+    # Block ID -> action ID -> value, as Slack sends the state of the "New Vote" modal.
+    return {
+        "values": {
+            "vote_text": {"vote_text_action": {"type": "plain_text_input", "value": text}},
+            "vote_type": {"vote_type_action": {"type": "radio_buttons", "selected_option": {"value": vote_type}}},
+            "approval_number_of_approvers": {"number": {"type": "number_input", "value": str(approvers)}},
+            "approval_specific_people_required": {"users": {"type": "multi_users_select",
+                                                            "selected_users": list(required)}},
+        },
+    }
+
+
+def action_vote_type(user_id: str, channel_id: str, vote_type: str) -> dict:
+    return {
+        "type": "block_actions",
+        "team": {"id": TEAM_ID},
+        "user": {"id": user_id},
+        "trigger_id": f"trigger-{random.random()}",
+        "view": {"id": "V0", "hash": "0", "callback_id": "newvote_callback", "private_metadata": channel_id,
+                 "state": view_state(vote_type)},
+        "actions": [{"type": "radio_buttons", "action_id": "vote_type_action", "block_id": "vote_type",
+                     "selected_option": {"value": vote_type}}],
+    }
+
+
+def view_submission(user_id: str, channel_id: str, text: str) -> dict:
+    return {
+        "type": "view_submission",
+        "team": {"id": TEAM_ID},
+        "user": {"id": user_id},
+        "view": {"id": "V0", "hash": "0", "callback_id": "newvote_callback", "private_metadata": channel_id,
+                 "state": view_state("online_motion", text=text)},
+    }
+
+
+def action_cast_vote(user_id: str, channel_id: str, poll_id: str, choice: str) -> dict:
+    return {
+        "type": "block_actions",
+        "team": {"id": TEAM_ID},
+        "user": {"id": user_id},
+        "channel": {"id": channel_id},
+        "actions": [{"type": "button", "action_id": f"cast_vote_{choice}", "block_id": poll_id, "value": poll_id}],
+    }
+
+
+def event_app_home_opened(user_id: str) -> dict:
+    return {
+        "type": "event_callback",
+        "team_id": TEAM_ID,
+        "event_id": f"Ev{random.random()}",
+        "event": {"type": "app_home_opened", "user": user_id, "channel": "D" + user_id[1:], "tab": "home"},
+    }
+
+
+def load_bot(fake: FakeSlack):
+    """
+    Build the bot from main.py, configured to use fake, in a fresh temporary directory.
+    :return: main.VoteBot
+    """
+    os.chdir(tempfile.mkdtemp(prefix="votebot-bench-"))
+    return create_app({
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_APP_TOKEN": "xapp-bench",
+        "slack_api_url": fake.base_url,
+    })
+
+
+def replay(name: str, bot, fake: FakeSlack, payloads: List[dict], concurrency: int) -> None:
+    """
+    Dispatch payloads to the bot's listeners from concurrency threads, as Socket Mode would,
+    wait for all the resulting work to finish, then print the results.
+    """
+    fake.reset_counts()
+
+    def dispatch(payload: dict) -> float:
+        started = time.perf_counter()
+        response = bot.app.dispatch(BoltRequest(body=payload, mode="socket_mode"))
+        if response.status != 200:
+            raise RuntimeError(f"{name}: status {response.status}: {response.body}")
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        acks = list(pool.map(dispatch, payloads))
+    bot.work_queue.join()
+    bot.coalescer.flush()
+    elapsed = time.perf_counter() - started
+
+    acks.sort()
+    p50 = statistics.median(acks)
+    p99 = acks[min(len(acks) - 1, int(len(acks) * 0.99))]
+    calls = sum(fake.calls.values())
+    print(f"{name:<18} {len(payloads):>6} in {elapsed:7.2f}s  {len(payloads) / elapsed:8.1f}/s  "
+          f"ack p50 {p50 * 1000:7.2f} ms  p99 {p99 * 1000:7.2f} ms  "
+          f"{calls / len(payloads):5.2f} Slack calls each ({sum(fake.rate_limited.values())} rate limited)")
+    for method, count in sorted(fake.calls.items()):
+        print(f"    {method:<24} {count:>7}")
+
+
+def poll_ids(fake: FakeSlack) -> List[tuple]:
+    """
+    :return: (channel, poll ID) of each poll message posted so far.
+    """
+    out = []
+    for (channel, _), message in fake.messages.items():
+        for block in message["blocks"]:
+            if block.get("type") == "actions":
+                out.append((channel, block["block_id"]))
+    return out
+
+
+def main(interactions: int = 500,
+         latency: float = 0.02,
+         rate_limit_fraction: float = 0.0,
+         n_users: int = 2000,
+         n_channels: int = 200,
+         concurrency: int = 16,
+         ) -> None:
+    rng = random.Random(0)
+    workspace = Workspace(n_users=n_users, n_channels=n_channels)
+    fake = FakeSlack(workspace, latency=latency, jitter=latency / 2, rate_limit_fraction=rate_limit_fraction).start()
+    bot = load_bot(fake)
+
+    channels = [c for c in workspace.channels if c != "C0000000000"]
+    users = list(workspace.users_by_id)
+
+    print(f"{n_users:,} users, {n_channels:,} channels, {latency * 1000:.0f} ms Slack latency, "
+          f"{rate_limit_fraction:.0%} rate limited, {concurrency} concurrent deliveries:")
+
+    def scenario(name: str, make: Callable[[], dict], n: int = interactions) -> None:
+        replay(name, bot, fake, [make() for _ in range(n)], concurrency)
+
+    scenario("/newvote", lambda: command_newvote(rng.choice(users), rng.choice(channels)))
+    scenario("vote_type_action", lambda: action_vote_type(rng.choice(users), rng.choice(channels),
+                                                          rng.choice(["online_motion", "approval"])))
+
+    # Polls to vote on, a tenth as many as there are votes, so that votes arrive in bursts per poll.
+    scenario("view_submission", lambda: view_submission(rng.choice(users), rng.choice(channels), "MOTION: bench"),
+             n=max(1, interactions // 10))
+
+    polls = poll_ids(fake)
+
+    def vote():
+        channel, poll_id = rng.choice(polls)
+        return action_cast_vote(rng.choice(workspace.channels[channel]), channel, poll_id,
+                                rng.choice(["aye", "abstain"]))
+
+    scenario("vote click", vote)
+    scenario("app_home_opened", lambda: event_app_home_opened(rng.choice(users)))
+
+    print(f"work queue: {json.dumps(bot.work_queue.stats(), indent=2)}")
+
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main(*[float(a) if "." in a else int(a) for a in sys.argv[1:4]])
@@ -0,0 +1,98 @@
+"""
+Measures how quickly the bot starts: importing main.py, then building the bot and restoring its state.
+
+    python -m benchmarks.startup_bench [polls] [votes_per_poll]
+
+Import time is measured in fresh interpreters, as a restart would see it.
+Time to ready is create_app() against a poll store of the given size, with polls restored one at a time
+and several at a time. Slack is benchmarks.fake_slack, as in replay_bench.
+"""
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timedelta
+
+from benchmarks.fake_slack import FakeSlack, Workspace
+from main import create_app
+from vote.enums import PollType, VoteChoice
+from vote.poll import Poll
+from vote.slackuser import SlackUser
+from vote.store import PollStore
+
+IMPORT_RUNS = 5
+
+
+def import_seconds(module: str) -> float:
+    """
+    :return: Median seconds to import module in a fresh interpreter.
+    """
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    runs = [float(subprocess.check_output([sys.executable, "-c", code], text=True))
+            for _ in range(IMPORT_RUNS)]
+    return statistics.median(runs)
+
+
+def make_store(root: str, workspace: Workspace, n_polls: int, n_votes: int) -> None:
+    rng = random.Random(0)
+    channels = [c for c in workspace.channels if c != "C0000000000"]
+    now = datetime.utcnow()
+
+    store = PollStore(root)
+    for _ in range(n_polls):
+        channel = rng.choice(channels)
+        people = [SlackUser.intern(u) for u in workspace.channels[channel]]
+        # More approvers than voters, so that the poll stays open.
+        poll = Poll(poll_type=PollType.COMMITTEE_APPROVAL,
+                    created_by=people[0],
+                    public_text="MOTION: bench",
+                    number_of_people_who_must_vote=len(people) + 1,
+                    people_who_can_vote=people,
+                    closes_at=now + timedelta(days=7),
+                    reminder_at=now + timedelta(days=5),
+                    channel=channel,
+                    )
+        store.save(poll)
+        for _ in range(n_votes):
+            poll.cast_vote(rng.choice(people), rng.choice(list(VoteChoice)))
+            store.save(poll)
+    store.close()
+
+
+def time_to_ready(workdir: str, fake: FakeSlack, workers: int) -> float:
+    os.chdir(workdir)
+    started = time.perf_counter()
+    bot = create_app({
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_APP_TOKEN": "xapp-bench",
+        "slack_api_url": fake.base_url,
+        "restore_workers": workers,
+    })
+    elapsed = time.perf_counter() - started
+
+    bot.work_queue.join()
+    bot.poll_store.close()
+    return elapsed
+
+
+def main(n_polls: int = 2000, n_votes: int = 20) -> None:
+    for module in ("views", "main"):
+        print(f"import {module:<6} {import_seconds(module) * 1000:8.1f} ms")
+
+    workspace = Workspace()
+    fake = FakeSlack(workspace, latency=0.0).start()
+    workdir = tempfile.mkdtemp(prefix="votebot-bench-")
+    make_store(os.path.join(workdir, "polls"), workspace, n_polls, n_votes)
+
+    for workers in (1, 4, 8):
+        print(f"ready, {n_polls:,} polls, {workers} workers {time_to_ready(workdir, fake, workers):8.2f} s")
+
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:3]])
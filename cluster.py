@@ -0,0 +1,454 @@
+#!/usr/bin/python3
+"""
+The bot, partitioned across worker processes, to use more than one core.
+
+    python cluster.py [workers]
+
+A front process receives requests from Slack over Socket Mode, acks them, and forwards each one to the worker
+which owns its channel, chosen by consistent hashing (see util.partition). Each worker is a whole bot from main.py,
+with its own poll store under poll_store_dir/worker-N, holding only the polls of its channels.
+user_change events go to every worker. The Home tab spans every channel, so the front renders it from all the
+workers' polls. Workers share the SQLite user cache, so the user directory fetched by one is read by the others
+rather than fetched again. The front and the workers share Slack's rate limits equally between them.
+Everything talks over local pipes, so a whole cluster runs on one machine.
+
+Each worker serves metrics on metrics_port + 1 + N. A worker which dies is restarted, and restores its polls from
+its store. If the number of workers changes, polls are moved to their new owners' stores before any worker starts.
+"""
+
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from concurrent.futures import Future
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import util.metrics
+from main import create_app, load_config
+from util.dispatch import SlackDispatcher
+from util.partition import BROADCAST_EVENTS, HashRing, routing_key
+from views import make_home_view
+from vote.poll import Poll
+from vote.scheduler import Scheduler
+from vote.slackuser import SlackUser
+from vote.store import PollStore
+
+# How long the front waits for the workers' polls when rendering a Home tab.
+HOME_TIMEOUT = 5.0
+
+# Records which workers the poll stores were last partitioned between.
+LAYOUT_FILE = "partitions.json"
+
+
+def worker_names(n: int) -> List[str]:
+    return [f"worker-{i}" for i in range(n)]
+
+
+def scheduler_state_path(root: str, name: str) -> str:
+    return os.path.join(root, f"{name}-scheduler.json")
+
+
+def rate_share(workers: int) -> float:
+    """
+    :return: The share of each Slack rate limit for the front, and for each worker. See SlackDispatcher.
+    """
+    return 1 / (workers + 1)
+
+
+def rebalance(root: str, ring: HashRing) -> int:
+    """
+    Move each live poll into the store of the worker which owns its channel, e.g. after changing the number of workers.
+    Does nothing if the workers haven't changed since the last time. Must be called while no worker is running.
+
+    Archived polls stay in the archive of the worker which archived them. Workers never load archived polls,
+    so it doesn't matter which one holds them, and vote.export reads every worker's archive.
+
+    A moved poll's timers are dropped from its old worker's saved scheduler state, so that they don't fire there
+    for a poll it no longer has. Its new worker schedules them from the poll itself when it restores.
+    :param root: Directory holding the workers' poll stores.
+    :param ring:
+    :return: The number of polls moved.
+    """
+    os.makedirs(root, exist_ok=True)
+    layout_path = os.path.join(root, LAYOUT_FILE)
+    if os.path.exists(layout_path):
+        with open(layout_path, "r") as f:
+            if json.load(f)["workers"] == ring.nodes:
+                return 0
+
+    moved = 0
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if not name.startswith("worker-") or not os.path.isdir(path):
+            continue
+
+        store = PollStore(path)
+        scheduler = Scheduler(lambda poll_id: None, state_path=scheduler_state_path(root, name))
+        scheduler.load()
+        try:
+            for poll_id in store.poll_ids():
+                owner = ring.node_for(store.load(poll_id).channel)
+                if owner != name:
+                    os.makedirs(os.path.join(root, owner), exist_ok=True)
+                    os.rename(os.path.join(path, poll_id), os.path.join(root, owner, poll_id))
+                    scheduler.unschedule(poll_id)
+                    moved += 1
+        finally:
+            store.close()
+            scheduler.save()
+
+    with open(layout_path, "w") as f:
+        json.dump({"workers": ring.nodes}, f)
+
+    logging.info(f"Moved {moved} polls to their new workers")
+    return moved
+
+
+def worker_config(config: dict, root: str, index: int, name: str, workers: int) -> dict:
+    """
+    :return: A worker's config: its own poll store, scheduler state, metrics port and share of the rate limits,
+        otherwise as config.
+    """
+    out = dict(config)
+    out["poll_store_dir"] = os.path.join(root, name)
+    out["scheduler_state_path"] = scheduler_state_path(root, name)
+    out["metrics_port"] = config.get("metrics_port", 9102) + 1 + index
+    out["rate_share"] = rate_share(workers)
+    return out
+
+
+def home_polls(bot, user_id: str, known_key: Hashable = None) -> Tuple[Hashable, Optional[Dict[str, List[dict]]]]:
+    """
+    The polls on a person's Home tab, from one worker. See make_home_view().
+    Results include when they last changed, i.e. closed, so that the front can merge them.
+    :param known_key: The view key (see PendingVotesIndex.view_key()) of the polls the front already has, if any.
+    :return: (view key, polls), where polls is None if the key is still known_key, i.e. the front's are up to date.
+    """
+    person = SlackUser.intern(user_id)
+    index = bot.poll_index
+
+    key = index.view_key(person)
+    if key == known_key:
+        return key, None
+
+    def encode(polls) -> List[dict]:
+        out = []
+        for poll in polls:
+            with poll.lock:
+                out.append(poll.to_json_dict(events=False))
+        return out
+
+    return key, {
+        "awaiting_vote": encode(index.awaiting_vote(person)),
+        "open_polls": encode(index.open_polls(person)),
+        "recent_results": encode(index.recent_results(person)),
+    }
+
+
+class _GatheredIndex:
+    """
+    The parts of a vote.userindex.PendingVotesIndex that make_home_view() reads, for one person,
+    gathered from every worker.
+    """
+
+    def __init__(self, parts: List[Dict[str, List[dict]]], recent_results: int = 5) -> None:
+        self._awaiting = [Poll.from_json_dict(d) for part in parts for d in part["awaiting_vote"]]
+        self._open = [Poll.from_json_dict(d) for part in parts for d in part["open_polls"]]
+
+        results = sorted((d for part in parts for d in part["recent_results"]),
+                         key=lambda d: d["changed_at"] or "", reverse=True)
+        self._recent = [Poll.from_json_dict(d) for d in results[:recent_results]]
+
+    def awaiting_vote(self, person: SlackUser) -> List[Poll]:
+        return self._awaiting
+
+    def open_polls(self, person: SlackUser) -> List[Poll]:
+        return self._open
+
+    def recent_results(self, person: SlackUser) -> List[Poll]:
+        return self._recent
+
+
+def run_worker(name: str, config: dict, conn) -> None:
+    """
+    A worker process: a bot from main.py, fed requests by the front over conn.
+    """
+    from slack_bolt.request import BoltRequest
+
+    logging.basicConfig(level=config.get("log_level", "INFO"), format=f"%(asctime)s {name} %(levelname)s %(message)s")
+    bot = create_app(config)
+    stop = bot.start()
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+
+        kind = message[0]
+        if kind == "dispatch":
+            try:
+                bot.app.dispatch(BoltRequest(body=message[1], mode="socket_mode"))
+            except Exception as e:
+                logging.error(f"{name}: dispatch failed: {e}")
+
+        elif kind == "home":
+            _, request_id, user_id, known_key = message
+            try:
+                conn.send(("reply", request_id, home_polls(bot, user_id, known_key)))
+            except Exception as e:
+                logging.error(f"{name}: home failed: {e}")
+                conn.send(("error", request_id, str(e)))
+
+        elif kind == "stop":
+            break
+
+    bot.shutdown(stop)
+
+
+class WorkerHandle:
+    """
+    The front's end of one worker process. Restarts the worker if it's died.
+    """
+
+    def __init__(self, name: str, config: dict) -> None:
+        self.name = name
+        self.config = config
+        self.restarts = 0
+
+        self._lock = threading.Lock()
+        self._replies: Dict[int, Future] = dict()
+        self._ids = itertools.count()
+        self.process = None
+        self._conn = None
+
+    def start(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        parent, child = context.Pipe()
+        self.process = context.Process(target=run_worker, args=(self.name, self.config, child),
+                                       name=self.name, daemon=True)
+        self.process.start()
+        child.close()
+        self._conn = parent
+        threading.Thread(target=self._read, args=(parent,), name=f"{self.name}-replies", daemon=True).start()
+
+    def send(self, message: tuple) -> None:
+        with self._lock:
+            if not self.process.is_alive():
+                logging.error(f"{self.name} exited with {self.process.exitcode}, restarting it")
+                self.restarts += 1
+                self.start()
+            self._conn.send(message)
+
+    def request(self, kind: str, *args) -> Future:
+        """
+        Send a request which the worker replies to, without waiting for the reply.
+        :return: The reply. Cancel it to stop waiting.
+        """
+        request_id = next(self._ids)
+        future = Future()
+        self._replies[request_id] = future
+        future.add_done_callback(lambda _: self._replies.pop(request_id, None))
+        try:
+            self.send((kind, request_id, *args))
+        except BaseException:
+            future.cancel()
+            raise
+        return future
+
+    def ask(self, kind: str, *args, timeout: float = HOME_TIMEOUT):
+        """
+        Send a request which the worker replies to, and wait for the reply.
+        """
+        future = self.request(kind, *args)
+        try:
+            return future.result(timeout)
+        finally:
+            future.cancel()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self.process is not None and self.process.is_alive():
+                self._conn.send(("stop",))
+        self.process.join()
+
+    def _read(self, conn) -> None:
+        while True:
+            try:
+                kind, request_id, value = conn.recv()
+            except (EOFError, OSError):
+                break
+
+            future = self._replies.get(request_id)
+            if future is None:
+                continue
+            if kind == "reply":
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(f"{self.name}: {value}"))
+
+        # The worker's gone. Don't leave anyone waiting for it.
+        for future in list(self._replies.values()):
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} exited"))
+
+
+class Front:
+    """
+    Receives requests from Slack and routes them to the workers.
+    """
+
+    def __init__(self, config: dict, workers: int, dispatcher: SlackDispatcher) -> None:
+        """
+        :param config: As for main.py.
+        :param workers: Number of worker processes.
+        :param dispatcher: For the Slack API calls the front makes itself, i.e. publishing Home tabs.
+            Give it rate_share(workers) of the rate limits, as each worker has the same.
+        """
+        self.config = config
+        self.dispatcher = dispatcher
+
+        names = worker_names(workers)
+        self.ring = HashRing(names)
+        root = config.get("poll_store_dir", "polls")
+        rebalance(root, self.ring)
+        self.workers = {name: WorkerHandle(name, worker_config(config, root, i, name, workers))
+                        for i, name in enumerate(names)}
+
+        # user ID -> worker name -> (view key, that worker's polls for the person's Home tab), as last gathered.
+        self._home_parts: Dict[str, Dict[str, Tuple[Hashable, dict]]] = dict()
+        # user ID -> the workers' view keys, as of the Home tab last published.
+        self._home_published: Dict[str, Tuple[Hashable, ...]] = dict()
+        self._home_lock = threading.Lock()
+
+        self.stats = {
+            "routed": 0,
+            "broadcast": 0,
+            "home_tabs": 0,
+            "home_tab_errors": 0,
+            "home_tab_skipped": 0,
+            "worker_restarts": 0,
+        }
+
+    def start(self) -> None:
+        for worker in self.workers.values():
+            worker.start()
+
+    def stop(self) -> None:
+        for worker in self.workers.values():
+            worker.stop()
+
+    def route(self, body: dict) -> None:
+        """
+        Send a request to the worker which owns it, or to every worker if it concerns them all.
+        """
+        event_type = (body.get("event") or {}).get("type")
+        if event_type == "app_home_opened":
+            self.publish_home(body["event"]["user"])
+            return
+
+        key = routing_key(body)
+        if key is None or event_type in BROADCAST_EVENTS:
+            self.stats["broadcast"] += 1
+            for worker in self.workers.values():
+                worker.send(("dispatch", body))
+            return
+
+        self.stats["routed"] += 1
+        self.workers[self.ring.node_for(key)].send(("dispatch", body))
+
+    def publish_home(self, user_id: str) -> None:
+        """
+        Gather a person's polls from every worker at once, and publish their Home tab, unless it's up to date.
+        Workers only send their polls if they've changed since last gathered, as HomeTab does in one process.
+        """
+        self.stats["home_tabs"] += 1
+        with self._home_lock:
+            known = dict(self._home_parts.get(user_id, {}))
+
+        futures = {name: worker.request("home", user_id, known.get(name, (None, None))[0])
+                   for name, worker in self.workers.items()}
+        deadline = time.monotonic() + HOME_TIMEOUT
+        try:
+            parts = dict()
+            for name, future in futures.items():
+                key, polls = future.result(max(0.0, deadline - time.monotonic()))
+                parts[name] = (key, known[name][1] if polls is None else polls)
+        except Exception as e:
+            self.stats["home_tab_errors"] += 1
+            logging.error(f"Front: couldn't gather Home tab for {user_id}: {e}")
+            return
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+        keys = tuple(key for key, _ in parts.values())
+        with self._home_lock:
+            self._home_parts[user_id] = parts
+            if self._home_published.get(user_id) == keys:
+                self.stats["home_tab_skipped"] += 1
+                return
+
+        view = make_home_view(SlackUser.intern(user_id), _GatheredIndex([polls for _, polls in parts.values()]))
+        self.dispatcher.call("views.publish", user_id=user_id, view=view)
+        with self._home_lock:
+            self._home_published[user_id] = keys
+
+    def worker_stats(self) -> dict:
+        self.stats["worker_restarts"] = sum(worker.restarts for worker in self.workers.values())
+        return self.stats
+
+    def run(self) -> None:
+        """
+        Start the workers, then receive requests from Slack until interrupted.
+        """
+        from slack_sdk import WebClient
+        from slack_sdk.socket_mode import SocketModeClient
+        from slack_sdk.socket_mode.response import SocketModeResponse
+
+        self.start()
+        util.metrics.REGISTRY.register_stats("cluster", "Request routing statistics.", self.worker_stats)
+        util.metrics.serve(self.config.get("metrics_port", 9102))
+
+        client = SocketModeClient(app_token=self.config["SLACK_APP_TOKEN"],
+                                  web_client=WebClient(token=self.config["SLACK_BOT_TOKEN"]))
+
+        def on_request(client, req):
+            # Every listener acks straight away with an empty response, so the front can ack on their behalf.
+            client.send_socket_mode_response(SocketModeResponse(envelope_id=req.envelope_id))
+            if req.type in ("events_api", "interactive", "slash_commands"):
+                self.route(req.payload)
+
+        client.socket_mode_request_listeners.append(on_request)
+        client.connect()
+        try:
+            threading.Event().wait()
+        finally:
+            self.stop()
+
+
+def create_front(config: dict | None = None, workers: int | None = None) -> Front:
+    """
+    :param config: Defaults to the contents of config.json.
+    :param workers: Defaults to the config's cluster_workers, or the number of CPUs.
+    """
+    from slack_sdk import WebClient
+
+    if config is None:
+        config = load_config()
+    if workers is None:
+        workers = config.get("cluster_workers", os.cpu_count() or 1)
+
+    client = WebClient(token=config["SLACK_BOT_TOKEN"], base_url=config.get("slack_api_url", WebClient.BASE_URL))
+    return Front(config, workers, SlackDispatcher(client, rate_share=rate_share(workers)))
+
+
+if __name__ == "__main__":
+    main_config = load_config()
+    logging.basicConfig(level=main_config.get("log_level", "INFO"))
+    create_front(main_config, int(sys.argv[1]) if len(sys.argv) > 1 else None).run()
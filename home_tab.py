@@ -1,58 +1,83 @@
-from main import app
-
-
-@app.event("app_home_opened")
-def update_home_tab(client, event, logger):
-    try:
-        # views.publish is the method that your app uses to push a view to the Home tab
-        client.views_publish(
-            # the user that opened your app's app home
-            user_id=event["user"],
-            # the view object that appears in the app home
-            view={
-                "type": "home",
-                "callback_id": "home_view",
-
-                # body of the view
-                "blocks": [
-                    {
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": "*Welcome to your _App's Home_* :tada:"
-                        }
-                    },
-                    {
-                        "type": "divider"
-                    },
-                    {
-                        "type": "divider"
-                    },
-                    {
-                        "type": "divider"
-                    },
-                    {
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": "This button won't do much for now but you can set up a listener for it using the `actions()` method and passing its unique `action_id`. See an example in the `examples` folder within your Bolt app."
-                        }
-                    },
-                    {
-                        "type": "actions",
-                        "elements": [
-                            {
-                                "type": "button",
-                                "text": {
-                                    "type": "plain_text",
-                                    "text": "Click me!"
-                                }
-                            }
-                        ]
-                    }
-                ]
-            }
-        )
-
-    except Exception as e:
-        logger.error(f"Error publishing home tab: {e}")
+import threading
+from typing import Dict, Hashable, Optional, Tuple
+
+from vote.slackuser import SlackUser
+from vote.userindex import PendingVotesIndex
+from views import make_home_view
+
+
+class HomeTab:
+    """
+    Renders people's Home tabs from a PendingVotesIndex.
+
+    Rendered views are cached until the person's entries in the index change (see PendingVotesIndex.view_key()),
+    and a view is only republished if it's changed since it was last published,
+    as Slack keeps showing the last published view.
+    """
+
+    def __init__(self, index: PendingVotesIndex) -> None:
+        self.index = index
+
+        self._rendered: Dict[str, Tuple[Hashable, dict]] = dict()  # user ID -> (index view key, view)
+        self._published: Dict[str, Hashable] = dict()  # user ID -> index view key last published
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "renders": 0,
+            "publishes": 0,
+            "skipped": 0,
+        }
+
+    def view_to_publish(self, user_id: str) -> Tuple[Optional[dict], Hashable]:
+        """
+        :param user_id:
+        :return: (view, key). view is None if the last published view is still up to date.
+        Once the view has been published, pass the key to published().
+        """
+        key = self.index.view_key(SlackUser.intern(user_id))
+
+        with self._lock:
+            if self._published.get(user_id) == key:
+                self.stats["skipped"] += 1
+                return None, key
+
+            cached = self._rendered.get(user_id)
+            if cached is not None and cached[0] == key:
+                return cached[1], key
+
+        view = make_home_view(SlackUser.intern(user_id), self.index)
+        with self._lock:
+            self._rendered[user_id] = (key, view)
+            self.stats["renders"] += 1
+
+        return view, key
+
+    def published(self, user_id: str, key: Hashable) -> None:
+        with self._lock:
+            self._published[user_id] = key
+            self.stats["publishes"] += 1
+
+
+def register(app, home: HomeTab, dispatcher) -> None:
+    """
+    Registers the app_home_opened listener.
+    :param app: slack_bolt.App
+    :param home:
+    :param dispatcher: util.dispatch.SlackDispatcher
+    :return:
+    """
+
+    @app.event("app_home_opened")
+    def update_home_tab(event, logger):
+        user_id = event["user"]
+        view, key = home.view_to_publish(user_id)
+        if view is None:
+            return
+
+        try:
+            # views.publish is the method that your app uses to push a view to the Home tab
+            dispatcher.call("views.publish", user_id=user_id, view=view)
+            home.published(user_id, key)
+
+        except Exception as e:
+            logger.error(f"Error publishing home tab: {e}")
@@ -1,269 +1,439 @@
 #!/usr/bin/python3
+"""
+The bot. Run this file to start it.
+
+Importing this module has no side effects: create_app() builds the bot from a config dict,
+VoteBot.restore() loads its state, and VoteBot.run() connects to Slack.
+slack_bolt is only imported when the bot is built, so tools and tests can import from here cheaply.
+"""
 
 import json
 import logging
-import sys
-from enum import StrEnum
-from pprint import pprint
-
-from slack_bolt import App
-from slack_bolt.adapter.socket_mode import SocketModeHandler
-
-# Local path to patched version of https://github.com/imryche/blockkit
-# Patched to support NumberInput.
-# See https://github.com/imryche/blockkit/pull/74
-sys.path.append(r"C:\gits\blockkit")
-
-from blockkit import (
-    Section,
-    MarkdownText,
-    Modal,
-    Header,
-    Divider,
-    RadioButtons,
-    PlainOption,
-    PlainText,
-    MultiUsersSelect,
-    Input,
-    PlainTextInput,
-    NumberInput,  # See above re patch for NumberInput.
+import re
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict
+
+import home_tab
+import util.metrics
+import util.users
+from util.coalesce import UpdateCoalescer
+from util.dedupe import Deduplicator, dedupe_bolt
+from util.dispatch import SlackDispatcher
+from util.pipeline import WorkQueue
+from vote.enums import EventType, PollStatus, VoteChoice
+from vote.poll import Poll
+from vote.scheduler import Scheduler
+from vote.slackuser import SlackUser
+from vote.repository import PollRepository
+from vote.store import PollStore
+from vote.userindex import PendingVotesIndex
+from views import (
+    ActionIds,
+    CallbackIds,
+    newvote_view,
+    parse_newvote_submission,
+    make_poll_message,
 )
 
-# Initialise slack
-with open("config.json", "r") as f:
-    config = json.load(f)
+# How long new polls stay open, and when people who haven't voted are reminded.
+POLL_DURATION = timedelta(days=7)
+REMINDER_AFTER = timedelta(days=5)
 
-app = App(token=config["SLACK_BOT_TOKEN"])
+# Told to someone whose request couldn't be queued, rather than dropping it without a word.
+BUSY_TEXT = "Sorry, the bot is too busy to handle that right now. Please try again in a minute."
 
 
-# Enumerate all the various magic strings used throughout the Slack blocks.
-# Using enums eliminates the problem of changing a string constant but not changing all the places it's used.
+def load_config(path: str = "config.json") -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
 
 
-class VoteType(StrEnum):
-    ONLINE_MOTION = "online_motion"
-    APPROVAL = "approval"
+class VoteBot:
+    """
+    The bot's state, and the work its listeners hand off. Build one with create_app().
+    """
 
+    def __init__(self, config: dict, app, client=None) -> None:
+        """
+        :param config: See config.json.example and README.md.
+        :param app: slack_bolt.App, or AsyncApp (see async_main.py).
+        :param client: slack_sdk WebClient for the bot's own API calls. Defaults to app.client,
+            which for an AsyncApp is async, so pass one in that case.
+        """
+        self.config = config
+        self.app = app
+        self.client = app.client if client is None else client
+
+        # Rate-limit-aware, concurrent access to the Slack Web API. Use this rather than the client directly.
+        self.dispatcher = SlackDispatcher(self.client, rate_share=config.get("rate_share", 1.0))
+
+        # Slack redelivers requests whose ack was slow, and people double-click. Drop the repeats before any listener runs.
+        self.deduplicator = Deduplicator()
+
+        # Listeners ack() immediately, then hand the rest of their work to this queue.
+        self.work_queue = WorkQueue(workers=8, maxsize=256)
+
+        self.poll_store = PollStore(config.get("poll_store_dir", "polls"))
+
+        # Every poll, indexed by ID, channel, creator, status, type and deadline.
+        self.polls = PollRepository()
+
+        # Which polls concern whom, for the Home tab.
+        self.poll_index = PendingVotesIndex()
+        self.home = home_tab.HomeTab(self.poll_index)
+
+        # poll_id -> Poll.revision last shown in the poll message.
+        self.shown_revisions = dict()
+
+        # A burst of votes on one poll results in one chat.update every couple of seconds, not one per vote.
+        self.coalescer = UpdateCoalescer(self.update_poll_message, interval=2.0)
+
+        # channel -> user ID -> whether they joined (True) or left (False), since the channel's polls were updated.
+        # Applied by their own coalescer rather than the work queue, so that they're never dropped when it's full,
+        # and a burst of changes to one channel updates its polls once.
+        self._roster_changes: Dict[str, Dict[str, bool]] = dict()
+        self._roster_changes_lock = threading.Lock()
+        self.eligibility_updates = UpdateCoalescer(self.apply_roster_changes, interval=0)
+
+        self.scheduler = Scheduler(self.polls.get, on_fired=self.on_timer_fired,
+                                   state_path=config.get("scheduler_state_path", "scheduler.json"))
+
+    def restore(self, workers: int = 8) -> None:
+        """
+        Load polls, timers and the user cache, as they were when the bot last stopped. Call once, before run().
+        Polls are loaded several at a time, while the user cache opens alongside.
+        :param workers: Number of polls to load at a time.
+        """
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="restore") as pool:
+            users_ready = pool.submit(util.users.init, self.client, self.dispatcher,
+                                      self.config.get("cache_path", "cache.sqlite3"))
+
+            # Saved timers first, so that each poll's own deadline and reminder replace them,
+            # e.g. a reminder that's been sent, or edited away, doesn't fire again.
+            self.scheduler.load()
+            for poll in self.poll_store.load_all(workers=workers):
+                self.polls.add(poll)
+                self.poll_index.track(poll)
+                self.scheduler.schedule(poll)
+
+            users_ready.result()
+
+        util.users.rosters.listeners.append(self.on_roster_changed)
+
+        for channel in {p.channel for p in self.polls.find(status=PollStatus.OPEN)}:
+            self.work_queue.submit("rosters.resync", self.resync_eligibility, channel)
+
+        logging.info(f"Restored {len(self.polls)} polls in {time.perf_counter() - started:.2f}s")
+
+    def register_stats(self) -> None:
+        util.metrics.REGISTRY.register_stats("user_cache", "util.users cache statistics.", lambda: util.users.cache.stats)
+        util.metrics.REGISTRY.register_stats("rosters", "Channel roster statistics.", lambda: util.users.rosters.stats)
+        util.metrics.REGISTRY.register_stats("scheduler", "Scheduler statistics.", lambda: self.scheduler.stats)
+        util.metrics.REGISTRY.register_stats("slack_dispatcher", "SlackDispatcher statistics.",
+                                             lambda: self.dispatcher.stats)
+        util.metrics.REGISTRY.register_stats("poll_message_updates", "UpdateCoalescer statistics.",
+                                             lambda: self.coalescer.stats)
+        util.metrics.REGISTRY.register_stats("eligibility_updates", "Roster change UpdateCoalescer statistics.",
+                                             lambda: self.eligibility_updates.stats)
+        util.metrics.REGISTRY.register_stats("work_queue", "WorkQueue statistics.", self.work_queue.stats)
+        util.metrics.REGISTRY.register_stats("home_tab", "Home tab rendering statistics.", lambda: self.home.stats)
+        util.metrics.REGISTRY.register_stats("dedupe", "Duplicate request statistics.", lambda: self.deduplicator.stats)
+        util.metrics.MemorySampler(tracemalloc_frames=self.config.get("tracemalloc_frames", 0)).register()
+
+    def start(self) -> threading.Event:
+        """
+        Serve metrics, and start the background threads.
+        :return: Set it to stop the background threads.
+        """
+        util.metrics.serve(self.config.get("metrics_port", 9102))
+        stop = threading.Event()
+        threading.Thread(target=self.poll_store.flush_forever, args=(stop,), name="store-flush", daemon=True).start()
+        threading.Thread(target=self.scheduler.run_forever, args=(stop,), name="scheduler", daemon=True).start()
+        threading.Thread(target=self.archive_forever, args=(stop,), name="archiver", daemon=True).start()
+        return stop
+
+    def run(self) -> None:
+        """
+        start(), then handle requests from Slack until interrupted.
+        """
+        from slack_bolt.adapter.socket_mode import SocketModeHandler
+
+        stop = self.start()
+        try:
+            SocketModeHandler(self.app, self.config["SLACK_APP_TOKEN"]).start()
+        finally:
+            self.shutdown(stop)
+
+    def shutdown(self, stop: threading.Event) -> None:
+        """
+        Stop the background threads, finish queued work, and write everything to disk.
+        :param stop: As returned by start().
+        """
+        stop.set()
+        self.work_queue.join()
+        self.eligibility_updates.flush()
+        self.coalescer.flush()
+        self.scheduler.save()
+        self.poll_store.close()
+        util.users.close()
+
+    def update_poll_message(self, poll_id):
+        poll = self.polls.get(poll_id)
+        if poll is None or not poll.message_ts:
+            return
+
+        with poll.lock:
+            revision = poll.revision
+            if self.shown_revisions.get(poll_id) == revision:
+                return
+            message = make_poll_message(poll)
+
+        self.dispatcher.call("chat.update", channel=poll.channel, ts=poll.message_ts, **message)
+        self.shown_revisions[poll_id] = revision
+
+    def on_timer_fired(self, poll, events):
+        self.poll_store.save(poll)
+        self.coalescer.mark(poll.poll_id)
+
+        for event in events:
+            if event.event_type is EventType.SENT_REMINDER_TO_VOTE:
+                self.dispatcher.map("chat.postMessage", [
+                    {"channel": person, "text": f"Reminder: please vote on {poll.public_text}"}
+                    for person in event.data["to"]
+                ])
+
+    def submit_request(self, stage, fn, body):
+        """
+        Queue the work for a request someone's waiting on, e.g. a vote, telling them if the queue's too full to take it.
+        """
+        if self.work_queue.submit(stage, fn, body):
+            return
+
+        user_id = body["user"]["id"]
+        channel = body.get("channel")
+        if channel is not None:
+            self.dispatcher.submit("chat.postEphemeral", channel=channel["id"], user=user_id, text=BUSY_TEXT)
+        else:
+            # e.g. a modal submission, which isn't in any channel.
+            self.dispatcher.submit("chat.postMessage", channel=user_id, text=BUSY_TEXT)
+
+    def on_roster_changed(self, channel, joined, left):
+        # Rosters notify while holding their lock, so only note the change here, and apply it elsewhere.
+        with self._roster_changes_lock:
+            changes = self._roster_changes.setdefault(channel, dict())
+            changes.update(dict.fromkeys(joined, True))
+            changes.update(dict.fromkeys(left, False))
+        self.eligibility_updates.mark(channel)
+
+    def apply_roster_changes(self, channel):
+        with self._roster_changes_lock:
+            changes = self._roster_changes.pop(channel, dict())
+
+        try:
+            self.update_eligibility(channel, joined=[u for u, j in changes.items() if j],
+                                    left=[u for u, j in changes.items() if not j])
+        except Exception:
+            # Put them back for the coalescer's retry, behind any that have come in since.
+            with self._roster_changes_lock:
+                pending = self._roster_changes.setdefault(channel, dict())
+                for user, joined in changes.items():
+                    pending.setdefault(user, joined)
+            raise
+
+    def update_eligibility(self, channel, joined, left):
+        for poll in self.polls.find(channel=channel, status=PollStatus.OPEN):
+            self.save_if_changed(poll, poll.update_eligibility, joined=[SlackUser.intern(u) for u in joined],
+                                 left=[SlackUser.intern(u) for u in left])
+
+    def resync_eligibility(self, channel):
+        # Catch polls up on membership changes made while the bot wasn't running.
+        members = util.users.rosters.members(channel)
+        active = set(members)
+        for poll in self.polls.find(channel=channel, status=PollStatus.OPEN):
+            self.save_if_changed(poll, poll.update_eligibility, joined=[SlackUser.intern(u) for u in members],
+                                 left=[p for p in poll.people_eligible_to_vote if str(p) not in active])
+
+    def save_if_changed(self, poll, change, **kwargs):
+        revision = poll.revision
+        change(**kwargs)
+        if poll.revision != revision:
+            self.poll_store.save(poll)
+            self.coalescer.mark(poll.poll_id)
+
+    def archive_forever(self, stop, interval=60 * 60):
+        # Move long-closed polls out of the live store, and out of memory.
+        while not stop.wait(interval):
+            for poll_id in self.poll_store.archive_closed():
+                self.polls.discard(poll_id)
+                self.poll_index.untrack(poll_id)
+                self.shown_revisions.pop(poll_id, None)
+
+    def open_newvote_modal(self, body):
+        my_view = newvote_view(private_metadata=body["channel_id"])
+        self.dispatcher.call("views.open", trigger_id=body["trigger_id"], view=my_view)
+
+    def update_newvote_modal(self, body):
+        my_view = newvote_view(body)
+        self.dispatcher.call(
+            "views.update",
+            # Pass the view_id
+            view_id=body["view"]["id"],
+            # String that represents view state to protect against race conditions
+            hash=body["view"]["hash"],
+            # View payload with updated blocks
+            view=my_view,
+        )
 
-class BlockIds(StrEnum):
-    VOTE_TEXT = "vote_text"
-    VOTE_TYPE = "vote_type"
-    VOTE_TYPE_LONG_DESCRIPTION = "vote_type_long_description"
-    APPROVAL_NUMBER_OF_APPROVERS = "approval_number_of_approvers"
-    APPROVAL_SPECIFIC_PEOPLE_REQUIRED = "approval_specific_people_required"
+    def create_poll(self, body):
+        kwargs = parse_newvote_submission(body["view"])
+        now = datetime.utcnow()
 
+        poll = Poll(created_by=SlackUser.intern(body["user"]["id"]),
+                    people_who_can_vote=[SlackUser.intern(u) for u, _ in util.users.get_users_in_channel(kwargs["channel"])],
+                    closes_at=now + POLL_DURATION,
+                    reminder_at=now + REMINDER_AFTER,
+                    **kwargs)
 
-class ActionIds(StrEnum):
-    VOTE_TEXT = "vote_text_action"
-    VOTE_TYPE = "vote_type_action"
+        response = self.dispatcher.call("chat.postMessage", channel=poll.channel, **make_poll_message(poll))
+        poll.posted(response["channel"], response["ts"])
 
+        self.polls.add(poll)
+        self.poll_index.track(poll)
+        self.poll_store.save(poll)
+        self.scheduler.schedule(poll)
 
-class CallbackIds(StrEnum):
-    NEW_VOTE = "newvote_callback"
+    def cast_vote(self, body):
+        action = body["actions"][0]
+        user_id = body["user"]["id"]
+        poll = self.polls.get(action["value"])
+        if poll is None:
+            return
 
+        choice = VoteChoice(action["action_id"].removeprefix(f"{ActionIds.CAST_VOTE}_"))
+        try:
+            poll.cast_vote(SlackUser.intern(user_id), choice)
+        except ValueError as e:
+            self.dispatcher.call("chat.postEphemeral", channel=poll.channel, user=user_id, text=str(e))
+            return
 
-vote_type_definitions = {
-    VoteType.ONLINE_MOTION: {
-        "text": "Online Motion",
-        "75_char_desc": "Passes when everyone votes `Aye`",
-        "2000_char_desc": "*Online motion:*\n"
-        "  - To pass, every person in the channel must vote `Aye` or `Abstain`.\n"
-        "  - To pass, at least 4 people must vote `Aye`.\n"
-        "  - Any `Nay` vote causes the motion to fail.\n",
-    },
-    VoteType.APPROVAL: {
-        "text": "Approval",
-        "75_char_desc": "Passes when specified people vote `Approve`",
-        "2000_char_desc": "*Approval*:\n"
-        "  - To pass, the specified number of people must vote `Approve`.\n"
-        "  - You can specify particular people who must `Approve`, e.g. the Chairperson or the Treasurer.\n"
-        "  - A person can vote `Object` to formally record their objection to the matter at hand.\n",
-    },
-}
+        self.poll_store.save(poll)
+        self.coalescer.mark(poll.poll_id)
 
 
-def make_newvote_modal(current_state=None):
+def create_app(config: dict | None = None, restore: bool = True) -> VoteBot:
     """
-    Construct a view for the "New Vote" modal dialog.
+    Build the bot and register its listeners.
+    :param config: Defaults to the contents of config.json.
+    :param restore: Whether to load the bot's state too. If not, call VoteBot.restore() before handling requests.
+    :return:
+    """
+    from slack_bolt import App
+    from slack_sdk import WebClient
 
-    This gets called a) upon first creation of the modal, and b) each time the view needs to be updated.
+    if config is None:
+        config = load_config()
 
-    E.g. when the radio button for "type of vote" changes, we need to display different input fields and information.
+    # slack_api_url is only set to use a stand-in for Slack, e.g. benchmarks.fake_slack.
+    app = App(client=WebClient(token=config["SLACK_BOT_TOKEN"], base_url=config.get("slack_api_url", WebClient.BASE_URL)))
+    util.metrics.instrument_bolt(app)
 
-    :param current_state: Pass in the `body` parameter from the callback.
-    Current state is pulled from body["view"]["state"].
+    bot = VoteBot(config, app)
+    dedupe_bolt(app, bot.deduplicator)
+    home_tab.register(app, bot.home, bot.dispatcher)
+    register_listeners(app, bot)
+    bot.register_stats()
 
-    :return: A Modal object, to use client.views_open() or views_update().
-    Note you must call the Method.build() method before passing to Slack API.
-    e.g.
-    my_modal = make_newvote_modal()
-    client.views_open(view=my_modal.build()).
-    """
-    print("Current state:")
-    pprint(current_state)
-    print("\n\n\n")
-
-    if current_state is None:
-        current_vote_type = VoteType.ONLINE_MOTION
-
-    else:
-        current_values = current_state["view"]["state"]["values"]
-        current_vote_type = current_values[BlockIds.VOTE_TYPE][ActionIds.VOTE_TYPE][
-            "selected_option"
-        ]["value"]
-
-    vote_text_input = Input(
-        block_id=BlockIds.VOTE_TEXT,
-        dispatch_action=False,
-        label="Vote text",
-        element=PlainTextInput(
-            action_id=ActionIds.VOTE_TEXT,
-            placeholder=PlainText(
-                text="e.g. MOTION: Approve Jane Doe's application for concession membership"
-            ),
-            multiline=True,
-        ),
-    )
-
-    def vote_type_option(vt):
-        # Convenience function to manufacture Option blocks
-        return PlainOption(
-            text=PlainText(text=vote_type_definitions[vt]["text"]),
-            value=vt,
-            description=vote_type_definitions[vt]["75_char_desc"],
-        )
+    if restore:
+        bot.restore(workers=config.get("restore_workers", 8))
 
-    # Radio button input for vote type
-    vote_type_input = Input(
-        block_id=BlockIds.VOTE_TYPE,
-        dispatch_action=True,
-        label=PlainText(text="Type of vote:"),
-        element=RadioButtons(
-            action_id=ActionIds.VOTE_TYPE,
-            initial_option=vote_type_option(current_vote_type),
-            options=[vote_type_option(vt) for vt, _ in vote_type_definitions.items()],
-        ),
-    )
-
-    # Detailed description of vote type
-    vote_type_long_description = Section(
-        block_id=BlockIds.VOTE_TYPE_LONG_DESCRIPTION,
-        text=MarkdownText(
-            text=vote_type_definitions[current_vote_type]["2000_char_desc"]
-        ),
-    )
-
-    # When the vote type is APPROVAL - input to specify how many approvers are required
-    approval_number_of_approvers_input = Input(
-        block_id=BlockIds.APPROVAL_NUMBER_OF_APPROVERS,
-        label="Number of approvers",
-        element=NumberInput(is_decimal_allowed=False, min_value="1", max_value="10"),
-    )
-
-    # When the vote type is APPROVAL - input to select specific people who must approve.
-    approval_specific_people_required_input = Input(
-        block_id=BlockIds.APPROVAL_SPECIFIC_PEOPLE_REQUIRED,
-        label="Required",
-        element=MultiUsersSelect(placeholder="Who must vote", action_id="no_action"),
-    )
-
-    blocks = [
-        Header(text="New vote"),
-        Divider(),
-        vote_text_input,
-        Divider(),
-        vote_type_input,
-        vote_type_long_description,
-        Divider(),
-    ]
-
-    if current_vote_type == VoteType.APPROVAL:
-        # Only show these blocks when relevant
-        blocks.extend(
-            [
-                approval_specific_people_required_input,
-                approval_number_of_approvers_input,
-            ]
-        )
+    return bot
 
-    my_modal = Modal(
-        title="New vote",
-        blocks=blocks,
-        close="Close",
-        submit="Submit",
-        callback_id=CallbackIds.NEW_VOTE,
-    )
-
-    return my_modal
-
-
-@app.command("/newvote")
-def handle_newvote(ack, body, logger):
-    ack()
-    my_modal = make_newvote_modal()
-    app.client.views_open(trigger_id=body["trigger_id"], view=my_modal.build())
-
-
-@app.action(ActionIds.VOTE_TYPE)
-def handle_action_id(ack, body, logger):
-    ack()
-    my_modal = make_newvote_modal(body)
-    app.client.views_update(
-        # Pass the view_id
-        view_id=body["view"]["id"],
-        # String that represents view state to protect against race conditions
-        hash=body["view"]["hash"],
-        # View payload with updated blocks
-        view=my_modal.build(),
-    )
-
-
-# Listen for a shortcut invocation
-@app.action("open_modal")
-def open_modal(body, ack, say):
-    client = say.client
-    # Acknowledge the command request
-    ack()
-    # Call views_open with the built-in client
-    client.views_open(
-        # Pass a valid trigger_id within 3 seconds of receiving it
-        trigger_id=body["trigger_id"],
-        # View payload
-        view={
-            "type": "modal",
-            # View identifier
-            "callback_id": "view_1",
-            "title": {"type": "plain_text", "text": "My App"},
-            "submit": {"type": "plain_text", "text": "Submit"},
-            "blocks": [
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": "Welcome to a modal with _blocks_",
-                    },
-                    "accessory": {
-                        "type": "button",
-                        "text": {"type": "plain_text", "text": "Click me!"},
-                        "action_id": "button_abc",
-                    },
-                },
-                {
-                    "type": "input",
-                    "block_id": "input_c",
-                    "label": {
-                        "type": "plain_text",
-                        "text": "What are your hopes and dreams?",
+
+def register_listeners(app, bot: VoteBot) -> None:
+    """
+    Registers the bot's listeners, apart from the Home tab's.
+    :param app: slack_bolt.App
+    :param bot:
+    :return:
+    """
+
+    @app.event("member_joined_channel")
+    @app.event("member_left_channel")
+    @app.event("user_change")
+    def handle_membership_change(event):
+        util.users.rosters.handle_event(event)
+
+    @app.command("/newvote")
+    def handle_newvote(ack, body, logger):
+        ack()
+        bot.work_queue.submit("newvote.views_open", bot.open_newvote_modal, body)
+
+    @app.action(ActionIds.VOTE_TYPE)
+    def handle_action_id(ack, body, logger):
+        ack()
+        bot.work_queue.submit("vote_type.views_update", bot.update_newvote_modal, body)
+
+    @app.view(CallbackIds.NEW_VOTE)
+    def handle_newvote_submission(ack, body, logger):
+        ack()
+        bot.submit_request("newvote.create", bot.create_poll, body)
+
+    @app.action(re.compile(f"^{ActionIds.CAST_VOTE}_"))
+    def handle_cast_vote(ack, body, logger):
+        ack()
+        bot.submit_request("vote.cast", bot.cast_vote, body)
+
+    # Listen for a shortcut invocation
+    @app.action("open_modal")
+    def open_modal(body, ack, say):
+        client = say.client
+        # Acknowledge the command request
+        ack()
+        # Call views_open with the built-in client
+        client.views_open(
+            # Pass a valid trigger_id within 3 seconds of receiving it
+            trigger_id=body["trigger_id"],
+            # View payload
+            view={
+                "type": "modal",
+                # View identifier
+                "callback_id": "view_1",
+                "title": {"type": "plain_text", "text": "My App"},
+                "submit": {"type": "plain_text", "text": "Submit"},
+                "blocks": [
+                    {
+                        "type": "section",
+                        "text": {
+                            "type": "mrkdwn",
+                            "text": "Welcome to a modal with _blocks_",
+                        },
+                        "accessory": {
+                            "type": "button",
+                            "text": {"type": "plain_text", "text": "Click me!"},
+                            "action_id": "button_abc",
+                        },
                     },
-                    "element": {
-                        "type": "plain_text_input",
-                        "action_id": "dreamy_input",
-                        "multiline": True,
+                    {
+                        "type": "input",
+                        "block_id": "input_c",
+                        "label": {
+                            "type": "plain_text",
+                            "text": "What are your hopes and dreams?",
+                        },
+                        "element": {
+                            "type": "plain_text_input",
+                            "action_id": "dreamy_input",
+                            "multiline": True,
+                        },
                     },
-                },
-            ],
-        },
-    )
+                ],
+            },
+        )
 
 
 # # Listens to incoming messages that contain "hello"
@@ -283,5 +453,6 @@ def open_modal(body, ack, say):
 
 # Start listening for commands
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.DEBUG)
-    SocketModeHandler(app, config["SLACK_APP_TOKEN"]).start()
+    main_config = load_config()
+    logging.basicConfig(level=main_config.get("log_level", "INFO"))
+    create_app(main_config).run()
@@ -0,0 +1,136 @@
+import asyncio
+import re
+import threading
+import unittest
+
+from async_main import register_async_listeners
+from main import BUSY_TEXT, VoteBot
+from util.pipeline import WorkQueue
+from views import ActionIds, CallbackIds
+
+
+class FakeAsyncApp:
+    """
+    Records the listeners registered on it, as slack_bolt.async_app.AsyncApp would route to them.
+    """
+
+    def __init__(self) -> None:
+        self.listeners = dict()
+
+    def _register(self, kind, key):
+        def decorator(f):
+            self.listeners[(kind, key.pattern if isinstance(key, re.Pattern) else str(key))] = f
+            return f
+
+        return decorator
+
+    def event(self, key):
+        return self._register("event", key)
+
+    def command(self, key):
+        return self._register("command", key)
+
+    def action(self, key):
+        return self._register("action", key)
+
+    def view(self, key):
+        return self._register("view", key)
+
+
+class FakeHome:
+
+    def __init__(self) -> None:
+        self.published_keys = []
+
+    def view_to_publish(self, user_id):
+        return {"type": "home", "user": user_id}, 7
+
+    def published(self, user_id, key):
+        self.published_keys.append((user_id, key))
+
+
+class FakeDispatcher:
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def submit(self, method, **kwargs):
+        self.calls.append((method, kwargs))
+
+
+class FakeBot:
+    submit_request = VoteBot.submit_request
+
+    def __init__(self) -> None:
+        self.work_queue = WorkQueue(workers=1)
+        self.dispatcher = FakeDispatcher()
+        self.home = FakeHome()
+        self.cast = []
+        self.created = []
+
+    def cast_vote(self, body):
+        self.cast.append(body)
+
+    def create_poll(self, body):
+        self.created.append(body)
+
+
+class AsyncListenersTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.app = FakeAsyncApp()
+        self.bot = FakeBot()
+        register_async_listeners(self.app, self.bot)
+
+    def test_listeners_ack_and_hand_work_to_the_bot(self):
+        acks = []
+
+        async def ack():
+            acks.append(True)
+
+        async def requests():
+            await self.app.listeners[("action", f"^{ActionIds.CAST_VOTE}_")](ack=ack, body={"vote": 1})
+            await self.app.listeners[("view", str(CallbackIds.NEW_VOTE))](ack=ack, body={"poll": 1})
+
+        asyncio.run(requests())
+        self.bot.work_queue.join()
+
+        self.assertEqual(2, len(acks))
+        self.assertEqual([{"vote": 1}], self.bot.cast)
+        self.assertEqual([{"poll": 1}], self.bot.created)
+        stages = self.bot.work_queue.stats()["stages"]
+        self.assertEqual(1, stages["vote.cast"]["count"])
+        self.assertEqual(1, stages["newvote.create"]["count"])
+
+    def test_full_queue_is_reported_to_the_voter(self):
+        release = threading.Event()
+        self.bot.work_queue = WorkQueue(workers=1, maxsize=1, submit_timeout=0.01)
+        self.addCleanup(release.set)
+        self.bot.work_queue.submit("block", release.wait)
+        self.bot.work_queue.submit("block", release.wait)
+
+        async def ack():
+            pass
+
+        body = {"user": {"id": "U1"}, "channel": {"id": "C1"}}
+        asyncio.run(self.app.listeners[("action", f"^{ActionIds.CAST_VOTE}_")](ack=ack, body=body))
+
+        self.assertEqual([("chat.postEphemeral", {"channel": "C1", "user": "U1", "text": BUSY_TEXT})],
+                         self.bot.dispatcher.calls)
+
+    def test_home_is_published_with_its_key(self):
+        published = []
+
+        class Client:
+            async def views_publish(self, user_id, view):
+                published.append((user_id, view))
+
+        asyncio.run(self.app.listeners[("event", "app_home_opened")](
+            client=Client(), event={"user": "U1"}, logger=None))
+
+        self.assertEqual([("U1", {"type": "home", "user": "U1"})], published)
+        self.assertEqual([("U1", 7)], self.bot.home.published_keys)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+import unittest
+
+from util.cache import PersistentCache
+
+
+class PersistentCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "cache.sqlite3")
+
+    def test_warm_after_restart(self):
+        cache = PersistentCache(self.path)
+        self.assertEqual({"id": "U1"}, cache.get("user:U1", lambda: {"id": "U1"}))
+        cache.close()
+
+        cache = PersistentCache(self.path)
+        self.assertEqual({"id": "U1"}, cache.get("user:U1", lambda: self.fail("Should not reload")))
+        self.assertEqual(1, cache.stats["hits"])
+        cache.close()
+
+    def test_stale_served_while_refreshing(self):
+        cache = PersistentCache(self.path, ttl=0)
+        cache.put("k", "old")
+        time.sleep(0.01)
+
+        self.assertEqual("old", cache.get("k", lambda: "new"))
+        cache.close()  # Waits for the background refresh.
+
+        cache = PersistentCache(self.path)
+        self.assertEqual("new", cache.get("k", lambda: self.fail("Should not reload")))
+        cache.close()
+
+    def test_least_recently_used_evicted(self):
+        cache = PersistentCache(self.path, maxsize=2)
+        cache.put("a", 1)
+        time.sleep(0.01)
+        cache.put("b", 2)
+        time.sleep(0.01)
+        cache.get("a", lambda: 1)
+        cache.put("c", 3)
+
+        self.assertEqual(2, len(cache))
+        self.assertEqual(2, cache.get("b", lambda: 2))
+        self.assertEqual(1, cache.stats["misses"])
+        cache.close()
+
+    def test_scan_by_prefix(self):
+        cache = PersistentCache(self.path)
+        cache.put_many({"user:U1": {"id": "U1"}, "user:U2": {"id": "U2"}, "roster:C1": ["U1"]})
+
+        self.assertEqual({"user:U1", "user:U2"}, set(cache.scan("user:")))
+        value, age = cache.peek("roster:C1")
+        self.assertEqual(["U1"], value)
+        self.assertLess(age, 60)
+        self.assertIsNone(cache.peek("roster:C2"))
+        self.assertEqual(3, len(cache))
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import time
+import unittest
+
+from util.dedupe import Deduplicator, RecentKeys
+
+
+def vote_click(trigger_id, choice, user="U1", poll_id="P1"):
+    """
+    A click on a poll message's vote button, as Slack sends it. See views.make_poll_message().
+    """
+    return {
+        "type": "block_actions",
+        "user": {"id": user},
+        "trigger_id": trigger_id,
+        "container": {"type": "message", "message_ts": "1.0", "channel_id": "C1"},
+        "channel": {"id": "C1"},
+        "actions": [{
+            "type": "button",
+            "action_id": f"cast_vote_{choice}",
+            "block_id": poll_id,
+            "value": poll_id,
+            "action_ts": trigger_id,
+        }],
+    }
+
+
+def select_click(trigger_id, option):
+    """
+    A choice from a select menu in a modal.
+    """
+    return {
+        "type": "block_actions",
+        "user": {"id": "U1"},
+        "trigger_id": trigger_id,
+        "container": {"type": "view", "view_id": "V1"},
+        "actions": [{
+            "type": "static_select",
+            "action_id": "poll_type",
+            "block_id": "poll_type",
+            "selected_option": {"value": option},
+            "action_ts": trigger_id,
+        }],
+    }
+
+
+class DeduplicatorTestCase(unittest.TestCase):
+
+    def test_redelivered_event_is_dropped(self):
+        dedupe = Deduplicator()
+        self.assertFalse(dedupe.is_duplicate({"event_id": "Ev1", "event": {}}))
+        self.assertTrue(dedupe.is_duplicate({"event_id": "Ev1", "event": {}}))
+        self.assertFalse(dedupe.is_duplicate({"event_id": "Ev2", "event": {}}))
+        self.assertEqual(1, dedupe.stats["duplicate_deliveries"])
+
+    def test_redelivered_click_is_dropped(self):
+        dedupe = Deduplicator()
+        self.assertFalse(dedupe.is_duplicate(vote_click("T1", "aye")))
+        self.assertTrue(dedupe.is_duplicate(vote_click("T1", "aye")))
+        self.assertEqual(1, dedupe.stats["duplicate_deliveries"])
+
+    def test_double_click_is_dropped(self):
+        dedupe = Deduplicator(click_ttl=0.05)
+        self.assertFalse(dedupe.is_duplicate(vote_click("T1", "aye")))
+        self.assertTrue(dedupe.is_duplicate(vote_click("T2", "aye")))
+        self.assertEqual({"requests": 2, "duplicate_deliveries": 0, "duplicate_clicks": 1}, dedupe.stats)
+
+        time.sleep(0.1)
+        self.assertFalse(dedupe.is_duplicate(vote_click("T3", "aye")))
+
+    def test_changing_vote_and_back_is_kept(self):
+        dedupe = Deduplicator()
+        self.assertFalse(dedupe.is_duplicate(vote_click("T1", "aye")))
+        self.assertFalse(dedupe.is_duplicate(vote_click("T2", "nay")))
+        self.assertFalse(dedupe.is_duplicate(vote_click("T3", "aye")))
+        self.assertTrue(dedupe.is_duplicate(vote_click("T4", "aye")))
+        self.assertEqual(1, dedupe.stats["duplicate_clicks"])
+
+    def test_clicks_are_per_person_and_poll(self):
+        dedupe = Deduplicator()
+        self.assertFalse(dedupe.is_duplicate(vote_click("T1", "aye")))
+        self.assertFalse(dedupe.is_duplicate(vote_click("T2", "aye", user="U2")))
+        self.assertFalse(dedupe.is_duplicate(vote_click("T3", "aye", poll_id="P2")))
+
+    def test_changing_selection_and_back_is_kept(self):
+        dedupe = Deduplicator()
+        self.assertFalse(dedupe.is_duplicate(select_click("T1", "a")))
+        self.assertFalse(dedupe.is_duplicate(select_click("T2", "b")))
+        self.assertFalse(dedupe.is_duplicate(select_click("T3", "a")))
+        self.assertTrue(dedupe.is_duplicate(select_click("T4", "a")))
+
+    def test_recent_keys_are_bounded(self):
+        keys = RecentKeys(ttl=60, maxsize=3)
+        for i in range(10):
+            self.assertFalse(keys.check(i))
+        self.assertEqual(3, len(keys))
+        self.assertTrue(keys.check(9))
+        self.assertFalse(keys.check(0))
+
+    def test_recent_keys_compare_values(self):
+        keys = RecentKeys(ttl=60)
+        self.assertFalse(keys.check("k", "a"))
+        self.assertTrue(keys.check("k", "a"))
+        self.assertFalse(keys.check("k", "b"))
+        self.assertFalse(keys.check("k", "a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import threading
+import unittest
+
+from util.cache import PersistentCache
+from util.directory import UserDirectory
+
+
+class FakeResponse:
+    def __init__(self, data: dict) -> None:
+        self.data = dict(data, ok=True)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+
+class FakeClient:
+    """
+    Serves users.list and conversations.members in pages of two, counting requests.
+    """
+
+    def __init__(self, users, members) -> None:
+        self.users = users
+        self.members = members
+        self.calls = []
+
+    def _page(self, method, items, key, cursor=None, **kwargs):
+        self.calls.append(method)
+        start = int(cursor or 0)
+        next_cursor = str(start + 2) if start + 2 < len(items) else ""
+        return FakeResponse({key: items[start:start + 2], "response_metadata": {"next_cursor": next_cursor}})
+
+    def users_list(self, **kwargs):
+        return self._page("users.list", self.users, "members", **kwargs)
+
+    def conversations_members(self, **kwargs):
+        return self._page("conversations.members", self.members, "members", **kwargs)
+
+    def users_info(self, user):
+        self.calls.append("users.info")
+        return FakeResponse({"user": {"id": user}})
+
+
+class FakeDispatcher:
+    """
+    Makes calls on a client straight away, recording them, as util.dispatch.SlackDispatcher would.
+    """
+
+    def __init__(self, client) -> None:
+        self.client = client
+        self.calls = []
+
+    def call(self, method, **kwargs):
+        self.calls.append(method)
+        return getattr(self.client, method.replace(".", "_"))(**kwargs)
+
+    def map(self, method, kwargs_list):
+        return [self.call(method, **kwargs) for kwargs in kwargs_list]
+
+
+class UserDirectoryTestCase(unittest.TestCase):
+
+    def test_bulk_load_follows_cursors(self):
+        users = [{"id": f"U{i}"} for i in range(5)]
+        client = FakeClient(users, members=["U0", "U1", "U2", "U4"])
+        directory = UserDirectory(client)
+
+        members = directory.channel_members("C1")
+        self.assertEqual(["U0", "U1", "U2", "U4"], members)
+        self.assertEqual([users[int(m[1:])] for m in members], [directory.get(m) for m in members])
+
+        self.assertEqual(["conversations.members"] * 2 + ["users.list"] * 3, client.calls)
+
+    def test_unknown_user_is_looked_up(self):
+        client = FakeClient([{"id": "U0"}], members=[])
+        directory = UserDirectory(client)
+
+        self.assertEqual({"id": "U9"}, directory.get("U9"))
+        self.assertEqual({"id": "U9"}, directory.get("U9"))
+        self.assertEqual(["users.list", "users.info"], client.calls)
+
+    def test_api_calls_go_through_the_dispatcher(self):
+        client = FakeClient([{"id": "U0"}], members=["U0", "U1"])
+        dispatcher = FakeDispatcher(client)
+        directory = UserDirectory(client, dispatcher=dispatcher)
+
+        directory.get_many(directory.channel_members("C1"))
+        directory.get("U2")
+
+        self.assertEqual(["conversations.members", "users.list", "users.info", "users.info"], dispatcher.calls)
+        self.assertEqual(dispatcher.calls, client.calls)
+
+    def test_restart_reads_the_cache(self):
+        users = [{"id": f"U{i}"} for i in range(3)]
+        cache = PersistentCache(":memory:")
+        self.addCleanup(cache.close)
+        UserDirectory(FakeClient(users, members=[]), cache=cache).get("U0")
+
+        client = FakeClient(users, members=[])
+        directory = UserDirectory(client, cache=cache)
+        self.assertEqual(users, directory.get_many(["U0", "U1", "U2"]))
+        self.assertEqual([], client.calls)
+
+        directory.update({"id": "U1", "deleted": True})
+        self.assertEqual({"id": "U1", "deleted": True}, UserDirectory(client, cache=cache).get("U1"))
+        self.assertEqual([], client.calls)
+
+    def test_stale_directory_served_while_one_refresh_runs(self):
+        client = FakeClient([{"id": "U0"}], members=[])
+        directory = UserDirectory(client, ttl=0)
+        directory.get("U0")
+
+        refreshing, release = threading.Event(), threading.Event()
+        users_list = client.users_list
+
+        def slow_users_list(**kwargs):
+            refreshing.set()
+            release.wait(5)
+            return users_list(**kwargs)
+
+        client.users_list = slow_users_list
+        client.users = [{"id": "U0", "deleted": True}]
+        for _ in range(3):
+            self.assertEqual({"id": "U0"}, directory.get("U0"))
+        self.assertTrue(refreshing.wait(5))
+
+        release.set()
+        directory.close()
+        directory.ttl = 600
+        self.assertEqual({"id": "U0", "deleted": True}, directory.get("U0"))
+        self.assertEqual(["users.list"] * 2, client.calls)
+
+    def test_refresh_by_another_process_is_read_from_the_cache(self):
+        cache = PersistentCache(":memory:")
+        self.addCleanup(cache.close)
+        client = FakeClient([{"id": "U0"}], members=[])
+        directory = UserDirectory(client, ttl=60, cache=cache)
+        directory.get("U0")
+        directory._loaded_at -= 120
+
+        # E.g. another cluster worker, sharing the cache file.
+        UserDirectory(FakeClient([{"id": "U0", "deleted": True}], members=[]), cache=cache).refresh()
+
+        directory.get("U0")
+        directory.close()
+        self.assertEqual({"id": "U0", "deleted": True}, directory._users["U0"])
+        self.assertEqual(["users.list"], client.calls)
+
+    def test_cache_reads_are_counted(self):
+        cache = PersistentCache(":memory:")
+        self.addCleanup(cache.close)
+        UserDirectory(FakeClient([{"id": "U0"}], members=[]), cache=cache).get("U0")
+        self.assertEqual(1, cache.stats["misses"])
+
+        UserDirectory(FakeClient([], members=[]), cache=cache).get("U0")
+        self.assertEqual(2, cache.stats["hits"])
+
+
+if __name__ == '__main__':
+    unittest.main()
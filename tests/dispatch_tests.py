@@ -0,0 +1,103 @@
+import time
+import unittest
+
+from util.dispatch import SlackDispatcher, TokenBucket
+
+try:
+    from slack_sdk.errors import SlackApiError
+except ImportError:
+    SlackApiError = None
+
+
+class TokenBucketTestCase(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=20, burst=3)
+        started = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.04)
+
+        # The bucket's empty, so the next two each wait for a token to refill.
+        bucket.acquire()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_pause_holds_everything(self):
+        bucket = TokenBucket(rate=1000, burst=10)
+        bucket.pause(0.1)
+        started = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+class SharedRateTestCase(unittest.TestCase):
+
+    def test_rate_share_scales_each_bucket(self):
+        dispatcher = SlackDispatcher(client=None, rate_share=0.25)
+        self.addCleanup(dispatcher.shutdown)
+
+        bucket = dispatcher._bucket("views.publish")
+        self.assertAlmostEqual(25 / 60, bucket.rate)
+        self.assertEqual(2, bucket.burst)
+        self.assertEqual(1, dispatcher._bucket("users.list").burst)
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict) -> None:
+        self.status_code = status_code
+        self.headers = headers
+        self.data = {"ok": status_code == 200}
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+
+class RateLimitedClient:
+    """
+    Answers views.publish with 429s, with a Retry-After header in the given case, until the given attempt.
+    """
+
+    def __init__(self, limited: int, header: str = "Retry-After") -> None:
+        self.limited = limited
+        self.header = header
+        self.calls = 0
+
+    def views_publish(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.limited:
+            raise SlackApiError("ratelimited", FakeResponse(429, {self.header: "0.05"}))
+        return FakeResponse(200, {})
+
+
+@unittest.skipIf(SlackApiError is None, "needs slack_sdk")
+class SlackDispatcherTestCase(unittest.TestCase):
+
+    def test_rate_limited_call_is_retried_after_retry_after(self):
+        client = RateLimitedClient(limited=2, header="retry-after")
+        dispatcher = SlackDispatcher(client)
+        self.addCleanup(dispatcher.shutdown)
+
+        started = time.monotonic()
+        response = dispatcher.call("views.publish", user_id="U1", view={})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, client.calls)
+        self.assertEqual(2, dispatcher.stats["rate_limited"])
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_gives_up_after_max_retries(self):
+        client = RateLimitedClient(limited=5)
+        dispatcher = SlackDispatcher(client, max_retries=1)
+        self.addCleanup(dispatcher.shutdown)
+
+        with self.assertRaises(SlackApiError):
+            dispatcher.call("views.publish", user_id="U1", view={})
+        self.assertEqual(2, client.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
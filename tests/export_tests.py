@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from datetime import datetime, timedelta
+
+from vote import export
+from vote.enums import PollStatus, PollType, VoteChoice
+from vote.poll import Poll
+from vote.slackuser import SlackUser
+from vote.store import PollStore
+
+
+def make_poll(channel: str) -> Poll:
+    people = [SlackUser(slack_id=f"DEADBEEF{i:02d}") for i in range(3)]
+    return Poll(poll_type=PollType.COMMITTEE_APPROVAL,
+                created_by=people[0],
+                public_text="public",
+                private_text="private",
+                number_of_people_who_must_vote=4,
+                people_who_can_vote=people,
+                people_who_must_vote=people[:1],
+                channel=channel,
+                )
+
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = PollStore(tmp.name, archive_after=timedelta(days=1))
+        self.addCleanup(self.store.close)
+
+        self.open_poll, self.closed_poll = make_poll("C1"), make_poll("C2")
+        self.open_poll.cast_vote(self.open_poll.created_by, VoteChoice.AYE)
+        self.closed_poll.cast_vote(self.closed_poll.created_by, VoteChoice.NAY)
+        self.closed_poll.close(self.closed_poll.created_by)
+        for poll in (self.open_poll, self.closed_poll):
+            self.store.save(poll)
+
+        # The closed poll gets archived, and still has to be exported.
+        self.store.archive_closed(now=datetime.utcnow() + timedelta(days=2))
+
+    def test_polls_as_csv(self):
+        out = io.StringIO()
+        self.assertEqual(2, export.export(self.store, out, kind="polls", fmt="csv"))
+
+        rows = {row["poll_id"]: row for row in csv.DictReader(io.StringIO(out.getvalue()))}
+        self.assertEqual({self.open_poll.poll_id, self.closed_poll.poll_id}, rows.keys())
+        closed = rows[self.closed_poll.poll_id]
+        self.assertEqual("C2", closed["channel"])
+        self.assertEqual(str(PollStatus.CLOSED_EARLY), closed["status"])
+        self.assertEqual("1", closed["nay_votes"])
+        self.assertNotEqual("", closed["closed_at"])
+        self.assertEqual("", rows[self.open_poll.poll_id]["closed_at"])
+
+    def test_events_as_jsonl_with_filters(self):
+        out = io.StringIO()
+        export.export(self.store, out, kind="events", channel="C2")
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([str(e.event_type) for e in self.closed_poll.events], [row["event_type"] for row in rows])
+        self.assertEqual({self.closed_poll.poll_id}, {row["poll_id"] for row in rows})
+
+        out = io.StringIO()
+        self.assertEqual(0, export.export(self.store, out, kind="votes", since=datetime.utcnow() + timedelta(hours=1)))
+        self.assertEqual(1, export.export(self.store, out, kind="votes", status=PollStatus.OPEN))
+
+
+class ReadOnlyExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def save(self, path: str, poll: Poll) -> None:
+        store = PollStore(path)
+        store.save(poll)
+        store.close()
+
+    def test_export_leaves_the_store_as_it_was(self):
+        poll = make_poll("C1")
+        self.save(self.root, poll)
+        # Nothing's been archived, and opening the store read-only mustn't create the archive.
+        os.rmdir(os.path.join(self.root, "archive"))
+        segment = os.path.join(self.root, poll.poll_id, "segment-0000000000.log")
+        with open(segment, "a") as f:
+            f.write('{"seq": 9, "torn')
+        with open(segment, "rb") as f:
+            before = f.read()
+        names = set(os.listdir(self.root))
+
+        stores = export.open_stores(self.root)
+        self.assertEqual(1, export.export(stores, io.StringIO(), kind="polls"))
+        with self.assertRaises(ValueError):
+            stores[0].save(make_poll("C2"))
+
+        with open(segment, "rb") as f:
+            self.assertEqual(before, f.read())
+        self.assertEqual(names, set(os.listdir(self.root)))
+
+    def test_cluster_workers_are_all_exported(self):
+        polls = [make_poll("C1"), make_poll("C2")]
+        for i, poll in enumerate(polls):
+            self.save(os.path.join(self.root, f"worker-{i}"), poll)
+
+        stores = export.open_stores(self.root)
+        out = io.StringIO()
+        self.assertEqual(2, export.export(stores, out, kind="polls"))
+        self.assertEqual({p.poll_id for p in polls}, {json.loads(line)["poll_id"] for line in out.getvalue().splitlines()})
+
+
+if __name__ == '__main__':
+    unittest.main()
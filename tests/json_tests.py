@@ -1,8 +1,11 @@
+import io
+import json
 import unittest
-import jsonpickle
 
+from datetime import datetime
 from pprint import pprint
 
+from vote import codec
 from vote.poll import Poll
 from vote.enums import VoteChoice, PollStatus, EventType, PollType
 from vote.slackuser import SlackUser
@@ -30,5 +33,50 @@ class MyTestCase(unittest.TestCase):
         pprint(myjson)
 
 
+class CodecTestCase(unittest.TestCase):
+
+    def setUp(self):
+        people = [SlackUser(slack_id=f"DEADBEEF{i:02d}") for i in range(4)]
+        self.poll = Poll(poll_type=PollType.COMMITTEE_APPROVAL,
+                         created_by=people[0],
+                         public_text="Buy a laser cutter? \N{FIRE}",
+                         private_text="private",
+                         number_of_people_who_must_vote=3,
+                         people_who_can_vote=people,
+                         people_who_must_vote=people[:1],
+                         closes_at=datetime(2024, 1, 2, 3, 4, 5, 6),
+                         )
+        self.poll.cast_vote(people[1], VoteChoice.AYE)
+        self.poll.cast_vote(people[1], VoteChoice.NAY)
+        self.poll.edit(people[0], public_text="Buy two laser cutters?")
+        self.poll.remind(now=datetime(1969, 12, 31))
+
+    def test_binary_round_trip(self):
+        data = codec.encode(self.poll)
+        loaded = codec.decode(data)
+
+        self.assertEqual(self.poll.to_json_dict(), loaded.to_json_dict())
+        self.assertEqual(self.poll.tallies, loaded.tallies)
+        self.assertLess(len(data), len(json.dumps(self.poll.to_json_dict())))
+
+    def test_binary_rejects_bad_data(self):
+        data = codec.encode(self.poll)
+
+        with self.assertRaises(codec.CodecError):
+            codec.decode(b"nonsense")
+        with self.assertRaises(codec.CodecError):
+            codec.decode(data[:-3])
+        with self.assertRaises(codec.CodecError):
+            codec.decode(data[:3] + b"\xff\xff" + data[5:])
+
+    def test_streaming_json_round_trip(self):
+        f = io.StringIO()
+        codec.write_json(self.poll, f)
+
+        self.assertEqual(self.poll.to_json_dict(), json.loads(f.getvalue()))
+        self.assertEqual(self.poll.to_json_dict(), codec.decode_json(f.getvalue()).to_json_dict())
+        self.assertIs(EventType.SENT_REMINDER_TO_VOTE, codec.decode_json(f.getvalue()).events[-1].event_type)
+
+
 if __name__ == '__main__':
     unittest.main()
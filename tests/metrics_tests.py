@@ -0,0 +1,61 @@
+import unittest
+import urllib.request
+
+from util.metrics import Registry, listener_name, serve
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        h = registry.histogram("test_seconds", "Test.", labels=("method",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            h.observe(value, method="users.info")
+
+        text = registry.render()
+        self.assertIn('votebot_test_seconds_bucket{method="users.info",le="0.1"} 1', text)
+        self.assertIn('votebot_test_seconds_bucket{method="users.info",le="1"} 3', text)
+        self.assertIn('votebot_test_seconds_bucket{method="users.info",le="+Inf"} 4', text)
+        self.assertIn('votebot_test_seconds_count{method="users.info"} 4', text)
+        self.assertIn("# TYPE votebot_test_seconds histogram", text)
+
+    def test_labels_must_match(self):
+        registry = Registry()
+        c = registry.counter("test_total", "Test.", labels=("method",))
+        with self.assertRaises(ValueError):
+            c.inc(stage="x")
+
+    def test_register_returns_existing_metric(self):
+        registry = Registry()
+        self.assertIs(registry.counter("test_total", "Test."), registry.counter("test_total", "Test."))
+
+    def test_stats_are_read_at_scrape_time(self):
+        registry = Registry()
+        stats = {"hits": 0, "misses": 0}
+        registry.register_stats("user_cache", "Test.", lambda: stats)
+        stats["hits"] = 3
+
+        self.assertIn('votebot_user_cache{stat="hits"} 3', registry.render())
+
+    def test_listener_name(self):
+        self.assertEqual("command:/newvote", listener_name({"command": "/newvote"}))
+        self.assertEqual("action:vote_type_action",
+                         listener_name({"type": "block_actions", "actions": [{"action_id": "vote_type_action"}]}))
+        self.assertEqual("event:app_home_opened",
+                         listener_name({"type": "event_callback", "event": {"type": "app_home_opened"}}))
+
+    def test_serve(self):
+        registry = Registry()
+        registry.counter("test_total", "Test.").inc()
+        server = serve(0, registry=registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url) as response:
+                self.assertIn("votebot_test_total 1", response.read().decode("utf-8"))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
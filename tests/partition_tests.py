@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+
+from datetime import datetime, timedelta
+
+from cluster import home_polls, rebalance, scheduler_state_path, worker_names
+from util.partition import HashRing, routing_key
+from vote.enums import PollType, VoteChoice
+from vote.poll import Poll
+from vote.scheduler import Scheduler
+from vote.slackuser import SlackUser
+from vote.store import PollStore
+from vote.userindex import PendingVotesIndex
+
+
+class HashRingTestCase(unittest.TestCase):
+
+    def test_adding_a_node_moves_few_keys(self):
+        keys = [f"C{i:010d}" for i in range(2000)]
+        before = HashRing(worker_names(4))
+        after = HashRing(worker_names(5))
+
+        owners = [before.node_for(k) for k in keys]
+        self.assertEqual(set(worker_names(4)), set(owners))
+        moved = sum(before.node_for(k) != after.node_for(k) for k in keys)
+        # Ideally a fifth of them, all to the new node.
+        self.assertLess(moved, len(keys) * 0.3)
+        self.assertTrue(all(after.node_for(k) == "worker-4" for k in keys if before.node_for(k) != after.node_for(k)))
+
+    def test_routing_key(self):
+        self.assertEqual("C1", routing_key({"command": "/newvote", "channel_id": "C1", "user_id": "U1"}))
+        self.assertEqual("C1", routing_key({"type": "block_actions", "user": {"id": "U1"}, "channel": {"id": "C1"}}))
+        self.assertEqual("C1", routing_key({"type": "view_submission", "user": {"id": "U1"},
+                                            "view": {"private_metadata": "C1"}}))
+        self.assertEqual("C1", routing_key({"event": {"type": "member_joined_channel", "channel": "C1", "user": "U1"}}))
+        self.assertIsNone(routing_key({"event": {"type": "user_change", "user": {"id": "U1"}}}))
+
+
+class RebalanceTestCase(unittest.TestCase):
+
+    def test_polls_move_to_their_new_owners(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        person = SlackUser.intern("U1")
+
+        # Everything starts on one worker.
+        store = PollStore(os.path.join(tmp.name, "worker-0"))
+        polls = [Poll(poll_type=PollType.COMMITTEE_MOTION, created_by=person, people_who_can_vote=[person],
+                      channel=f"C{i}") for i in range(30)]
+        for poll in polls:
+            store.save(poll)
+        store.close()
+        self.assertEqual(0, rebalance(tmp.name, HashRing(worker_names(1))))
+
+        ring = HashRing(worker_names(3))
+        self.assertGreater(rebalance(tmp.name, ring), 0)
+        self.assertEqual(0, rebalance(tmp.name, ring))
+
+        for poll in polls:
+            store = PollStore(os.path.join(tmp.name, ring.node_for(poll.channel)))
+            self.assertEqual(poll.channel, store.load(poll.poll_id).channel)
+            store.close()
+
+    def test_moved_polls_timers_are_dropped(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        person = SlackUser.intern("U1")
+        closes_at = datetime.utcnow() + timedelta(days=1)
+
+        store = PollStore(os.path.join(tmp.name, "worker-0"))
+        scheduler = Scheduler(lambda poll_id: None, state_path=scheduler_state_path(tmp.name, "worker-0"))
+        polls = [Poll(poll_type=PollType.COMMITTEE_MOTION, created_by=person, people_who_can_vote=[person],
+                      channel=f"C{i}", closes_at=closes_at) for i in range(30)]
+        for poll in polls:
+            store.save(poll)
+            scheduler.schedule(poll)
+        store.close()
+        scheduler.save()
+
+        ring = HashRing(worker_names(3))
+        rebalance(tmp.name, ring)
+
+        scheduler = Scheduler(lambda poll_id: None, state_path=scheduler_state_path(tmp.name, "worker-0"))
+        scheduler.load()
+        self.assertEqual(sum(ring.node_for(poll.channel) == "worker-0" for poll in polls), scheduler.pending())
+
+
+class HomePollsTestCase(unittest.TestCase):
+
+    def test_polls_only_sent_when_changed(self):
+        person = SlackUser.intern("U1")
+        poll = Poll(poll_type=PollType.COMMITTEE_MOTION, created_by=person, people_who_can_vote=[person], channel="C1")
+        bot = type("Worker", (), {"poll_index": PendingVotesIndex()})()
+        bot.poll_index.track(poll)
+
+        key, polls = home_polls(bot, "U1")
+        self.assertEqual([poll.poll_id], [d["poll_id"] for d in polls["awaiting_vote"]])
+        self.assertEqual((key, None), home_polls(bot, "U1", known_key=key))
+
+        poll.cast_vote(person, VoteChoice.AYE)
+        new_key, polls = home_polls(bot, "U1", known_key=key)
+        self.assertNotEqual(key, new_key)
+        self.assertEqual([], polls["awaiting_vote"])
+
+
+if __name__ == '__main__':
+    unittest.main()
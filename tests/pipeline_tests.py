@@ -0,0 +1,90 @@
+import threading
+import time
+import unittest
+
+from util.coalesce import UpdateCoalescer
+from util.pipeline import WorkQueue
+
+
+class WorkQueueTestCase(unittest.TestCase):
+
+    def test_work_runs_and_is_timed(self):
+        work_queue = WorkQueue(workers=2)
+        done = []
+        for i in range(5):
+            self.assertTrue(work_queue.submit("append", done.append, i))
+        work_queue.submit("fail", lambda: 1 / 0)
+        work_queue.join()
+
+        self.assertEqual([0, 1, 2, 3, 4], sorted(done))
+        stats = work_queue.stats()
+        self.assertEqual(0, stats["depth"])
+        self.assertEqual(5, stats["stages"]["append"]["count"])
+        self.assertEqual(1, stats["stages"]["fail"]["errors"])
+
+    def test_full_queue_rejects(self):
+        release = threading.Event()
+        work_queue = WorkQueue(workers=1, maxsize=1, submit_timeout=0.01)
+        work_queue.submit("block", release.wait)
+        # The worker may not have taken the first job yet, so allow for one more to fit.
+        results = [work_queue.submit("block", release.wait) for _ in range(3)]
+        release.set()
+        work_queue.join()
+
+        self.assertIn(False, results)
+        self.assertEqual(results.count(False), work_queue.stats()["rejected"])
+
+
+class UpdateCoalescerTestCase(unittest.TestCase):
+
+    def test_burst_is_coalesced_and_ends_on_latest_state(self):
+        state = {"poll": 0}
+        rendered = []
+        coalescer = UpdateCoalescer(lambda key: rendered.append((key, state[key])), interval=0.2)
+
+        for i in range(1, 13):
+            state["poll"] = i
+            coalescer.mark("poll")
+            time.sleep(0.01)
+        self.assertTrue(coalescer.flush())
+
+        # The first mark updates straight away; the rest of the burst is merged into one trailing update.
+        self.assertEqual(2, len(rendered))
+        self.assertEqual(("poll", 12), rendered[-1])
+
+    def test_keys_are_independent(self):
+        rendered = []
+        coalescer = UpdateCoalescer(rendered.append, interval=10)
+        coalescer.mark("a")
+        coalescer.mark("b")
+        self.assertTrue(coalescer.flush(timeout=1))
+
+        self.assertEqual(["a", "b"], rendered)
+
+    def test_failed_update_is_retried_with_backoff(self):
+        attempts = []
+
+        def update(key):
+            attempts.append(time.monotonic())
+            if len(attempts) < 3:
+                raise RuntimeError("ratelimited")
+
+        coalescer = UpdateCoalescer(update, interval=0, retry_after=0.05)
+        coalescer.mark("poll")
+        self.assertTrue(coalescer.flush(timeout=5))
+
+        self.assertEqual(3, len(attempts))
+        self.assertGreaterEqual(attempts[2] - attempts[1], 0.1)
+        self.assertEqual(2, coalescer.stats["retries"])
+
+    def test_gives_up_after_max_retries(self):
+        coalescer = UpdateCoalescer(lambda key: 1 / 0, interval=0, retry_after=0.01, max_retries=2)
+        coalescer.mark("poll")
+        self.assertTrue(coalescer.flush(timeout=5))
+
+        self.assertEqual(3, coalescer.stats["errors"])
+        self.assertEqual(1, coalescer.stats["dropped"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,272 @@
+import threading
+import unittest
+
+from datetime import datetime, timedelta
+
+from vote import codec
+from vote.enums import VoteChoice, PollType, PollStatus, EventType
+from vote.poll import Poll
+from vote.slackuser import SlackUser
+from vote.userindex import PendingVotesIndex
+
+
+class PollTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.people = [SlackUser(slack_id=f"DEADBEEF{i:02d}") for i in range(5)]
+        self.poll = Poll(poll_type=PollType.COMMITTEE_MOTION,
+                         created_by=self.people[0],
+                         people_who_can_vote=self.people[:4],
+                         people_who_must_vote=self.people[:2],
+                         )
+
+    def test_tallies_follow_changed_votes(self):
+        self.poll.cast_vote(self.people[0], VoteChoice.AYE)
+        self.poll.cast_vote(self.people[1], VoteChoice.AYE)
+        self.poll.cast_vote(self.people[1], VoteChoice.NAY)
+
+        self.assertEqual({VoteChoice.AYE: 1, VoteChoice.NAY: 1, VoteChoice.ABSTAIN: 0}, self.poll.tallies)
+        self.assertEqual(2, self.poll.number_yet_to_vote)
+        self.assertEqual(set(), self.poll.must_vote_outstanding)
+
+    def test_ineligible_voter_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.poll.cast_vote(self.people[4], VoteChoice.AYE)
+
+    def test_indexes_follow_edits(self):
+        self.poll.cast_vote(self.people[3], VoteChoice.ABSTAIN)
+        self.poll.edit(self.people[0],
+                       people_eligible_to_vote=self.people[3:],
+                       people_who_must_vote=self.people[3:])
+
+        self.assertTrue(self.poll.is_eligible(self.people[4]))
+        self.assertFalse(self.poll.is_eligible(self.people[0]))
+        self.assertEqual(1, self.poll.number_yet_to_vote)
+        self.assertEqual({self.people[4]}, self.poll.must_vote_outstanding)
+
+    def test_indexes_survive_round_trip(self):
+        self.poll.cast_vote(self.people[0], VoteChoice.NAY)
+        loaded = Poll.from_json_dict(self.poll.to_json_dict())
+
+        self.assertEqual(self.poll.tallies, loaded.tallies)
+        self.assertEqual({self.people[1]}, loaded.must_vote_outstanding)
+        self.assertEqual(3, loaded.number_yet_to_vote)
+
+    def test_loaded_people_are_shared(self):
+        a = Poll.from_json_dict(self.poll.to_json_dict())
+        b = Poll.from_json_dict(self.poll.to_json_dict())
+
+        self.assertIs(a.created_by, b.created_by)
+        self.assertIs(a.people_eligible_to_vote[3], b.people_eligible_to_vote[3])
+
+    def test_votes_kept_when_voter_loses_eligibility(self):
+        self.poll.cast_vote(self.people[1], VoteChoice.ABSTAIN)
+        self.poll.edit(self.people[0], people_eligible_to_vote=self.people[2:])
+
+        self.assertEqual(VoteChoice.ABSTAIN, self.poll.vote_of(self.people[1]))
+        self.assertEqual({self.people[1]: VoteChoice.ABSTAIN}, self.poll.votes)
+        self.assertEqual(3, self.poll.number_yet_to_vote)
+
+    def test_text_edits_are_stored_as_deltas(self):
+        long_text = "Buy a laser cutter? " * 50
+        self.poll.edit(self.people[0], public_text=long_text)
+        self.poll.edit(self.people[0], public_text=long_text.replace("laser", "lazer", 1))
+        self.poll.edit(self.people[0], public_text=long_text.replace("laser", "plasma", 1))
+
+        self.assertEqual({"attr": "public_text", "delta": [[8, "s", "z"]]}, self.poll.events[-2].data)
+        self.assertEqual([[6, "lazer", "plasma"]], self.poll.events[-1].data["delta"])
+        self.assertEqual("public_text changed.\n\nReplaced: 'lazer' with 'plasma'", self.poll.events[-1].details)
+
+        self.assertEqual("", self.poll.value_at("public_text", 0))
+        self.assertEqual(long_text, self.poll.value_at("public_text", 1))
+        self.assertEqual(long_text.replace("laser", "lazer", 1), self.poll.value_at("public_text", 2))
+        self.assertEqual(self.poll.public_text, self.poll.value_at("public_text", 3))
+        self.assertEqual(long_text.replace("laser", "plasma", 1), Poll.from_json_dict(self.poll.to_json_dict()).public_text)
+
+    def test_enum_edits_keep_their_type(self):
+        self.poll.edit(self.people[0], poll_type="committee_approval")
+
+        self.assertIs(PollType.COMMITTEE_APPROVAL, self.poll.poll_type)
+        self.assertEqual({"attr": "poll_type", "old": "committee_motion", "new": "committee_approval"},
+                         self.poll.events[-1].data)
+        self.assertIs(PollType.COMMITTEE_MOTION, self.poll.value_at("poll_type", 0))
+
+        for loaded in (codec.decode(codec.encode(self.poll)), Poll.from_json_dict(self.poll.to_json_dict())):
+            self.assertIs(PollType.COMMITTEE_APPROVAL, loaded.poll_type)
+            self.assertEqual(self.poll.events, loaded.events)
+
+    def test_eligibility_follows_channel_membership(self):
+        self.poll.cast_vote(self.people[3], VoteChoice.ABSTAIN)
+        self.poll.update_eligibility(joined=[self.people[4]], left=[self.people[3]])
+
+        self.assertTrue(self.poll.is_eligible(self.people[4]))
+        self.assertFalse(self.poll.is_eligible(self.people[3]))
+        self.assertEqual(VoteChoice.ABSTAIN, self.poll.vote_of(self.people[3]))
+        self.assertEqual(4, self.poll.number_yet_to_vote)
+        self.assertIs(EventType.ELIGIBILITY_CHANGED, self.poll.events[-1].event_type)
+
+        # And survives a round trip.
+        b = Poll.from_json_dict(self.poll.to_json_dict())
+        self.assertEqual(self.poll.people_eligible_to_vote, b.people_eligible_to_vote)
+
+    def test_concurrent_votes_are_all_counted(self):
+        people = [SlackUser(slack_id=f"DEADBEEF{i:02d}") for i in range(40)]
+        poll = Poll(poll_type=PollType.COMMITTEE_APPROVAL,
+                    created_by=people[0],
+                    number_of_people_who_must_vote=len(people) + 1,
+                    people_who_can_vote=people,
+                    )
+
+        def vote(voters):
+            for _ in range(50):
+                for voter in voters:
+                    poll.cast_vote(voter, VoteChoice.AYE)
+                    poll.cast_vote(voter, VoteChoice.ABSTAIN)
+
+        threads = [threading.Thread(target=vote, args=(people[i::8],)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(40 * 50 * 2, poll.revision)
+        self.assertEqual({VoteChoice.AYE: 0, VoteChoice.NAY: 0, VoteChoice.ABSTAIN: 40}, poll.tallies)
+        self.assertEqual(0, poll.number_yet_to_vote)
+
+    def test_unchanged_eligibility_records_nothing(self):
+        self.poll.update_eligibility(joined=[self.people[1]], left=[self.people[4]])
+        self.assertEqual([], self.poll.events)
+
+
+class OutcomeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.people = [SlackUser(slack_id=f"DEADBEEF{i:02d}") for i in range(6)]
+
+    def make_poll(self, poll_type: PollType, **kwargs) -> Poll:
+        return Poll(poll_type=poll_type,
+                    created_by=self.people[0],
+                    people_who_can_vote=self.people,
+                    **kwargs)
+
+    def test_motion_rejected_by_first_nay(self):
+        poll = self.make_poll(PollType.COMMITTEE_MOTION)
+        poll.cast_vote(self.people[0], VoteChoice.AYE)
+        poll.cast_vote(self.people[1], VoteChoice.NAY)
+
+        self.assertIs(PollStatus.REJECTED, poll.status)
+        self.assertIs(EventType.AUTO_CLOSED, poll.events[-1].event_type)
+        with self.assertRaises(ValueError):
+            poll.cast_vote(self.people[2], VoteChoice.AYE)
+
+    def test_motion_passes_when_last_person_votes(self):
+        poll = self.make_poll(PollType.COMMITTEE_MOTION)
+        for person, choice in zip(self.people, [VoteChoice.AYE] * 4 + [VoteChoice.ABSTAIN]):
+            poll.cast_vote(person, choice)
+        self.assertIs(PollStatus.OPEN, poll.status)
+
+        poll.cast_vote(self.people[5], VoteChoice.ABSTAIN)
+        self.assertIs(PollStatus.PASSED, poll.status)
+
+    def test_motion_needs_enough_ayes(self):
+        poll = self.make_poll(PollType.COMMITTEE_MOTION)
+        for person, choice in zip(self.people, [VoteChoice.AYE] * 3 + [VoteChoice.ABSTAIN] * 3):
+            poll.cast_vote(person, choice)
+        self.assertIs(PollStatus.REJECTED, poll.status)
+
+    def test_approval_passes_when_last_required_approver_votes(self):
+        poll = self.make_poll(PollType.COMMITTEE_APPROVAL,
+                              number_of_people_who_must_vote=2,
+                              people_who_must_vote=[self.people[5]])
+        poll.cast_vote(self.people[1], VoteChoice.AYE)
+        poll.cast_vote(self.people[2], VoteChoice.NAY)
+        poll.cast_vote(self.people[3], VoteChoice.AYE)
+        self.assertIs(PollStatus.OPEN, poll.status)
+
+        poll.cast_vote(self.people[5], VoteChoice.AYE)
+        self.assertIs(PollStatus.PASSED, poll.status)
+
+    def test_undecided_poll_lapses_at_deadline(self):
+        closes_at = datetime(2024, 1, 1)
+        poll = self.make_poll(PollType.COMMITTEE_APPROVAL, number_of_people_who_must_vote=3, closes_at=closes_at)
+        poll.cast_vote(self.people[1], VoteChoice.AYE)
+
+        poll.cron(now=closes_at - timedelta(seconds=1))
+        self.assertIs(PollStatus.OPEN, poll.status)
+
+        poll.cron(now=closes_at)
+        self.assertIs(PollStatus.LAPSED, poll.status)
+
+    def test_manual_close(self):
+        poll = self.make_poll(PollType.COMMITTEE_APPROVAL, number_of_people_who_must_vote=3)
+        with self.assertRaises(ValueError):
+            poll.close(self.people[1])
+
+        poll.close(self.people[0])
+        self.assertIs(PollStatus.CLOSED_EARLY, poll.status)
+        self.assertIs(EventType.MANUALLY_CLOSED, poll.events[-1].event_type)
+
+
+class PendingVotesIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.people = [SlackUser(slack_id=f"DEADBEEF{i:02d}") for i in range(4)]
+        self.index = PendingVotesIndex()
+        self.poll = Poll(poll_type=PollType.COMMITTEE_APPROVAL,
+                         created_by=self.people[0],
+                         number_of_people_who_must_vote=2,
+                         people_who_can_vote=self.people[1:3],
+                         )
+        self.index.track(self.poll)
+
+    def test_vote_clears_pending(self):
+        self.assertEqual([self.poll], self.index.awaiting_vote(self.people[1]))
+        self.assertEqual([self.poll], self.index.open_polls(self.people[0]))
+        self.assertEqual([], self.index.awaiting_vote(self.people[0]))
+
+        keys = [self.index.view_key(person) for person in self.people]
+        self.poll.cast_vote(self.people[1], VoteChoice.AYE)
+
+        self.assertEqual([], self.index.awaiting_vote(self.people[1]))
+        self.assertEqual([self.poll], self.index.awaiting_vote(self.people[2]))
+        # Everyone who sees the Poll sees its tally change.
+        for person, key in zip(self.people[:3], keys):
+            self.assertNotEqual(key, self.index.view_key(person))
+        self.assertEqual(keys[3], self.index.view_key(self.people[3]))
+
+    def test_close_moves_to_results(self):
+        self.poll.cast_vote(self.people[1], VoteChoice.AYE)
+        self.poll.cast_vote(self.people[2], VoteChoice.AYE)
+
+        self.assertIs(PollStatus.PASSED, self.poll.status)
+        for person in self.people[:3]:
+            self.assertEqual([], self.index.open_polls(person))
+            self.assertEqual([self.poll], self.index.recent_results(person))
+        self.assertEqual([], self.index.recent_results(self.people[3]))
+
+    def test_eligibility_edit_reindexes(self):
+        self.poll.edit(self.people[0], people_eligible_to_vote=self.people[2:])
+
+        self.assertEqual([], self.index.awaiting_vote(self.people[1]))
+        self.assertEqual([self.poll], self.index.awaiting_vote(self.people[3]))
+
+    def test_eligibility_change_reindexes(self):
+        self.poll.update_eligibility(joined=[self.people[3]])
+        self.assertEqual([self.poll], self.index.awaiting_vote(self.people[3]))
+
+    def test_untrack_drops_everything(self):
+        self.poll.cast_vote(self.people[1], VoteChoice.AYE)
+        self.poll.cast_vote(self.people[2], VoteChoice.AYE)
+        keys = [self.index.view_key(person) for person in self.people[:3]]
+
+        self.index.untrack(self.poll.poll_id)
+
+        self.assertIsNone(self.index.get_poll(self.poll.poll_id))
+        for person, key in zip(self.people[:3], keys):
+            self.assertEqual([], self.index.recent_results(person))
+            self.assertNotEqual(key, self.index.view_key(person))
+        self.assertNotIn(self.index._on_event, self.poll.listeners)
+
+
+if __name__ == '__main__':
+    unittest.main()
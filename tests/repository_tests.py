@@ -0,0 +1,62 @@
+import unittest
+
+from datetime import datetime, timedelta
+
+from vote.enums import PollStatus, PollType, VoteChoice
+from vote.poll import Poll
+from vote.repository import PollRepository
+from vote.slackuser import SlackUser
+
+
+class PollRepositoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.people = [SlackUser(slack_id=f"DEADBEEF{i:02d}") for i in range(3)]
+        self.now = datetime(2024, 1, 1)
+        self.repository = PollRepository()
+
+        self.polls = []
+        for i in range(4):
+            poll = Poll(poll_type=PollType.COMMITTEE_APPROVAL if i % 2 else PollType.COMMITTEE_MOTION,
+                        created_by=self.people[i % 2],
+                        number_of_people_who_must_vote=1,
+                        people_who_can_vote=self.people,
+                        closes_at=self.now + timedelta(hours=i + 1),
+                        channel="C1" if i < 2 else "C2",
+                        )
+            self.repository.add(poll)
+            self.polls.append(poll)
+
+    def test_find_intersects_indexes(self):
+        self.assertEqual({self.polls[0], self.polls[1]}, set(self.repository.find(channel="C1")))
+        self.assertEqual([self.polls[2]], self.repository.find(channel="C2", created_by=self.people[0]))
+        self.assertEqual({self.polls[1], self.polls[3]}, set(self.repository.find(poll_type=PollType.COMMITTEE_APPROVAL)))
+        self.assertEqual([], self.repository.find(channel="C3", status=PollStatus.OPEN))
+        self.assertEqual(4, len(self.repository.find()))
+
+    def test_indexes_follow_votes_and_close(self):
+        # One approval is enough to pass.
+        self.polls[1].cast_vote(self.people[2], VoteChoice.AYE)
+        self.polls[2].close(self.people[0])
+
+        self.assertEqual([self.polls[1]], self.repository.find(status=PollStatus.PASSED))
+        self.assertEqual([self.polls[2]], self.repository.find(status=PollStatus.CLOSED_EARLY))
+        self.assertEqual({self.polls[0], self.polls[3]}, set(self.repository.find(status=PollStatus.OPEN)))
+
+    def test_closing_between(self):
+        self.polls[1].close(self.people[1])
+
+        soon = self.repository.closing_between(self.now, self.now + timedelta(hours=3, minutes=30))
+        self.assertEqual([self.polls[0], self.polls[2]], soon)
+
+    def test_indexes_follow_edits(self):
+        self.polls[3].edit(self.people[1], closes_at=self.now)
+        self.assertEqual([self.polls[3]], self.repository.closing_between(self.now, self.now + timedelta(minutes=1)))
+
+        self.polls[0].posted("C3", "1.0")
+        self.assertEqual([self.polls[0]], self.repository.find(channel="C3"))
+        self.assertEqual([self.polls[1]], self.repository.find(channel="C1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import threading
+import unittest
+
+from util.cache import PersistentCache
+from util.rosters import ChannelRosters
+
+
+class FakeDirectory:
+    """
+    Serves channel members and users from dicts, counting channel fetches.
+    """
+
+    def __init__(self, users, channels) -> None:
+        self.users = {u["id"]: u for u in users}
+        self.channels = channels
+        self.fetches = 0
+
+    def channel_members(self, channel):
+        self.fetches += 1
+        return list(self.channels[channel])
+
+    def get(self, user):
+        return self.users[user]
+
+    def get_many(self, users):
+        return [self.users[u] for u in users]
+
+    def update(self, user):
+        self.users[user["id"]] = user
+
+
+class ChannelRostersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        users = [{"id": f"U{i}"} for i in range(4)] + [{"id": "B0", "is_bot": True}]
+        self.directory = FakeDirectory(users, {"C1": ["U0", "U1", "B0"]})
+        self.rosters = ChannelRosters(self.directory)
+        self.changes = []
+        self.rosters.listeners.append(lambda channel, joined, left: self.changes.append((channel, joined, left)))
+
+    def hold_fetches(self) -> threading.Event:
+        """
+        Make channel fetches wait until the returned Event is set.
+        """
+        release = threading.Event()
+        channel_members = self.directory.channel_members
+
+        def held_channel_members(channel):
+            release.wait(5)
+            return channel_members(channel)
+
+        self.directory.channel_members = held_channel_members
+        return release
+
+    def test_events_update_roster_without_refetching(self):
+        self.assertEqual(["U0", "U1"], self.rosters.members("C1"))
+
+        self.rosters.handle_event({"type": "member_joined_channel", "channel": "C1", "user": "U2"})
+        self.rosters.handle_event({"type": "member_left_channel", "channel": "C1", "user": "U0"})
+
+        self.assertEqual(["U1", "U2"], self.rosters.members("C1"))
+        self.assertEqual(1, self.directory.fetches)
+        self.assertEqual([("C1", {"U2"}, set()), ("C1", set(), {"U0"})], self.changes)
+
+    def test_deactivated_user_drops_out(self):
+        self.rosters.members("C1")
+        self.rosters.handle_event({"type": "user_change", "user": {"id": "U1", "deleted": True}})
+
+        self.assertEqual(["U0"], self.rosters.members("C1"))
+        self.assertFalse(self.rosters.is_member("C1", "U1"))
+        self.assertEqual([("C1", set(), {"U1"})], self.changes)
+
+    def test_events_for_unfetched_channels_are_ignored(self):
+        self.rosters.handle_event({"type": "member_joined_channel", "channel": "C1", "user": "U2"})
+
+        self.assertIsNone(self.rosters.members_if_synced("C1"))
+        self.assertEqual([], self.changes)
+
+    def test_resync_reports_missed_changes(self):
+        self.rosters.resync_after = 0
+        self.rosters.members("C1")
+        self.directory.channels["C1"] = ["U1", "U3"]
+        release = self.hold_fetches()
+
+        # The roster as it was is served while it's resynced in the background.
+        self.assertEqual(["U0", "U1"], self.rosters.members("C1"))
+        release.set()
+        self.rosters.close()
+        self.assertEqual(["U1", "U3"], self.rosters.members_if_synced("C1"))
+        self.assertEqual([("C1", {"U3"}, {"U0"})], self.changes)
+
+    def test_restart_reads_the_cache(self):
+        cache = PersistentCache(":memory:")
+        self.addCleanup(cache.close)
+        rosters = ChannelRosters(self.directory, cache=cache)
+        rosters.members("C1")
+        rosters.handle_event({"type": "member_joined_channel", "channel": "C1", "user": "U2"})
+
+        rosters = ChannelRosters(self.directory, cache=cache)
+        self.assertEqual(["U0", "U1", "U2"], rosters.members("C1"))
+        self.assertEqual(1, self.directory.fetches)
+
+        # A cached roster is only as fresh as its last full fetch.
+        rosters = ChannelRosters(self.directory, resync_after=0, cache=cache)
+        release = self.hold_fetches()
+        self.assertEqual(["U0", "U1", "U2"], rosters.members("C1"))
+        release.set()
+        rosters.close()
+        self.assertEqual(2, self.directory.fetches)
+
+    def test_one_fetch_at_a_time_without_the_lock(self):
+        fetching, release = threading.Event(), threading.Event()
+        channel_members = self.directory.channel_members
+
+        def slow_channel_members(channel):
+            fetching.set()
+            release.wait(5)
+            return channel_members(channel)
+
+        self.directory.channel_members = slow_channel_members
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.rosters.members("C1"))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+
+        # Events are still handled while the roster's being fetched.
+        self.assertTrue(fetching.wait(5))
+        self.rosters.handle_event({"type": "user_change", "user": {"id": "U3", "deleted": True}})
+        self.assertIsNone(self.rosters.members_if_synced("C1"))
+
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual([["U0", "U1"]] * 4, results)
+        self.assertEqual(1, self.directory.fetches)
+
+
+if __name__ == '__main__':
+    unittest.main()
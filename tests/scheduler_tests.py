@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+
+from datetime import datetime, timedelta
+
+from vote.enums import VoteChoice, PollStatus, PollType, EventType
+from vote.poll import Poll
+from vote.scheduler import Scheduler
+from vote.slackuser import SlackUser
+
+T0 = datetime(2024, 1, 1)
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.people = [SlackUser(slack_id=f"DEADBEEF{i:02d}") for i in range(3)]
+        self.polls = dict()
+        self.fired = []
+
+    def make_poll(self, closes_in: int, remind_in=None) -> Poll:
+        poll = Poll(poll_type=PollType.COMMITTEE_APPROVAL,
+                    created_by=self.people[0],
+                    number_of_people_who_must_vote=3,
+                    people_who_can_vote=self.people,
+                    closes_at=T0 + timedelta(hours=closes_in),
+                    reminder_at=None if remind_in is None else T0 + timedelta(hours=remind_in),
+                    )
+        self.polls[poll.poll_id] = poll
+        return poll
+
+    def make_scheduler(self, state_path=None) -> Scheduler:
+        return Scheduler(get_poll=self.polls.get, on_fired=lambda poll, events: self.fired.append((poll, events)),
+                         state_path=state_path)
+
+    def test_only_due_polls_are_woken(self):
+        scheduler = self.make_scheduler()
+        soon = self.make_poll(closes_in=1)
+        later = self.make_poll(closes_in=5)
+        for poll in (soon, later):
+            scheduler.schedule(poll)
+
+        self.assertEqual(1, scheduler.run_due(now=T0 + timedelta(hours=2)))
+        self.assertEqual([(soon, soon.events[-1:])], self.fired)
+        self.assertIs(PollStatus.LAPSED, soon.status)
+        self.assertIs(PollStatus.OPEN, later.status)
+        self.assertEqual(3600.0, scheduler.stats["last_lag_seconds"])
+        self.assertEqual(T0 + timedelta(hours=5), scheduler.next_due())
+
+    def test_reminder_then_close(self):
+        scheduler = self.make_scheduler()
+        poll = self.make_poll(closes_in=4, remind_in=2)
+        poll.cast_vote(self.people[1], VoteChoice.AYE)
+        scheduler.schedule(poll)
+
+        scheduler.run_due(now=T0 + timedelta(hours=2))
+        self.assertEqual([(poll, poll.events[-1:])], self.fired)
+        self.assertIs(EventType.SENT_REMINDER_TO_VOTE, poll.events[-1].event_type)
+        self.assertEqual(["DEADBEEF00", "DEADBEEF02"], poll.events[-1].data["to"])
+        self.assertEqual(1, scheduler.pending())
+
+        scheduler.run_due(now=T0 + timedelta(hours=4))
+        self.assertIs(PollStatus.LAPSED, poll.status)
+        self.assertEqual(0, scheduler.pending())
+
+    def test_timers_survive_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = os.path.join(tmp, "timers.json")
+            poll = self.make_poll(closes_in=1)
+            scheduler = self.make_scheduler(state_path)
+            scheduler.schedule(poll)
+            scheduler.save()
+
+            scheduler = self.make_scheduler(state_path)
+            scheduler.load()
+            self.assertEqual(1, scheduler.run_due(now=T0 + timedelta(hours=1)))
+            self.assertIs(PollStatus.LAPSED, poll.status)
+
+    def test_nothing_fired_if_cron_does_nothing(self):
+        scheduler = self.make_scheduler()
+        poll = self.make_poll(closes_in=4, remind_in=2)
+        scheduler.schedule(poll)
+        poll.close(self.people[0])
+
+        scheduler.run_due(now=T0 + timedelta(hours=2))
+        self.assertEqual([], self.fired)
+
+    def test_polls_override_saved_timers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = os.path.join(tmp, "timers.json")
+            poll = self.make_poll(closes_in=4, remind_in=2)
+            scheduler = self.make_scheduler(state_path)
+            scheduler.schedule(poll)
+            scheduler.save()
+
+            # E.g. the reminder was sent, but the bot stopped before the timers were saved again.
+            poll.reminder_at = None
+            scheduler = self.make_scheduler(state_path)
+            scheduler.load()
+            scheduler.schedule(poll)
+            self.assertEqual(1, scheduler.pending())
+            self.assertEqual(T0 + timedelta(hours=4), scheduler.next_due())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,248 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from datetime import datetime, timedelta
+
+from vote.archive import PollArchive
+from vote.enums import VoteChoice, PollStatus, PollType
+from vote.poll import Poll
+from vote.slackuser import SlackUser
+from vote.store import PollStore
+
+
+def make_poll(n_voters: int = 3) -> Poll:
+    people = [SlackUser(slack_id=f"DEADBEEF{i:02d}") for i in range(n_voters)]
+    # An approval which needs more approvers than there are voters, so it stays open however people vote.
+    return Poll(poll_type=PollType.COMMITTEE_APPROVAL,
+                created_by=people[0],
+                public_text="public",
+                private_text="private",
+                number_of_people_who_must_vote=n_voters + 1,
+                people_who_can_vote=people,
+                people_who_must_vote=people[:1],
+                )
+
+
+class PollStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_round_trip_after_restart(self):
+        store = PollStore(self.tmp.name, snapshot_every=4, sync_every=2)
+        poll = make_poll()
+        store.save(poll)
+
+        for i in range(10):
+            poll.cast_vote(poll.people_eligible_to_vote[i % 3], [VoteChoice.AYE, VoteChoice.NAY][i % 2])
+            store.save(poll)
+        poll.edit(poll.created_by, public_text="edited")
+        store.save(poll)
+        store.close()
+
+        loaded = PollStore(self.tmp.name).load(poll.poll_id, history=True)
+
+        self.assertEqual(poll.to_json_dict(), loaded.to_json_dict())
+        self.assertEqual("edited", loaded.public_text)
+
+    def test_snapshots_hold_state_not_history(self):
+        store = PollStore(self.tmp.name, snapshot_every=4)
+        poll = make_poll()
+        store.save(poll)
+        for _ in range(9):
+            poll.cast_vote(poll.created_by, VoteChoice.ABSTAIN)
+            store.save(poll)
+        store.flush()
+
+        names = sorted(os.listdir(os.path.join(self.tmp.name, poll.poll_id)))
+        self.assertEqual(["segment-0000000000.log", "segment-0000000004.log", "segment-0000000008.log",
+                          "snapshot-0000000008.bin"], names)
+
+        # Loading replays only the events since the snapshot...
+        loaded = PollStore(self.tmp.name).load(poll.poll_id)
+        self.assertEqual(8, loaded.events_base)
+        self.assertEqual(poll.events[8:], loaded.events)
+        self.assertEqual(poll.revision, loaded.revision)
+        self.assertEqual(poll.votes, loaded.votes)
+
+        # ... unless the whole history is asked for.
+        loaded = PollStore(self.tmp.name).load(poll.poll_id, history=True)
+        self.assertEqual(poll.to_json_dict(), loaded.to_json_dict())
+
+    def test_truncated_tail_is_ignored(self):
+        store = PollStore(self.tmp.name, sync_every=1)
+        poll = make_poll()
+        store.save(poll)
+        poll.cast_vote(poll.created_by, VoteChoice.AYE)
+        store.save(poll)
+
+        with open(os.path.join(self.tmp.name, poll.poll_id, "segment-0000000000.log"), "a") as f:
+            f.write('{"person": "DEAD')
+
+        store = PollStore(self.tmp.name, sync_every=1)
+        loaded = store.load(poll.poll_id)
+        self.assertEqual({poll.created_by: VoteChoice.AYE}, loaded.votes)
+        self.assertIs(PollStatus.OPEN, loaded.status)
+
+        # Appending after the torn record must still produce a readable segment.
+        loaded.cast_vote(poll.created_by, VoteChoice.NAY)
+        store.save(loaded)
+        self.assertEqual(VoteChoice.NAY, PollStore(self.tmp.name).load(poll.poll_id).votes[poll.created_by])
+
+    def test_lost_newline_is_restored_before_appending(self):
+        store = PollStore(self.tmp.name, sync_every=1)
+        poll = make_poll()
+        store.save(poll)
+        poll.cast_vote(poll.created_by, VoteChoice.AYE)
+        store.save(poll)
+
+        segment = os.path.join(self.tmp.name, poll.poll_id, "segment-0000000000.log")
+        with open(segment, "rb+") as f:
+            f.truncate(os.path.getsize(segment) - 1)
+
+        store = PollStore(self.tmp.name, sync_every=1)
+        loaded = store.load(poll.poll_id)
+        loaded.cast_vote(poll.created_by, VoteChoice.NAY)
+        store.save(loaded)
+
+        loaded = PollStore(self.tmp.name).load(poll.poll_id)
+        self.assertEqual(2, len(loaded.events))
+        self.assertEqual(VoteChoice.NAY, loaded.votes[poll.created_by])
+
+    def test_resume_appending_after_restart(self):
+        poll = make_poll()
+        store = PollStore(self.tmp.name)
+        store.save(poll)
+        poll.cast_vote(poll.created_by, VoteChoice.AYE)
+        store.save(poll)
+        store.close()
+
+        store = PollStore(self.tmp.name)
+        poll.cast_vote(poll.created_by, VoteChoice.NAY)
+        store.save(poll)
+        store.close()
+
+        loaded = PollStore(self.tmp.name).load(poll.poll_id)
+        self.assertEqual(2, len(loaded.events))
+        self.assertEqual(VoteChoice.NAY, loaded.votes[poll.created_by])
+
+    def test_buffered_events_flushed_on_time(self):
+        store = PollStore(self.tmp.name, sync_interval=0.1)
+        stop = threading.Event()
+        flusher = threading.Thread(target=store.flush_forever, args=(stop,))
+        flusher.start()
+        self.addCleanup(flusher.join)
+        self.addCleanup(stop.set)
+
+        poll = make_poll()
+        store.save(poll)
+        poll.cast_vote(poll.created_by, VoteChoice.AYE)
+        store.save(poll)
+        self.assertEqual(0, len(PollStore(self.tmp.name).load(poll.poll_id).votes))
+
+        time.sleep(0.5)
+        self.assertEqual({poll.created_by: VoteChoice.AYE}, PollStore(self.tmp.name).load(poll.poll_id).votes)
+
+    def test_parallel_load_matches_sequential(self):
+        store = PollStore(self.tmp.name, snapshot_every=4)
+        for n in range(20):
+            poll = make_poll()
+            store.save(poll)
+            for _ in range(n):
+                poll.cast_vote(poll.created_by, VoteChoice.AYE)
+                store.save(poll)
+        store.close()
+
+        sequential = [p.to_json_dict() for p in PollStore(self.tmp.name).load_all()]
+        parallel = [p.to_json_dict() for p in PollStore(self.tmp.name).load_all(workers=4)]
+        self.assertEqual(20, len(parallel))
+        self.assertEqual(sequential, parallel)
+
+    def test_slow_sync_does_not_hold_up_other_polls(self):
+        store = PollStore(self.tmp.name)
+        fsync = os.fsync
+        syncing = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow_fsync(fd):
+            if threading.current_thread().name == "slow":
+                syncing.set()
+                release.wait()
+            fsync(fd)
+
+        with mock.patch("vote.store.os.fsync", slow_fsync):
+            poll = make_poll()
+            slow = threading.Thread(target=store.save, args=(poll,), name="slow")
+            slow.start()
+            self.assertTrue(syncing.wait(timeout=5))
+
+            # The first poll's snapshot is still being synced, which mustn't stop this one being saved.
+            other = make_poll()
+            while store._io_lock(other.poll_id) is store._io_lock(poll.poll_id):
+                other = make_poll()
+            saved = threading.Thread(target=store.save, args=(other,))
+            saved.start()
+            saved.join(timeout=5)
+            self.assertFalse(saved.is_alive())
+
+            release.set()
+            slow.join()
+        store.close()
+
+        self.assertEqual(2, len(list(PollStore(self.tmp.name).load_all())))
+
+
+class PollArchiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_lookup_through_sparse_index(self):
+        archive = PollArchive(self.tmp.name, index_every=4)
+        self.addCleanup(archive.close)
+        polls = [make_poll() for _ in range(50)]
+        for poll in polls[::3]:
+            poll.cast_vote(poll.created_by, VoteChoice.NAY)
+        archive.write_segment(polls[:30])
+        archive.write_segment(polls[30:])
+
+        for poll in polls:
+            self.assertEqual(poll.to_json_dict(), archive.get(poll.poll_id).to_json_dict())
+        self.assertIsNone(archive.get("0" * 32))
+        self.assertIsNone(archive.get("f" * 32))
+        self.assertEqual({p.poll_id for p in polls}, {p.poll_id for p in archive})
+
+        reopened = PollArchive(self.tmp.name)
+        self.addCleanup(reopened.close)
+        self.assertEqual(50, len(reopened))
+        self.assertIn(polls[17].poll_id, reopened)
+
+    def test_store_archives_long_closed_polls(self):
+        store = PollStore(self.tmp.name, archive_after=timedelta(days=1))
+        self.addCleanup(store.close)
+        open_poll, closed_poll = make_poll(), make_poll()
+        closed_poll.close(closed_poll.created_by)
+        store.save(open_poll)
+        store.save(closed_poll)
+
+        self.assertEqual([], store.archive_closed())
+        self.assertEqual([closed_poll.poll_id], store.archive_closed(now=datetime.utcnow() + timedelta(days=2)))
+
+        self.assertEqual([open_poll.poll_id], store.poll_ids())
+        self.assertEqual(closed_poll.to_json_dict(), store.load(closed_poll.poll_id).to_json_dict())
+
+        # Still found after a restart.
+        store = PollStore(self.tmp.name)
+        self.addCleanup(store.close)
+        self.assertIs(PollStatus.CLOSED_EARLY, store.load(closed_poll.poll_id).status)
+
+
+if __name__ == '__main__':
+    unittest.main()
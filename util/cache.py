@@ -0,0 +1,244 @@
+import json
+import logging as log
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+
+class PersistentCache:
+    """
+    A size-bounded cache kept in an SQLite file, so that it survives restarts.
+
+    Entries younger than ttl seconds are served as-is.
+    Entries older than that, but younger than max_stale, are still served immediately,
+    while a fresh value is loaded in the background (stale-while-revalidate).
+    Only entries older than max_stale, or missing entirely, make the caller wait for the loader.
+
+    Values must be JSON serialisable.
+    """
+
+    def __init__(self,
+                 path: str,
+                 maxsize: int = 10000,
+                 ttl: float = 600,
+                 max_stale: float = 7 * 24 * 3600,
+                 refresh_workers: int = 2,
+                 ) -> None:
+        """
+        :param path: SQLite database file, or ":memory:".
+        :param maxsize: Maximum number of entries. The least recently used are evicted beyond this.
+        :param ttl: Seconds for which an entry is fresh.
+        :param max_stale: Seconds after which a stale entry is no longer served.
+        :param refresh_workers: Threads used for background refreshes.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_stale = max_stale
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache ("
+                         " key TEXT PRIMARY KEY,"
+                         " value TEXT NOT NULL,"
+                         " fetched_at REAL NOT NULL,"
+                         " used_at REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_used_at ON cache (used_at)")
+        self._size = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self._lock = threading.Lock()
+
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="cache-refresh")
+        self._refreshing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()  # Background asyncio refreshes, referenced so they aren't collected.
+
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "evictions": 0,
+        }
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        :param key:
+        :param loader: Called with no arguments to load the value, when it's missing or stale.
+        :return: The cached value, possibly stale.
+        """
+        found, value = self._lookup(key)
+        if found == "stale":
+            self._refresh_in_background(key, loader)
+
+        if found is None:
+            self.stats["misses"] += 1
+            value = loader()
+            self.put(key, value)
+
+        return value
+
+    async def aget(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        As get(), for use from asyncio code.
+        :param key:
+        :param loader: Coroutine function, called with no arguments to load the value.
+        :return: The cached value, possibly stale.
+        """
+        found, value = self._lookup(key)
+        if found == "stale":
+            self._arefresh_in_background(key, loader)
+
+        if found is None:
+            self.stats["misses"] += 1
+            value = await loader()
+            self.put(key, value)
+
+        return value
+
+    def _lookup(self, key: str) -> Tuple[Optional[str], Any]:
+        """
+        :return: ("fresh" or "stale", value) if the key can be served from the cache, otherwise (None, None).
+        """
+        now = time.time()
+
+        with self._lock:
+            row = self._db.execute("SELECT value, fetched_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE cache SET used_at = ? WHERE key = ?", (now, key))
+
+        if row is None:
+            return None, None
+
+        value, fetched_at = row
+        age = now - fetched_at
+
+        if age <= self.ttl:
+            self.stats["hits"] += 1
+            return "fresh", json.loads(value)
+
+        if age <= self.max_stale:
+            self.stats["stale_hits"] += 1
+            return "stale", json.loads(value)
+
+        return None, None
+
+    def peek(self, key: str) -> Optional[Tuple[Any, float]]:
+        """
+        Read an entry without loading or refreshing it, for callers which decide for themselves when to refetch.
+        :return: (value, seconds since it was fetched), or None if it's missing or older than max_stale.
+        """
+        entry = self.scan(key, prefix=False).get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+        return entry
+
+    def scan(self, key: str, prefix: bool = True) -> Dict[str, Tuple[Any, float]]:
+        """
+        As peek(), for every entry whose key starts with key, e.g. to load a whole group of entries at startup.
+        Both count towards stats, as get() does, but it's up to the caller to refetch stale entries.
+        :return: key -> (value, seconds since it was fetched)
+        """
+        now = time.time()
+        where, args = ("substr(key, 1, ?) = ?", (len(key), key)) if prefix else ("key = ?", (key,))
+
+        with self._lock:
+            rows = self._db.execute(f"SELECT key, value, fetched_at FROM cache WHERE {where} AND fetched_at >= ?",
+                                    args + (now - self.max_stale,)).fetchall()
+            self._db.execute(f"UPDATE cache SET used_at = ? WHERE {where}", (now,) + args)
+
+        entries = {k: (json.loads(value), now - fetched_at) for k, value, fetched_at in rows}
+        stale = sum(1 for _, age in entries.values() if age > self.ttl)
+        self.stats["hits"] += len(entries) - stale
+        self.stats["stale_hits"] += stale
+        return entries
+
+    def put(self, key: str, value: Any) -> None:
+        self.put_many({key: value})
+
+    def put_many(self, items: Dict[str, Any]) -> None:
+        """
+        As put(), for many entries, in one transaction.
+        """
+        now = time.time()
+        with self._lock:
+            added = 0
+            self._db.execute("BEGIN")
+            try:
+                for key, value in items.items():
+                    if self._db.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone() is None:
+                        added += 1
+                    self._db.execute("INSERT OR REPLACE INTO cache (key, value, fetched_at, used_at) "
+                                     "VALUES (?, ?, ?, ?)", (key, json.dumps(value), now, now))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+            self._size += added
+            self._evict()
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._size -= self._db.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount
+
+    def __len__(self) -> int:
+        return self._size
+
+    def close(self) -> None:
+        self._refresher.shutdown(wait=True)
+        with self._lock:
+            self._db.close()
+
+    def _refresh_in_background(self, key: str, loader: Callable[[], Any]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.put(key, loader())
+                self.stats["refreshes"] += 1
+            except Exception as e:
+                self.stats["refresh_errors"] += 1
+                log.warning(f"PersistentCache: refreshing {key} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresher.submit(refresh)
+
+    def _arefresh_in_background(self, key: str, loader: Callable[[], Awaitable[Any]]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                self.put(key, await loader())
+                self.stats["refreshes"] += 1
+            except Exception as e:
+                self.stats["refresh_errors"] += 1
+                log.warning(f"PersistentCache: refreshing {key} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        # Imported here rather than at the top, so that importing main.py doesn't load asyncio.
+        import asyncio
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _evict(self) -> None:
+        # Called with self._lock held.
+        excess = self._size - self.maxsize
+        if excess > 0:
+            self._db.execute("DELETE FROM cache WHERE key IN "
+                             "(SELECT key FROM cache ORDER BY used_at LIMIT ?)", (excess,))
+            self._size -= excess
+            self.stats["evictions"] += excess
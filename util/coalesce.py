@@ -0,0 +1,140 @@
+import heapq
+import logging as log
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Tuple
+
+
+class UpdateCoalescer:
+    """
+    Merges bursts of "this needs updating" into at most one update per key per interval.
+
+    update(key) is called on a background thread, and must render the key's latest state when it's called
+    (e.g. re-read the Poll), rather than state captured when it was marked.
+    Because of that, changes marked while an update is pending or running are never lost:
+    the pending update will include them, or another update is scheduled after the running one.
+
+    A key whose update fails is retried, backing off exponentially from retry_after seconds,
+    until it's failed max_retries times in a row.
+    """
+
+    def __init__(self,
+                 update: Callable[[Hashable], None],
+                 interval: float = 2.0,
+                 retry_after: float = 5.0,
+                 max_retries: int = 5,
+                 ) -> None:
+        """
+        :param update: Called with a key to bring it up to date, e.g. to chat.update a poll message.
+        :param interval: Minimum seconds between updates of the same key.
+        :param retry_after: Seconds before the first retry of a failed update. Doubles with each further failure.
+        :param max_retries: How many failures in a row to retry a key's update after, before giving up on it.
+        """
+        self.update = update
+        self.interval = interval
+        self.retry_after = retry_after
+        self.max_retries = max_retries
+
+        self._due: Dict[Hashable, float] = dict()
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._last_run: Dict[Hashable, float] = dict()
+        # key -> how many times in a row its update has failed.
+        self._failures: Dict[Hashable, int] = dict()
+        self._seq = 0
+        self._running = False
+        self._cond = threading.Condition()
+
+        self.stats = {
+            "marked": 0,
+            "updates": 0,
+            "errors": 0,
+            "retries": 0,
+            "dropped": 0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="coalescer", daemon=True)
+        self._thread.start()
+
+    def mark(self, key: Hashable) -> None:
+        """
+        Note that key has changed and needs updating.
+        :param key:
+        :return:
+        """
+        with self._cond:
+            self.stats["marked"] += 1
+            if key in self._due:
+                # Already pending; that update will pick up this change too.
+                return
+
+            self._schedule(key, max(time.monotonic(), self._last_run.get(key, float("-inf")) + self.interval))
+
+    def _schedule(self, key: Hashable, due: float) -> None:
+        # Called with self._cond held.
+        self._due[key] = due
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, key))
+        self._cond.notify()
+
+    def pending(self) -> int:
+        return len(self._due)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Wait until nothing is pending, e.g. before shutting down or in tests.
+        :return: False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._due or self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(timeout=None if not self._heap else self._heap[0][0] - time.monotonic())
+
+                _, _, key = heapq.heappop(self._heap)
+                del self._due[key]
+                now = time.monotonic()
+                self._last_run[key] = now
+                self._running = True
+
+                if len(self._last_run) > 1000:
+                    # Forget keys which are past their interval, so _last_run doesn't grow forever.
+                    self._last_run = {k: t for k, t in self._last_run.items() if now - t < self.interval}
+
+            try:
+                self.update(key)
+                self.stats["updates"] += 1
+                failed = False
+            except Exception as e:
+                self.stats["errors"] += 1
+                log.error(f"UpdateCoalescer: updating {key} failed: {e}")
+                failed = True
+
+            with self._cond:
+                self._running = False
+                if not failed:
+                    self._failures.pop(key, None)
+                elif key not in self._due:
+                    self._retry(key)
+                self._cond.notify_all()
+
+    def _retry(self, key: Hashable) -> None:
+        # Called with self._cond held.
+        failures = self._failures.get(key, 0) + 1
+        if failures > self.max_retries:
+            self._failures.pop(key, None)
+            self.stats["dropped"] += 1
+            log.error(f"UpdateCoalescer: giving up on {key} after {self.max_retries} retries")
+            return
+
+        self._failures[key] = failures
+        self.stats["retries"] += 1
+        self._schedule(key, time.monotonic() + self.retry_after * 2 ** (failures - 1))
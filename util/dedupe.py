@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Tuple
+
+
+class RecentKeys:
+    """
+    Remembers keys, and optionally a value for each, for ttl seconds, up to maxsize of them, to spot repeats.
+    Every key lives for ttl after it was last recorded, so keeping keys in recording order keeps them in expiry order,
+    and expired keys are dropped from the front.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 10000) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Hashable, Tuple[float, Hashable]] = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+    def check(self, key: Hashable, value: Hashable = None) -> bool:
+        """
+        Record key with value, unless it was recorded with the same value in the last ttl seconds.
+        :return: Whether this repeats what was last recorded for key, i.e. is a duplicate.
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._entries:
+                oldest, (expires, _) = next(iter(self._entries.items()))
+                if expires > now and len(self._entries) < self.maxsize:
+                    break
+                del self._entries[oldest]
+
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == value:
+                return True
+
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            return False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class Deduplicator:
+    """
+    Spots requests which have already been handled, so they can be dropped before any expensive work:
+
+    * Redeliveries, e.g. Slack resending an event or interaction when the ack was slow.
+      These repeat the event_id or trigger_id, and are remembered for delivery_ttl seconds.
+
+    * Double clicks: the same person making the same choice again in the same block of the same message or view,
+      within click_ttl seconds. Each click has its own trigger_id, so these are keyed on user, container and block,
+      and only count as duplicates if the choice is the same as the last one accepted for that block.
+      Changing your mind and back (e.g. Aye, Nay, Aye) is never dropped.
+    """
+
+    def __init__(self, delivery_ttl: float = 10 * 60, click_ttl: float = 2.0, maxsize: int = 10000) -> None:
+        self._deliveries = RecentKeys(delivery_ttl, maxsize)
+        self._clicks = RecentKeys(click_ttl, maxsize)
+
+        self.stats = {
+            "requests": 0,
+            "duplicate_deliveries": 0,
+            "duplicate_clicks": 0,
+        }
+
+    def is_duplicate(self, body: dict) -> bool:
+        """
+        :param body: A Bolt request body.
+        :return: Whether the request repeats one seen recently. Records it if not.
+        """
+        self.stats["requests"] += 1
+
+        delivery = self.delivery_key(body)
+        if delivery is not None and self._deliveries.check(delivery):
+            self.stats["duplicate_deliveries"] += 1
+            return True
+
+        clicks = self.clicks(body)
+        # A request is a double click only if all its actions are; check them all, so every one is recorded.
+        if clicks and all([self._clicks.check(key, choice) for key, choice in clicks]):
+            self.stats["duplicate_clicks"] += 1
+            return True
+
+        return False
+
+    @staticmethod
+    def delivery_key(body: dict) -> Hashable | None:
+        """
+        :return: What identifies this delivery of the request, which a redelivery repeats.
+        """
+        if "event_id" in body:
+            return "event", body["event_id"]
+        if "trigger_id" in body:
+            return "trigger", body["trigger_id"]
+        return None
+
+    @staticmethod
+    def clicks(body: dict) -> List[Tuple[Hashable, str]]:
+        """
+        :return: (key, choice) for each action of a block_actions request.
+            The key identifies where the person clicked, e.g. a poll message's vote buttons, which share a block,
+            and the choice what they picked, e.g. which button, or which option of a select.
+        """
+        if body.get("type") != "block_actions":
+            return []
+
+        user = body.get("user", {}).get("id")
+        container = body.get("container", {})
+        container_id = container.get("view_id") or container.get("message_ts")
+        out = []
+        for action in body.get("actions", []):
+            # Everything about the action except when it happened, e.g. its action ID and value or selected option.
+            choice = json.dumps({k: v for k, v in action.items() if k != "action_ts"}, sort_keys=True)
+            out.append(((user, container_id, action.get("block_id")), choice))
+
+        return out
+
+
+def dedupe_bolt(app, deduplicator: Deduplicator) -> None:
+    """
+    Drop duplicate requests to a slack_bolt App before any listener sees them.
+    Duplicates are acknowledged with an empty response, as the original delivery's listener has already responded.
+    """
+    from slack_bolt import BoltResponse
+
+    @app.middleware
+    def drop_duplicates(body, next):
+        if deduplicator.is_duplicate(body):
+            return BoltResponse(status=200, body="")
+        return next()
+
+
+def dedupe_async_bolt(app, deduplicator: Deduplicator) -> None:
+    """
+    As dedupe_bolt(), for a slack_bolt AsyncApp.
+    """
+    from slack_bolt import BoltResponse
+
+    @app.middleware
+    async def drop_duplicates(body, next):
+        if deduplicator.is_duplicate(body):
+            return BoltResponse(status=200, body="")
+        return await next()
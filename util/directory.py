@@ -0,0 +1,299 @@
+import logging as log
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterator, List
+
+# PersistentCache keys: one entry per user, and one recording when the whole directory was last fetched.
+USER_KEY = "user:"
+DIRECTORY_KEY = "directory:fetched"
+
+
+class UserDirectory:
+    """
+    A local copy of the workspace's user list.
+
+    The whole directory is fetched in bulk with users.list, a page of up to page_size users per request,
+    rather than one users.info request per user. It's refetched once it's older than ttl seconds.
+    Users not in the directory (e.g. someone who joined since it was fetched) are looked up individually.
+
+    Once there's a directory to serve, refetching it never holds up a lookup: the old copy is served while it's
+    refetched in the background, and only one refetch runs at a time. Only the very first fetch is waited for.
+
+    With a cache, every change is written through to it, and the directory is first read from it,
+    so a restart doesn't refetch the directory until it's older than ttl.
+    """
+
+    def __init__(self, client, ttl: float = 600, page_size: int = 200, dispatcher=None, cache=None) -> None:
+        """
+        :param client: A slack_sdk WebClient, e.g. app.client.
+        :param ttl: Seconds before the directory is refetched.
+        :param page_size: Users per users.list request. Slack allows up to 1000, but recommends no more than 200.
+        :param dispatcher: Optional util.dispatch.SlackDispatcher. If given, every API call goes through it,
+            so it's kept within rate limits and retried when rate limited, and unknown users are looked up concurrently.
+        :param cache: Optional util.cache.PersistentCache to keep the directory in across restarts.
+        """
+        self.client = client
+        self.dispatcher = dispatcher
+        self.cache = cache
+        self.ttl = ttl
+        self.page_size = page_size
+
+        self._users: Dict[str, dict] = dict()
+        self._loaded_at: float | None = None
+        self._lock = threading.Lock()
+
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="directory-refresh")
+        self._refreshing: Future | None = None
+
+    def refresh(self) -> None:
+        """
+        Refetch the whole directory.
+        See https://api.slack.com/methods/users.list
+        :return:
+        """
+        users = dict()
+        for page in paginate(self._api("users.list"), limit=self.page_size):
+            for u in page["members"]:
+                users[u["id"]] = u
+
+        with self._lock:
+            self._users = users
+            self._loaded_at = time.monotonic()
+
+        if self.cache is not None:
+            self.cache.put_many({USER_KEY + user_id: u for user_id, u in users.items()})
+            self.cache.put(DIRECTORY_KEY, len(users))
+
+        log.debug(f"UserDirectory: loaded {len(users)} users")
+
+    def get(self, user: str) -> dict:
+        """
+        :param user: User ID
+        :return: The user object, as returned by users.info or users.list.
+        """
+        self._ensure_fresh()
+
+        u = self._users.get(user)
+        if u is None:
+            log.debug(f"UserDirectory: {user} not in directory, looking up")
+            r = self._api("users.info")(user=user)
+            u = r.data["user"]
+            self.update(u)
+
+        return u
+
+    def get_many(self, users: List[str]) -> List[dict]:
+        """
+        As get(), for many users. Users not in the directory are looked up concurrently, if there's a dispatcher.
+        :param users: User IDs
+        :return: User objects, in the same order.
+        """
+        self._ensure_fresh()
+
+        missing = [u for u in users if u not in self._users]
+        if missing and self.dispatcher is not None:
+            log.debug(f"UserDirectory: looking up {len(missing)} users not in directory")
+            responses = self.dispatcher.map("users.info", [{"user": u} for u in missing])
+            self._update_many([r.data["user"] for r in responses])
+
+        return [self.get(u) for u in users]
+
+    def update(self, user: dict) -> None:
+        """
+        Replace a user's entry, e.g. from a user_change event.
+        :param user: The user object.
+        :return:
+        """
+        self._update_many([user])
+
+    def _update_many(self, users: List[dict]) -> None:
+        with self._lock:
+            for u in users:
+                self._users[u["id"]] = u
+
+        if self.cache is not None:
+            self.cache.put_many({USER_KEY + u["id"]: u for u in users})
+
+    def channel_members(self, channel: str) -> List[str]:
+        """
+        All members of a channel, following conversations.members pagination.
+        See https://api.slack.com/methods/conversations.members
+        :param channel: Channel ID
+        :return: User IDs
+        """
+        members = []
+        for page in paginate(self._api("conversations.members"), channel=channel, limit=self.page_size):
+            members.extend(page["members"])
+
+        return members
+
+    def _api(self, method: str) -> Callable:
+        """
+        :param method: API method name, e.g. "users.list".
+        :return: A function which calls it, through the dispatcher if there is one.
+        """
+        if self.dispatcher is None:
+            return getattr(self.client, method.replace(".", "_"))
+
+        def call(**kwargs):
+            return self.dispatcher.call(method, **kwargs)
+
+        call.__name__ = method
+        return call
+
+    def close(self) -> None:
+        """
+        Wait for any background refresh to finish.
+        """
+        self._refresher.shutdown(wait=True)
+
+    def _ensure_fresh(self) -> None:
+        if self._loaded_at is None and self.cache is not None:
+            self._load_cached()
+
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at <= self.ttl:
+            return
+
+        refreshing = self._refresh_in_background()
+        if loaded_at is None:
+            # Nothing to serve until the first fetch is done.
+            refreshing.result()
+
+    def _refresh_in_background(self) -> Future:
+        """
+        Start refetching the directory, unless it's already being refetched.
+        :return: The refetch in progress.
+        """
+        with self._lock:
+            if self._refreshing is None:
+                self._refreshing = self._refresher.submit(self._refresh_once)
+            return self._refreshing
+
+    def _refresh_once(self) -> None:
+        try:
+            # Another process sharing the cache, e.g. another cluster worker, may have refetched it since it was read.
+            if self.cache is not None and self._loaded_at is not None:
+                self._load_cached()
+                if self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.ttl:
+                    return
+            self.refresh()
+        except Exception as e:
+            log.warning(f"UserDirectory: refreshing failed: {e}")
+            raise
+        finally:
+            # Only runs once _refresh_in_background() has recorded this refresh, as that holds the lock.
+            with self._lock:
+                self._refreshing = None
+
+    def _load_cached(self) -> None:
+        """
+        Start from the copy of the directory in the cache, if there is one, as old as it was when it was cached.
+        """
+        fetched = self.cache.peek(DIRECTORY_KEY)
+        if fetched is None:
+            return
+
+        users = {key[len(USER_KEY):]: u for key, (u, _) in self.cache.scan(USER_KEY).items()}
+        with self._lock:
+            self._users = users
+            self._loaded_at = time.monotonic() - fetched[1]
+
+        log.debug(f"UserDirectory: loaded {len(users)} users from the cache")
+
+
+class AsyncUserDirectory(UserDirectory):
+    """
+    As UserDirectory, for use with a slack_sdk AsyncWebClient, e.g. AsyncApp.client.
+    Unknown users are looked up concurrently with asyncio rather than with a dispatcher.
+    """
+
+    def __init__(self, client, ttl: float = 600, page_size: int = 200) -> None:
+        # Imported here rather than at the top, so that importing main.py doesn't load asyncio.
+        import asyncio
+
+        super().__init__(client, ttl=ttl, page_size=page_size)
+        self._refreshing = asyncio.Lock()
+        self._lookups = asyncio.Semaphore(8)  # Limits concurrent users.info requests.
+
+    async def refresh(self) -> None:
+        users = dict()
+        async for page in apaginate(self.client.users_list, limit=self.page_size):
+            for u in page["members"]:
+                users[u["id"]] = u
+
+        self._users = users
+        self._loaded_at = time.monotonic()
+
+        log.debug(f"AsyncUserDirectory: loaded {len(users)} users")
+
+    async def get(self, user: str) -> dict:
+        await self._ensure_fresh()
+
+        u = self._users.get(user)
+        if u is None:
+            log.debug(f"AsyncUserDirectory: {user} not in directory, looking up")
+            async with self._lookups:
+                r = await self.client.users_info(user=user)
+            u = r.data["user"]
+            self._users[user] = u
+
+        return u
+
+    async def get_many(self, users: List[str]) -> List[dict]:
+        import asyncio
+
+        await self._ensure_fresh()
+        return list(await asyncio.gather(*(self.get(u) for u in users)))
+
+    async def channel_members(self, channel: str) -> List[str]:
+        members = []
+        async for page in apaginate(self.client.conversations_members, channel=channel, limit=self.page_size):
+            members.extend(page["members"])
+
+        return members
+
+    async def _ensure_fresh(self) -> None:
+        # The lock stops concurrent handlers all refetching the directory at once.
+        async with self._refreshing:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                await self.refresh()
+
+
+def paginate(method, **kwargs) -> Iterator[dict]:
+    """
+    Calls a paginated Slack Web API method until the last page.
+    See https://api.slack.com/docs/pagination
+    :param method: e.g. client.users_list
+    :param kwargs: Arguments for the method.
+    :return: The data of each page.
+    """
+    cursor = None
+    while True:
+        r = method(cursor=cursor, **kwargs) if cursor else method(**kwargs)
+        if r["ok"] is False:
+            raise RuntimeError(f"{method.__name__} failed: {r['error']}")
+
+        yield r.data
+
+        cursor = r.data.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return
+
+
+async def apaginate(method, **kwargs) -> AsyncIterator[dict]:
+    """
+    As paginate(), for AsyncWebClient methods.
+    """
+    cursor = None
+    while True:
+        r = await (method(cursor=cursor, **kwargs) if cursor else method(**kwargs))
+        if r["ok"] is False:
+            raise RuntimeError(f"{method.__name__} failed: {r['error']}")
+
+        yield r.data
+
+        cursor = r.data.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return
@@ -0,0 +1,188 @@
+import logging as log
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+from util.metrics import REGISTRY
+
+SLACK_API_SECONDS = REGISTRY.histogram("slack_api_seconds", "Latency of Slack Web API calls, including retries.",
+                                       labels=("method",))
+SLACK_API_CALLS = REGISTRY.counter("slack_api_calls_total", "Slack Web API requests, by outcome.",
+                                   labels=("method", "outcome"))
+
+# Sustained requests per minute allowed by each Slack Web API rate limit tier.
+# See https://api.slack.com/docs/rate-limits
+TIER_REQUESTS_PER_MINUTE = {
+    1: 1,
+    2: 20,
+    3: 50,
+    4: 100,
+}
+
+# Tier of each method we use. See the "Rate limits" section of each method's documentation.
+METHOD_TIERS = {
+    "users.info": 4,
+    "users.list": 2,
+    "conversations.members": 4,
+    "conversations.open": 3,
+    "views.open": 4,
+    "views.update": 4,
+    "views.publish": 4,
+    # chat.postMessage is actually limited to about 1 per second per channel, with bursts allowed.
+    "chat.postMessage": 4,
+    "chat.postEphemeral": 4,
+    "chat.update": 3,
+}
+DEFAULT_TIER = 3
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average, with bursts of up to burst requests.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Blocks until a request may be made.
+        :return:
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops all requests for the given time, e.g. when Slack has said Retry-After.
+        :param seconds:
+        :return:
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class SlackDispatcher:
+    """
+    Runs Slack Web API calls concurrently on a thread pool, keeping each method within its rate limit tier.
+
+    A 429 (rate limited) response pauses every call to that method for the Retry-After period given by Slack,
+    then the call is retried.
+
+    All calls share the one WebClient. Note that slack_sdk's built-in transport opens a connection per request,
+    so concurrency is what hides the round-trip latency.
+    """
+
+    def __init__(self, client, max_workers: int = 8, max_retries: int = 3, rate_share: float = 1.0) -> None:
+        """
+        :param client: A slack_sdk WebClient, e.g. app.client.
+        :param max_workers: Maximum number of calls in flight at once.
+        :param max_retries: How many times to retry a rate limited call before giving up.
+        :param rate_share: The fraction of each rate limit to use, when other processes use the same token.
+            Slack's limits are per app per workspace, not per process.
+        """
+        self.client = client
+        self.max_retries = max_retries
+        self.rate_share = rate_share
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="slack-dispatch")
+        self._buckets: Dict[str, TokenBucket] = dict()
+        self._buckets_lock = threading.Lock()
+
+        self.stats = {
+            "calls": 0,
+            "rate_limited": 0,
+        }
+
+    def submit(self, method: str, **kwargs) -> Future:
+        """
+        :param method: API method name, e.g. "users.info".
+        :param kwargs: Arguments for the method.
+        :return: A Future for the SlackResponse.
+        """
+        return self._executor.submit(self._call, method, kwargs)
+
+    def call(self, method: str, **kwargs):
+        """
+        As submit(), but waits for the response.
+        """
+        return self.submit(method, **kwargs).result()
+
+    def map(self, method: str, kwargs_list: Iterable[dict]) -> List:
+        """
+        Makes many calls to one method concurrently.
+        :param method: API method name, e.g. "users.info".
+        :param kwargs_list: Arguments for each call.
+        :return: The responses, in the same order as kwargs_list.
+        """
+        futures = [self.submit(method, **kwargs) for kwargs in kwargs_list]
+        return [f.result() for f in futures]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _bucket(self, method: str) -> TokenBucket:
+        with self._buckets_lock:
+            bucket = self._buckets.get(method)
+            if bucket is None:
+                per_minute = TIER_REQUESTS_PER_MINUTE[METHOD_TIERS.get(method, DEFAULT_TIER)] * self.rate_share
+                # Slack tolerates short bursts above the per-minute rate.
+                bucket = TokenBucket(rate=per_minute / 60, burst=max(1, int(per_minute // 10)))
+                self._buckets[method] = bucket
+
+            return bucket
+
+    def _call(self, method: str, kwargs: dict):
+        bucket = self._bucket(method)
+        fn = getattr(self.client, method.replace(".", "_"))
+
+        with SLACK_API_SECONDS.time(method=method):
+            return self._call_with_retries(method, fn, bucket, kwargs)
+
+    def _call_with_retries(self, method: str, fn, bucket: TokenBucket, kwargs: dict):
+        # Imported here rather than at the top, so that importing main.py doesn't load slack_sdk.
+        from slack_sdk.errors import SlackApiError
+
+        attempt = 0
+        while True:
+            bucket.acquire()
+            self.stats["calls"] += 1
+            try:
+                response = fn(**kwargs)
+                SLACK_API_CALLS.inc(method=method, outcome="ok")
+                return response
+
+            except SlackApiError as e:
+                if e.response.status_code != 429 or attempt >= self.max_retries:
+                    SLACK_API_CALLS.inc(method=method, outcome="error")
+                    raise
+
+                SLACK_API_CALLS.inc(method=method, outcome="rate_limited")
+                attempt += 1
+                self.stats["rate_limited"] += 1
+                # Header names are case-insensitive, and some transports lowercase them.
+                headers = {k.lower(): v for k, v in e.response.headers.items()}
+                retry_after = float(headers.get("retry-after", 1))
+                log.warning(f"SlackDispatcher: {method} rate limited, retrying in {retry_after:g}s")
+                bucket.pause(retry_after)
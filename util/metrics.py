@@ -0,0 +1,385 @@
+"""
+Lightweight instrumentation, exposed in the Prometheus text format.
+
+Counters and Histograms are created at module level by the code they measure, and registered with REGISTRY.
+Components which already keep a stats dict (e.g. PersistentCache, Scheduler) are exported with
+REGISTRY.register_stats() instead, so they needn't know about metrics at all.
+
+serve() exposes REGISTRY over HTTP, for Prometheus to scrape, e.g. http://127.0.0.1:9102/metrics
+"""
+from __future__ import annotations
+
+import bisect
+import logging as log
+import threading
+import time
+import tracemalloc
+
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PREFIX = "votebot_"
+
+# Seconds. Covers everything from a cache hit to a Slack API call which had to wait out a rate limit.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# (metric name, label values, value)
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+
+class Metric:
+    """
+    Base class of metrics which have a name, help text and a fixed set of label names.
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if labels.keys() != set(self.labels):
+            raise ValueError(f"{self.name} needs labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = dict()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, tuple(zip(self.labels, key)), value
+
+
+class Histogram(Metric):
+    """
+    Counts observations into cumulative buckets, as Prometheus histograms do, so percentiles can be estimated
+    by the server, across any period, without keeping every observation here.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (the last is +Inf), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = dict()
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        """
+        with histogram.time(method="users.info"): ...
+        """
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return 0 if entry is None else entry[2]
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = [(key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items()]
+
+        for key, (buckets, total, count) in values:
+            labels = tuple(zip(self.labels, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), buckets):
+                cumulative += n
+                yield self.name + "_bucket", labels + (("le", _format_value(bound)),), cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> _Timer:
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class _Stats(Metric):
+    """
+    Exports a component's stats dict as one gauge, labelled by entry, e.g. votebot_user_cache{stat="hits"}.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, get_stats: Callable[[], dict]) -> None:
+        super().__init__(name, help)
+        self.get_stats = get_stats
+
+    def samples(self) -> Iterator[Sample]:
+        for key, value in self.get_stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield self.name, (("stat", key),), value
+
+
+class _Collector(Metric):
+    """
+    Samples generated by a function at scrape time, e.g. memory usage.
+    """
+
+    def __init__(self, name: str, help: str, collect: Callable[[], Iterable[Sample]], type: str = "gauge") -> None:
+        super().__init__(name, help)
+        self.collect = collect
+        self.type = type
+
+    def samples(self) -> Iterator[Sample]:
+        yield from self.collect()
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = dict()
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        :param metric:
+        :return: metric, or the metric already registered under its name.
+        Modules may be imported more than once (e.g. main.py run as __main__), and should share one metric.
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def register_stats(self, name: str, help: str, get_stats: Callable[[], dict]) -> None:
+        """
+        Export the numeric entries of a stats dict, e.g. register_stats("user_cache", ..., lambda: cache.stats).
+        Replaces any stats previously registered under name.
+        """
+        metric = _Stats(name, help, get_stats)
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def register_collector(self, name: str, help: str, collect: Callable[[], Iterable[Sample]], type: str = "gauge") -> None:
+        metric = _Collector(name, help, collect, type)
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """
+        :return: Every metric, in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines: List[str] = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                log.error(f"metrics: collecting {metric.name} failed: {e}")
+                continue
+
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                if labels:
+                    label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                    lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class MemorySampler:
+    """
+    Reports the process's memory use, and optionally where it was allocated, using tracemalloc.
+
+    tracemalloc slows down every allocation, so it's only started if enabled, and snapshots (which are slow
+    to take) are taken at most once per interval, however often metrics are scraped.
+    """
+
+    def __init__(self, tracemalloc_frames: int = 0, top: int = 10, interval: float = 60.0) -> None:
+        """
+        :param tracemalloc_frames: Frames of traceback to record per allocation. 0 disables tracemalloc.
+        :param top: How many allocation sites to report.
+        :param interval: Minimum seconds between tracemalloc snapshots.
+        """
+        self.top = top
+        self.interval = interval
+        self._sites: List[Sample] = []
+        self._sampled_at = float("-inf")
+        self._lock = threading.Lock()
+
+        if tracemalloc_frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(tracemalloc_frames)
+
+    def register(self, registry: Registry = REGISTRY) -> None:
+        registry.register_collector("process_max_rss_bytes", "Peak resident set size.", self._rss)
+        registry.register_collector("tracemalloc_bytes", "Memory traced by tracemalloc.", self._traced)
+        registry.register_collector("tracemalloc_site_bytes", "Largest allocation sites traced by tracemalloc.",
+                                    self._sample_sites)
+
+    def _rss(self) -> Iterator[Sample]:
+        if resource is None:
+            return
+        # Kilobytes on Linux.
+        yield PREFIX + "process_max_rss_bytes", (), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _traced(self) -> Iterator[Sample]:
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        yield PREFIX + "tracemalloc_bytes", (("kind", "current"),), current
+        yield PREFIX + "tracemalloc_bytes", (("kind", "peak"),), peak
+
+    def _sample_sites(self) -> List[Sample]:
+        if not tracemalloc.is_tracing():
+            return []
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self._sampled_at >= self.interval:
+                stats = tracemalloc.take_snapshot().statistics("lineno")[:self.top]
+                self._sites = [
+                    (PREFIX + "tracemalloc_site_bytes", (("site", f"{s.traceback[0].filename}:{s.traceback[0].lineno}"),), s.size)
+                    for s in stats
+                ]
+                self._sampled_at = now
+            return self._sites
+
+
+def listener_name(body: dict) -> str:
+    """
+    :param body: A Bolt request body.
+    :return: What the request is for, e.g. "command:/newvote" or "action:vote_type_action".
+    """
+    if "command" in body:
+        return f"command:{body['command']}"
+
+    kind = body.get("type")
+    if kind == "block_actions" and body.get("actions"):
+        return f"action:{body['actions'][0].get('action_id', '')}"
+    if kind in ("view_submission", "view_closed"):
+        return f"{kind}:{body.get('view', {}).get('callback_id', '')}"
+    if kind == "event_callback":
+        return f"event:{body.get('event', {}).get('type', '')}"
+    return str(kind)
+
+
+LISTENER_SECONDS = REGISTRY.histogram("listener_seconds", "Time from receiving a request to its listener returning.",
+                                      labels=("listener",))
+
+
+def instrument_bolt(app) -> None:
+    """
+    Time every request handled by a slack_bolt App.
+    Listeners ack() and hand off slow work, so this is mostly ack latency; see the work_queue metrics for the rest.
+    """
+
+    @app.middleware
+    def time_listener(body, next):
+        started = time.perf_counter()
+        try:
+            return next()
+        finally:
+            LISTENER_SECONDS.observe(time.perf_counter() - started, listener=listener_name(body))
+
+
+def instrument_async_bolt(app) -> None:
+    """
+    As instrument_bolt(), for a slack_bolt AsyncApp.
+    """
+
+    @app.middleware
+    async def time_listener(body, next):
+        started = time.perf_counter()
+        try:
+            return await next()
+        finally:
+            LISTENER_SECONDS.observe(time.perf_counter() - started, listener=listener_name(body))
+
+
+def serve(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """
+    Serve registry at http://host:port/metrics on a background thread.
+    Binds to localhost by default, as the metrics aren't authenticated.
+    """
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Don't log every scrape.
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info(f"metrics: serving on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -0,0 +1,70 @@
+import bisect
+import hashlib
+from typing import Iterable, List, Optional, Tuple
+
+# Events which concern every channel, so go to every partition.
+BROADCAST_EVENTS = frozenset({"user_change"})
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hashing: maps keys (e.g. channel IDs) to nodes (e.g. worker processes).
+
+    Each node is placed at replicas points on a ring, and a key belongs to the first node at or after its hash.
+    Adding or removing a node only moves the keys of the ring segments next to it, about 1/N of them,
+    rather than reshuffling almost every key as hash(key) % N would.
+    """
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 100) -> None:
+        self.nodes = list(nodes)
+        if not self.nodes:
+            raise ValueError("A HashRing needs at least one node.")
+
+        points: List[Tuple[int, str]] = sorted((_hash(f"{node}#{i}"), node)
+                                               for node in self.nodes for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        i = bisect.bisect_left(self._hashes, _hash(key))
+        return self._owners[i % len(self._owners)]
+
+
+def routing_key(body: dict) -> Optional[str]:
+    """
+    What a request should be partitioned by: the channel it concerns, or failing that the user who made it.
+    Every Poll lives in one channel, so partitioning by channel keeps each Poll, its votes and its channel's
+    membership changes together.
+    :param body: A Bolt request body.
+    :return: None if there's neither, e.g. for user_change events. See BROADCAST_EVENTS.
+    """
+    event = body.get("event")
+    if isinstance(event, dict):
+        channel = event.get("channel")
+        if isinstance(channel, str) and channel:
+            return channel
+        user = event.get("user")
+        return user if isinstance(user, str) else None
+
+    # Slash commands.
+    if body.get("channel_id"):
+        return body["channel_id"]
+
+    # Interactions with messages, e.g. vote buttons.
+    channel = body.get("channel")
+    if isinstance(channel, dict) and channel.get("id"):
+        return channel["id"]
+    container = body.get("container") or {}
+    if container.get("channel_id"):
+        return container["channel_id"]
+
+    # The "New Vote" modal keeps the channel it was opened in as its private_metadata.
+    view = body.get("view") or {}
+    if view.get("private_metadata"):
+        return view["private_metadata"]
+
+    return (body.get("user") or {}).get("id") or body.get("user_id")
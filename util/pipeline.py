@@ -0,0 +1,134 @@
+import logging as log
+import queue
+import threading
+import time
+from typing import Callable, Dict
+
+from util.metrics import REGISTRY
+
+WORK_WAIT_SECONDS = REGISTRY.histogram("work_queue_wait_seconds", "Time work spent queued.", labels=("stage",))
+WORK_RUN_SECONDS = REGISTRY.histogram("work_queue_run_seconds", "Time work spent running.", labels=("stage",))
+WORK_REJECTED = REGISTRY.counter("work_queue_rejected_total", "Work dropped because the queue was full.", labels=("stage",))
+
+
+class StageStats:
+    """
+    Timings for one stage of work, e.g. "newvote.views_open".
+    wait is time spent queued, run is time spent running.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    def record(self, wait: float, run: float, ok: bool) -> None:
+        self.count += 1
+        self.errors += 0 if ok else 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.run_total += run
+        self.run_max = max(self.run_max, run)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "wait_mean_seconds": self.wait_total / self.count if self.count else 0.0,
+            "wait_max_seconds": self.wait_max,
+            "run_mean_seconds": self.run_total / self.count if self.count else 0.0,
+            "run_max_seconds": self.run_max,
+        }
+
+
+class WorkQueue:
+    """
+    A bounded queue of work, run by a fixed pool of worker threads.
+
+    Listeners ack() straight away and submit() the slow part of handling a request (Slack API calls,
+    poll changes, saving), so that Slack always gets its ack within 3 seconds, however busy we are.
+    The queue is bounded so that a burst can't pile up unlimited work; once it's full, submit() gives up.
+    """
+
+    def __init__(self, workers: int = 8, maxsize: int = 256, submit_timeout: float = 0.5, slow_wait: float = 1.0) -> None:
+        """
+        :param workers: Number of worker threads.
+        :param maxsize: Maximum number of queued jobs.
+        :param submit_timeout: Seconds submit() waits for space in a full queue.
+        :param slow_wait: Log a warning for jobs which were queued longer than this many seconds.
+        """
+        self.submit_timeout = submit_timeout
+        self.slow_wait = slow_wait
+
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._stats: Dict[str, StageStats] = dict()
+        self._stats_lock = threading.Lock()
+        self.rejected = 0
+        self.max_depth = 0
+
+        self._workers = [threading.Thread(target=self._work, name=f"work-{i}", daemon=True) for i in range(workers)]
+        for t in self._workers:
+            t.start()
+
+    def submit(self, stage: str, fn: Callable, *args, **kwargs) -> bool:
+        """
+        Queue fn(*args, **kwargs) to run on a worker thread.
+        :param stage: Name of this kind of work, used for stats, e.g. "newvote.views_open".
+        :param fn:
+        :return: False if the queue is full.
+        """
+        try:
+            self._queue.put((stage, time.monotonic(), fn, args, kwargs), timeout=self.submit_timeout)
+        except queue.Full:
+            self.rejected += 1
+            WORK_REJECTED.inc(stage=stage)
+            log.error(f"WorkQueue: queue full, dropped {stage}")
+            return False
+
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stages = {stage: s.to_dict() for stage, s in self._stats.items()}
+
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "rejected": self.rejected,
+            "stages": stages,
+        }
+
+    def join(self) -> None:
+        """
+        Wait until all queued work has been done.
+        """
+        self._queue.join()
+
+    def _work(self) -> None:
+        while True:
+            stage, queued_at, fn, args, kwargs = self._queue.get()
+            started_at = time.monotonic()
+            wait = started_at - queued_at
+            if wait > self.slow_wait:
+                log.warning(f"WorkQueue: {stage} waited {wait:.2f}s in the queue")
+
+            ok = True
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                ok = False
+                log.exception(f"WorkQueue: {stage} failed: {e}")
+            finally:
+                run = time.monotonic() - started_at
+                WORK_WAIT_SECONDS.observe(wait, stage=stage)
+                WORK_RUN_SECONDS.observe(run, stage=stage)
+                with self._stats_lock:
+                    self._stats.setdefault(stage, StageStats()).record(wait, run, ok)
+                self._queue.task_done()
@@ -0,0 +1,276 @@
+import logging as log
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set
+
+# Called with (channel, user IDs who became eligible, user IDs who stopped being eligible).
+RosterListener = Callable[[str, Set[str], Set[str]], None]
+
+# PersistentCache key prefix for each channel's roster.
+ROSTER_KEY = "roster:"
+
+
+class ChannelRosters:
+    """
+    In-memory channel member lists, kept up to date from Slack events rather than refetched.
+
+    A channel's members are fetched once, the first time they're asked for. After that they're updated from
+    member_joined_channel, member_left_channel and user_change events, so reading a roster costs no API calls.
+    Events can be missed (e.g. while the bot is disconnected), so each roster is also refetched in full once
+    it's older than resync_after seconds, as a fallback. Until that refetch is done, in the background,
+    the roster as it was is still served.
+
+    Rosters only list active people: bots, app users and deactivated users are left out,
+    and a user_change deactivating someone removes them from every roster straight away.
+
+    Listeners are told about every change to a roster which has been fetched, e.g. to update open Polls.
+
+    Rosters are fetched without holding the lock, so a slow fetch doesn't hold up events or other channels,
+    and each channel is only fetched by one caller at a time; the others wait for its result.
+
+    With a cache, rosters are written through to it, and read from it before they're first fetched,
+    so a restart doesn't refetch every channel. A cached roster is resynced as if it had never been away.
+    """
+
+    def __init__(self, directory, resync_after: float = 6 * 60 * 60, cache=None) -> None:
+        """
+        :param directory: util.directory.UserDirectory, used to fetch members and tell people from bots.
+            Its API calls go through its dispatcher, if it has one.
+        :param resync_after: Seconds before a roster is refetched in full.
+        :param cache: Optional util.cache.PersistentCache to keep rosters in across restarts.
+        """
+        self.directory = directory
+        self.resync_after = resync_after
+        self.cache = cache
+        self.listeners: List[RosterListener] = list()
+
+        # channel -> every member, including inactive ones, in the order Slack listed them.
+        self._members: Dict[str, Dict[str, None]] = dict()
+        # channel -> time.time() of its last full fetch.
+        self._synced_at: Dict[str, float] = dict()
+        # Bots, app users and deactivated users.
+        self._inactive: Set[str] = set()
+        # channel -> the fetch of its roster in progress.
+        self._syncing: Dict[str, Future] = dict()
+        # Channels queued or being resynced in the background.
+        self._resyncing: Set[str] = set()
+        self._lock = threading.RLock()
+
+        self._resyncer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="roster-resync")
+
+        self.stats = {
+            "syncs": 0,
+            "events": 0,
+        }
+
+    def members(self, channel: str) -> List[str]:
+        """
+        :param channel: Channel ID
+        :return: User IDs of the channel's active members.
+        """
+        self._ensure_synced(channel, max_age=self.resync_after)
+        return self.members_if_synced(channel)
+
+    def members_if_synced(self, channel: str) -> List[str] | None:
+        """
+        :return: As members(), or None if the channel's roster hasn't been fetched. Never makes API calls.
+        """
+        with self._lock:
+            members = self._members.get(channel)
+            if members is None:
+                return None
+            return [u for u in members if u not in self._inactive]
+
+    def is_member(self, channel: str, user: str) -> bool:
+        self._ensure_synced(channel)
+        with self._lock:
+            return user in self._members[channel] and user not in self._inactive
+
+    def close(self) -> None:
+        """
+        Wait for any background resyncs to finish.
+        """
+        self._resyncer.shutdown(wait=True)
+
+    def invalidate(self, channel: str) -> None:
+        """
+        Refetch the channel's roster next time it's read, e.g. after reconnecting.
+        """
+        with self._lock:
+            self._synced_at.pop(channel, None)
+
+    def handle_event(self, event: dict) -> None:
+        """
+        Apply a member_joined_channel, member_left_channel or user_change event. Other events are ignored.
+        See https://api.slack.com/events
+        :param event: body["event"]
+        :return:
+        """
+        event_type = event.get("type")
+        with self._lock:
+            self.stats["events"] += 1
+
+            if event_type == "member_joined_channel":
+                self._joined(event["channel"], event["user"])
+
+            elif event_type == "member_left_channel":
+                self._left(event["channel"], event["user"])
+
+            elif event_type == "user_change":
+                self._user_changed(event["user"])
+
+    def _joined(self, channel: str, user: str) -> None:
+        members = self._members.get(channel)
+        if members is None or user in members:
+            # Not fetched yet, so it'll be up to date when it is.
+            return
+
+        members[user] = None
+        self._write_through(channel)
+        if not self._is_inactive(self.directory.get(user)):
+            self._notify(channel, joined={user}, left=set())
+        else:
+            self._inactive.add(user)
+
+    def _left(self, channel: str, user: str) -> None:
+        members = self._members.get(channel)
+        if members is None or user not in members:
+            return
+
+        del members[user]
+        self._write_through(channel)
+        if user not in self._inactive:
+            self._notify(channel, joined=set(), left={user})
+
+    def _user_changed(self, user: dict) -> None:
+        self.directory.update(user)
+
+        user_id = user["id"]
+        was_inactive = user_id in self._inactive
+        now_inactive = self._is_inactive(user)
+        if was_inactive == now_inactive:
+            return
+
+        if now_inactive:
+            self._inactive.add(user_id)
+        else:
+            self._inactive.discard(user_id)
+
+        for channel, members in self._members.items():
+            if user_id in members:
+                if now_inactive:
+                    self._notify(channel, joined=set(), left={user_id})
+                else:
+                    self._notify(channel, joined={user_id}, left=set())
+
+    def _ensure_synced(self, channel: str, max_age: Optional[float] = None) -> None:
+        """
+        Fetch the channel's roster if it hasn't been, or if it was last fetched more than max_age seconds ago.
+        """
+        if channel not in self._members and self.cache is not None:
+            self._load_cached(channel)
+
+        with self._lock:
+            synced = channel in self._members
+            synced_at = self._synced_at.get(channel)
+            if synced and (max_age is None or synced_at is not None and time.time() - synced_at <= max_age):
+                return
+            if synced:
+                # Serve the roster as it is, and catch up in the background. _sync() is one fetch at a time.
+                if channel not in self._resyncing:
+                    self._resyncing.add(channel)
+                    self._resyncer.submit(self._resync, channel)
+                return
+
+        self._sync(channel)
+
+    def _resync(self, channel: str) -> None:
+        try:
+            self._sync(channel)
+        except Exception as e:
+            log.warning(f"ChannelRosters: resyncing {channel} failed: {e}")
+        finally:
+            with self._lock:
+                self._resyncing.discard(channel)
+
+    def _sync(self, channel: str) -> None:
+        with self._lock:
+            fetch = self._syncing.get(channel)
+            leader = fetch is None
+            if leader:
+                fetch = self._syncing[channel] = Future()
+
+        if not leader:
+            # Someone else is already fetching it. Wait without the lock, which they need to install it.
+            fetch.result()
+            return
+
+        try:
+            members = dict.fromkeys(self.directory.channel_members(channel))
+            users = self.directory.get_many(list(members))
+            self._install(channel, members, users)
+            fetch.set_result(None)
+        except BaseException as e:
+            fetch.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._syncing[channel]
+
+    def _install(self, channel: str, members: Dict[str, None], users: List[dict]) -> None:
+        with self._lock:
+            old = self.members_if_synced(channel)
+
+            self._set_inactive(users)
+            self._members[channel] = members
+            self._synced_at[channel] = time.time()
+            self._write_through(channel)
+            self.stats["syncs"] += 1
+            log.debug(f"ChannelRosters: synced {channel}, {len(members)} members")
+
+            if old is not None:
+                # Catch listeners up on whatever the events missed.
+                new = set(self.members_if_synced(channel))
+                joined, left = new - set(old), set(old) - new
+                if joined or left:
+                    self._notify(channel, joined=joined, left=left)
+
+    def _load_cached(self, channel: str) -> None:
+        cached = self.cache.peek(ROSTER_KEY + channel)
+        if cached is None:
+            return
+
+        roster, _ = cached
+        # Who's active may have changed since, but the directory has kept up.
+        users = self.directory.get_many(roster["members"])
+        with self._lock:
+            if channel in self._members:
+                # Fetched meanwhile.
+                return
+            self._set_inactive(users)
+            self._members[channel] = dict.fromkeys(roster["members"])
+            self._synced_at[channel] = roster["synced_at"]
+
+    def _write_through(self, channel: str) -> None:
+        if self.cache is not None:
+            self.cache.put(ROSTER_KEY + channel, {"members": list(self._members[channel]),
+                                                  "synced_at": self._synced_at.get(channel, 0.0)})
+
+    def _set_inactive(self, users: List[dict]) -> None:
+        for u in users:
+            if self._is_inactive(u):
+                self._inactive.add(u["id"])
+            else:
+                self._inactive.discard(u["id"])
+
+    def _notify(self, channel: str, joined: Set[str], left: Set[str]) -> None:
+        for listener in self.listeners:
+            try:
+                listener(channel, joined, left)
+            except Exception as e:
+                log.error(f"ChannelRosters: listener failed for {channel}: {e}")
+
+    @staticmethod
+    def _is_inactive(user: dict) -> bool:
+        return bool(user.get("deleted") or user.get("is_bot") or user.get("is_app_user"))
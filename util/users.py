@@ -1,48 +1,52 @@
 import logging as log
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
-import cachetools
+from util.cache import PersistentCache
+from util.directory import UserDirectory
+from util.rosters import ChannelRosters
 
-import main
+directory: Optional[UserDirectory] = None
 
+# Channel members, kept up to date from events. Pass events to rosters.handle_event().
+rosters: Optional[ChannelRosters] = None
 
-@cachetools.cached(cachetools.TTLCache(maxsize=1024, ttl=600))
-def get_user_info(user: str) -> dict:
+# Survives restarts. Backs directory and rosters.
+cache: Optional[PersistentCache] = None
+
+
+def init(client, dispatcher, cache_path: str) -> None:
     """
-    Wraps app.client.users_info() with a 600 second TTL cache.
-    See https://api.slack.com/methods/users.info
-    :param user:
+    Must be called once, before the other functions here.
+    :param client: A WebClient, e.g. app.client.
+    :param dispatcher: util.dispatch.SlackDispatcher
+    :param cache_path: SQLite file for the persistent user cache.
     :return:
     """
-    log.debug(f"get_user_info: user={user}")
-    r = main.app.client.users_info(user=user)
-
-    if r["ok"] is False:
-        raise
-
-    return r.data["user"]
+    global directory, cache, rosters
+    # Holds the directory and rosters, so that a restart starts from them rather than refetching everything.
+    cache = PersistentCache(cache_path, maxsize=100000, ttl=600)
+    # user_change events keep the directory up to date, so it's only refetched as a fallback.
+    directory = UserDirectory(client, ttl=6 * 60 * 60, dispatcher=dispatcher, cache=cache)
+    rosters = ChannelRosters(directory, cache=cache)
 
 
-@cachetools.cached(cachetools.TTLCache(maxsize=1024, ttl=600))
 def get_users_in_channel(channel: str) -> List[Tuple[str, str]]:
     """
-    Get the users in the given channel, excluding bots and app users.
-    Results are cached for 600 seconds.
+    Get the active users in the given channel, excluding bots, app users and deactivated users.
+    Read from rosters, which only calls the API the first time a channel is asked for, and for occasional resyncs.
     :param channel: Channel ID
     :return: List of (User ID, user's display name).
     """
     log.debug(f"get_users_in_channel: channel={channel}")
 
-    r = main.app.client.conversations_members(channel=channel)
-    if r["ok"] is False:
-        raise
+    members = rosters.members(channel)
+    return [(u["id"], u["profile"]["display_name"]) for u in directory.get_many(members)]
 
-    users = []
 
-    for m in r.data["members"]:
-        u = get_user_info(user=m)
-        if u["is_bot"] or u["is_app_user"]:
-            continue
-        users.append((u["id"], u["profile"]["display_name"]))
-
-    return users
+def close() -> None:
+    """
+    Wait for background refreshes of the directory and rosters, then close the cache.
+    """
+    rosters.close()
+    directory.close()
+    cache.close()
@@ -0,0 +1,361 @@
+"""
+Slack views (modals, the Home tab) and the magic strings they use.
+Shared by the synchronous bot in main.py and the asyncio bot in async_main.py.
+"""
+
+import functools
+import logging as log
+from enum import StrEnum
+
+from vote.enums import PollType, PollStatus, VoteChoice
+from vote.slackuser import SlackUser
+
+# Enumerate all the various magic strings used throughout the Slack blocks.
+# Using enums eliminates the problem of changing a string constant but not changing all the places it's used.
+
+
+class VoteType(StrEnum):
+    ONLINE_MOTION = "online_motion"
+    APPROVAL = "approval"
+
+
+class BlockIds(StrEnum):
+    VOTE_TEXT = "vote_text"
+    VOTE_TYPE = "vote_type"
+    VOTE_TYPE_LONG_DESCRIPTION = "vote_type_long_description"
+    APPROVAL_NUMBER_OF_APPROVERS = "approval_number_of_approvers"
+    APPROVAL_SPECIFIC_PEOPLE_REQUIRED = "approval_specific_people_required"
+
+
+class ActionIds(StrEnum):
+    VOTE_TEXT = "vote_text_action"
+    VOTE_TYPE = "vote_type_action"
+    # Prefix of the poll message's vote buttons. The full action ID ends with the VoteChoice, e.g. "cast_vote_aye".
+    CAST_VOTE = "cast_vote"
+
+
+class CallbackIds(StrEnum):
+    NEW_VOTE = "newvote_callback"
+
+
+vote_type_definitions = {
+    VoteType.ONLINE_MOTION: {
+        "text": "Online Motion",
+        "75_char_desc": "Passes when everyone votes `Aye`",
+        "2000_char_desc": "*Online motion:*\n"
+        "  - To pass, every person in the channel must vote `Aye` or `Abstain`.\n"
+        "  - To pass, at least 4 people must vote `Aye`.\n"
+        "  - Any `Nay` vote causes the motion to fail.\n",
+    },
+    VoteType.APPROVAL: {
+        "text": "Approval",
+        "75_char_desc": "Passes when specified people vote `Approve`",
+        "2000_char_desc": "*Approval*:\n"
+        "  - To pass, the specified number of people must vote `Approve`.\n"
+        "  - You can specify particular people who must `Approve`, e.g. the Chairperson or the Treasurer.\n"
+        "  - A person can vote `Object` to formally record their objection to the matter at hand.\n",
+    },
+}
+
+
+# The kind of Poll each vote type in the "New Vote" modal creates.
+poll_types = {
+    VoteType.ONLINE_MOTION: PollType.COMMITTEE_MOTION,
+    VoteType.APPROVAL: PollType.COMMITTEE_APPROVAL,
+}
+
+# What the vote buttons on a poll message say.
+vote_choice_labels = {
+    PollType.COMMITTEE_MOTION: {
+        VoteChoice.AYE: "Aye",
+        VoteChoice.NAY: "Nay",
+        VoteChoice.ABSTAIN: "Abstain",
+    },
+    PollType.COMMITTEE_APPROVAL: {
+        VoteChoice.AYE: "Approve",
+        VoteChoice.NAY: "Object",
+        VoteChoice.ABSTAIN: "Abstain",
+    },
+}
+
+
+def get_selected_vote_type(current_state=None) -> VoteType:
+    """
+    :param current_state: Pass in the `body` parameter from the callback, or None for a new modal.
+    :return: The vote type currently selected in the "New Vote" modal.
+    """
+    if current_state is None:
+        return VoteType.ONLINE_MOTION
+
+    current_values = current_state["view"]["state"]["values"]
+    return VoteType(
+        current_values[BlockIds.VOTE_TYPE][ActionIds.VOTE_TYPE]["selected_option"]["value"]
+    )
+
+
+def newvote_view(current_state=None, private_metadata: str | None = None) -> dict:
+    """
+    The view for the "New Vote" modal dialog, ready to pass to client.views_open() or views_update().
+
+    This gets called a) upon first creation of the modal, and b) each time the view needs to be updated.
+
+    E.g. when the radio button for "type of vote" changes, we need to display different input fields and information.
+
+    Only private_metadata varies between requests; everything else is compiled once per vote type.
+    The returned dict shares its blocks with the cached view, so don't modify them.
+
+    :param current_state: Pass in the `body` parameter from the callback.
+    Current state is pulled from body["view"]["state"].
+    :param private_metadata: Stored with the view and passed back with its submission, e.g. the channel ID.
+    Defaults to the current view's private_metadata, if any.
+    :return: A view dict.
+    """
+    vote_type = get_selected_vote_type(current_state)
+    log.debug("newvote_view: vote_type=%s", vote_type)
+
+    if private_metadata is None and current_state is not None:
+        private_metadata = current_state["view"].get("private_metadata")
+
+    view = dict(_compiled_newvote_view(vote_type))
+    if private_metadata:
+        view["private_metadata"] = private_metadata
+
+    return view
+
+
+@functools.cache
+def _compiled_newvote_view(vote_type: VoteType) -> dict:
+    return make_newvote_modal(vote_type).build()
+
+
+def make_newvote_modal(current_vote_type: VoteType = VoteType.ONLINE_MOTION):
+    """
+    Construct the "New Vote" modal dialog for the given vote type.
+    Use newvote_view() instead, which caches the built result.
+
+    :param current_vote_type: The vote type selected in the modal.
+
+    :return: A Modal object.
+    Note you must call the Method.build() method before passing to Slack API.
+    e.g.
+    my_modal = make_newvote_modal()
+    client.views_open(view=my_modal.build()).
+    """
+    # Imported here, as only this builds views with blockkit, and only once per vote type; see newvote_view().
+    # Needs a version of https://github.com/imryche/blockkit patched to support NumberInput,
+    # see https://github.com/imryche/blockkit/pull/74
+    from blockkit import (
+        Section,
+        MarkdownText,
+        Modal,
+        Header,
+        Divider,
+        RadioButtons,
+        PlainOption,
+        PlainText,
+        Input,
+        PlainTextInput,
+        MultiUsersSelect,
+        NumberInput,
+    )
+
+    vote_text_input = Input(
+        block_id=BlockIds.VOTE_TEXT,
+        dispatch_action=False,
+        label="Vote text",
+        element=PlainTextInput(
+            action_id=ActionIds.VOTE_TEXT,
+            placeholder=PlainText(
+                text="e.g. MOTION: Approve Jane Doe's application for concession membership"
+            ),
+            multiline=True,
+        ),
+    )
+
+    def vote_type_option(vt):
+        # Convenience function to manufacture Option blocks
+        return PlainOption(
+            text=PlainText(text=vote_type_definitions[vt]["text"]),
+            value=vt,
+            description=vote_type_definitions[vt]["75_char_desc"],
+        )
+
+    # Radio button input for vote type
+    vote_type_input = Input(
+        block_id=BlockIds.VOTE_TYPE,
+        dispatch_action=True,
+        label=PlainText(text="Type of vote:"),
+        element=RadioButtons(
+            action_id=ActionIds.VOTE_TYPE,
+            initial_option=vote_type_option(current_vote_type),
+            options=[vote_type_option(vt) for vt, _ in vote_type_definitions.items()],
+        ),
+    )
+
+    # Detailed description of vote type
+    vote_type_long_description = Section(
+        block_id=BlockIds.VOTE_TYPE_LONG_DESCRIPTION,
+        text=MarkdownText(
+            text=vote_type_definitions[current_vote_type]["2000_char_desc"]
+        ),
+    )
+
+    # When the vote type is APPROVAL - input to specify how many approvers are required
+    approval_number_of_approvers_input = Input(
+        block_id=BlockIds.APPROVAL_NUMBER_OF_APPROVERS,
+        label="Number of approvers",
+        element=NumberInput(is_decimal_allowed=False, min_value="1", max_value="10"),
+    )
+
+    # When the vote type is APPROVAL - input to select specific people who must approve.
+    approval_specific_people_required_input = Input(
+        block_id=BlockIds.APPROVAL_SPECIFIC_PEOPLE_REQUIRED,
+        label="Required",
+        element=MultiUsersSelect(placeholder="Who must vote", action_id="no_action"),
+    )
+
+    blocks = [
+        Header(text="New vote"),
+        Divider(),
+        vote_text_input,
+        Divider(),
+        vote_type_input,
+        vote_type_long_description,
+        Divider(),
+    ]
+
+    if current_vote_type == VoteType.APPROVAL:
+        # Only show these blocks when relevant
+        blocks.extend(
+            [
+                approval_specific_people_required_input,
+                approval_number_of_approvers_input,
+            ]
+        )
+
+    my_modal = Modal(
+        title="New vote",
+        blocks=blocks,
+        close="Close",
+        submit="Submit",
+        callback_id=CallbackIds.NEW_VOTE,
+    )
+
+    return my_modal
+
+
+def parse_newvote_submission(view: dict) -> dict:
+    """
+    Pull the inputs out of a submitted "New Vote" modal.
+    :param view: body["view"] from the view_submission callback.
+    :return: Keyword arguments for vote.poll.Poll, apart from created_by.
+    """
+    values = view["state"]["values"]
+
+    def value(block_id):
+        # Some inputs have no explicit action ID, so Slack makes one up. Each block has only one input anyway.
+        return next(iter(values[block_id].values()))
+
+    vote_type = VoteType(value(BlockIds.VOTE_TYPE)["selected_option"]["value"])
+    out = {
+        "poll_type": poll_types[vote_type],
+        "public_text": value(BlockIds.VOTE_TEXT)["value"],
+        "channel": view.get("private_metadata", ""),
+    }
+
+    if vote_type == VoteType.APPROVAL:
+        out["number_of_people_who_must_vote"] = int(value(BlockIds.APPROVAL_NUMBER_OF_APPROVERS)["value"])
+        out["people_who_must_vote"] = [
+            SlackUser.intern(u) for u in value(BlockIds.APPROVAL_SPECIFIC_PEOPLE_REQUIRED)["selected_users"]
+        ]
+
+    return out
+
+
+def make_poll_message(poll) -> dict:
+    """
+    Construct the message showing a poll, its current tallies, and (while it's open) buttons to vote.
+    :param poll: vote.poll.Poll
+    :return: Keyword arguments for chat.postMessage or chat.update, apart from the channel and ts.
+    """
+    labels = vote_choice_labels[poll.poll_type]
+    tallies = "   ".join(f"{label}: *{poll.tallies.get(choice, 0)}*" for choice, label in labels.items())
+
+    blocks = [
+        {"type": "section", "text": {"type": "mrkdwn", "text": poll.public_text}},
+        {"type": "context", "elements": [{"type": "mrkdwn", "text": f"{tallies}   ({poll.number_yet_to_vote} yet to vote)"}]},
+    ]
+
+    if poll.status is PollStatus.OPEN:
+        blocks.append({
+            "type": "actions",
+            "block_id": poll.poll_id,
+            "elements": [
+                {
+                    "type": "button",
+                    "text": {"type": "plain_text", "text": label},
+                    "action_id": f"{ActionIds.CAST_VOTE}_{choice}",
+                    "value": poll.poll_id,
+                }
+                for choice, label in labels.items()
+            ],
+        })
+    else:
+        blocks.append({"type": "context", "elements": [{"type": "mrkdwn", "text": f"*Result: {poll.status}*"}]})
+
+    return {
+        "text": poll.public_text,
+        "blocks": blocks,
+    }
+
+
+def make_home_view(person, index) -> dict:
+    """
+    Construct the view for a person's Home tab: the polls waiting for their vote, other open polls, and recent results.
+    :param person: vote.slackuser.SlackUser whose Home tab this is.
+    :param index: vote.userindex.PendingVotesIndex to read their polls from.
+    :return: A view, to pass to client.views_publish().
+    """
+    awaiting = index.awaiting_vote(person)
+    awaiting_ids = {poll.poll_id for poll in awaiting}
+    other_open = [poll for poll in index.open_polls(person) if poll.poll_id not in awaiting_ids]
+
+    blocks = [
+        {"type": "header", "text": {"type": "plain_text", "text": "Waiting for your vote"}},
+        *_home_poll_sections(awaiting, "Nothing needs your vote right now. :tada:"),
+        {"type": "divider"},
+        {"type": "header", "text": {"type": "plain_text", "text": "Other open polls"}},
+        *_home_poll_sections(other_open, "No other open polls."),
+        {"type": "divider"},
+        {"type": "header", "text": {"type": "plain_text", "text": "Recent results"}},
+        *_home_poll_sections(index.recent_results(person), "No results yet."),
+    ]
+
+    return {
+        "type": "home",
+        "callback_id": "home_view",
+        "blocks": blocks,
+    }
+
+
+# Slack allows 100 blocks per view, so cap each list on the Home tab.
+HOME_POLLS_PER_SECTION = 20
+
+
+def _home_poll_sections(polls, if_empty: str) -> list:
+    if not polls:
+        return [{"type": "context", "elements": [{"type": "mrkdwn", "text": if_empty}]}]
+
+    sections = []
+    for poll in polls[:HOME_POLLS_PER_SECTION]:
+        tallies = ", ".join(f"{count} {choice}" for choice, count in poll.tallies.items())
+        closes = "" if poll.closes_at is None else f" - closes {poll.closes_at:%Y-%m-%d %H:%M} UTC"
+        sections.append({
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"*{poll.public_text}*\n{poll.status}: {tallies}{closes}",
+            },
+        })
+
+    return sections
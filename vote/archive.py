@@ -0,0 +1,254 @@
+"""
+Read-only, compressed storage for closed Polls.
+
+An archive is a directory of segment files. Each segment is written once, by write_segment(), and never changed:
+
+* MAGIC
+
+* Records, sorted by poll ID. Each is: poll ID length (uint16), poll ID, payload length (uint32), payload,
+  where payload is the zlib-compressed vote.codec encoding of the Poll, including its full event history.
+
+* A sparse index: the poll ID and offset of every index_every'th record.
+
+* Trailer: offset of the sparse index (uint64), number of records (uint64), MAGIC.
+
+Segments are memory mapped, and only their sparse indexes are read into memory,
+so looking up a Poll reads a handful of record headers and one payload, however big the archive gets.
+"""
+from __future__ import annotations
+
+import bisect
+import logging as log
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from vote import codec
+from vote.poll import Poll
+
+MAGIC = b"VBA1"
+_ID_LEN = struct.Struct("<H")
+_PAYLOAD_LEN = struct.Struct("<I")
+_OFFSET = struct.Struct("<Q")
+_TRAILER = struct.Struct("<QQ4s")
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+class _Segment:
+    """
+    One memory-mapped segment, and its sparse index.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        m = self._map
+        if len(m) < len(MAGIC) + _TRAILER.size or m[:len(MAGIC)] != MAGIC:
+            raise ArchiveError(f"{path} isn't an archive segment.")
+
+        self.index_offset, self.count, magic = _TRAILER.unpack_from(m, len(m) - _TRAILER.size)
+        if magic != MAGIC:
+            raise ArchiveError(f"{path} is truncated.")
+
+        # Sparse index: poll IDs, and the offsets of their records.
+        self._keys: List[str] = []
+        self._offsets: List[int] = []
+        pos = self.index_offset
+        end = len(m) - _TRAILER.size
+        while pos < end:
+            key, pos = self._read_id(pos)
+            (offset,) = _OFFSET.unpack_from(m, pos)
+            pos += _OFFSET.size
+            self._keys.append(key)
+            self._offsets.append(offset)
+
+    def get(self, poll_id: str) -> Optional[bytes]:
+        """
+        :return: The Poll's encoded form, or None if it isn't in this segment.
+        """
+        i = bisect.bisect_right(self._keys, poll_id) - 1
+        if i < 0:
+            return None
+
+        # Scan from the indexed record up to the next indexed one, comparing IDs without decompressing anything.
+        pos = self._offsets[i]
+        end = self._offsets[i + 1] if i + 1 < len(self._offsets) else self.index_offset
+        while pos < end:
+            key, pos = self._read_id(pos)
+            (n,) = _PAYLOAD_LEN.unpack_from(self._map, pos)
+            pos += _PAYLOAD_LEN.size
+            if key == poll_id:
+                return zlib.decompress(self._map[pos:pos + n])
+            if key > poll_id:
+                return None
+            pos += n
+
+        return None
+
+    def __iter__(self) -> Iterator[tuple[str, bytes]]:
+        """
+        :return: (poll ID, encoded Poll) of every record, in poll ID order.
+        """
+        pos = len(MAGIC)
+        while pos < self.index_offset:
+            key, pos = self._read_id(pos)
+            (n,) = _PAYLOAD_LEN.unpack_from(self._map, pos)
+            pos += _PAYLOAD_LEN.size
+            yield key, zlib.decompress(self._map[pos:pos + n])
+            pos += n
+
+    def close(self) -> None:
+        self._map.close()
+
+    def _read_id(self, pos: int) -> tuple[str, int]:
+        (n,) = _ID_LEN.unpack_from(self._map, pos)
+        pos += _ID_LEN.size
+        return str(self._map[pos:pos + n], "ascii"), pos + n
+
+
+class PollArchive:
+    """
+    Closed Polls, in compressed read-only segments. See the module docstring for the format.
+    Newer segments take precedence, should a Poll ever be archived twice.
+    """
+
+    def __init__(self, root: str, index_every: int = 16, level: int = 6, read_only: bool = False) -> None:
+        """
+        :param root: Directory to keep segments in. Created if it doesn't exist, unless read_only.
+        :param index_every: Put every index_every'th record in the sparse index.
+        :param level: zlib compression level.
+        :param read_only: Only read the segments already there. A missing root is then just an empty archive.
+        """
+        self.root = root
+        self.index_every = index_every
+        self.level = level
+        self.read_only = read_only
+
+        self._segments: Dict[str, _Segment] = dict()  # Newest last.
+        self._lock = threading.Lock()
+
+        if read_only:
+            if not os.path.isdir(root):
+                return
+        else:
+            os.makedirs(root, exist_ok=True)
+
+        for name in sorted(os.listdir(root)):
+            if name.startswith("segment-") and name.endswith(".arc"):
+                self._open(os.path.join(root, name))
+
+    def write_segment(self, polls: Iterable[Poll]) -> Optional[str]:
+        """
+        Archive Polls, in a new segment. The segment is durable by the time this returns.
+        :param polls:
+        :return: The segment's path, or None if there were no Polls.
+        """
+        if self.read_only:
+            raise ArchiveError(f"{self.root} was opened read-only.")
+
+        records = []
+        for poll in polls:
+            with poll.lock:
+                records.append((poll.poll_id, zlib.compress(codec.encode(poll), self.level)))
+        if not records:
+            return None
+        records.sort()
+
+        with self._lock:
+            number = 1 + max((int(os.path.basename(p)[len("segment-"):-len(".arc")]) for p in self._segments), default=-1)
+            path = os.path.join(self.root, f"segment-{number:010d}.arc")
+
+            buf = bytearray(MAGIC)
+            index = bytearray()
+            for i, (poll_id, payload) in enumerate(records):
+                key = poll_id.encode("ascii")
+                if i % self.index_every == 0:
+                    index += _ID_LEN.pack(len(key)) + key + _OFFSET.pack(len(buf))
+                buf += _ID_LEN.pack(len(key)) + key + _PAYLOAD_LEN.pack(len(payload)) + payload
+
+            index_offset = len(buf)
+            buf += index
+            buf += _TRAILER.pack(index_offset, len(records), MAGIC)
+
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(buf)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            fsync_dir(self.root)
+
+            self._open(path)
+
+        log.info(f"PollArchive: archived {len(records)} polls in {path}, {len(buf):,} bytes")
+        return path
+
+    def get(self, poll_id: str) -> Optional[Poll]:
+        """
+        :param poll_id:
+        :return: The archived Poll, or None if it isn't archived.
+        """
+        with self._lock:
+            segments = list(self._segments.values())
+
+        for segment in reversed(segments):
+            data = segment.get(poll_id)
+            if data is not None:
+                return codec.decode(data)
+
+        return None
+
+    def __contains__(self, poll_id: str) -> bool:
+        with self._lock:
+            segments = list(self._segments.values())
+        return any(segment.get(poll_id) is not None for segment in segments)
+
+    def __iter__(self) -> Iterator[Poll]:
+        """
+        Every archived Poll, one at a time, a segment at a time.
+        """
+        seen = set()
+        with self._lock:
+            segments = list(self._segments.values())
+
+        for segment in reversed(segments):
+            for poll_id, data in segment:
+                if poll_id not in seen:
+                    seen.add(poll_id)
+                    yield codec.decode(data)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(segment.count for segment in self._segments.values())
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
+
+    def _open(self, path: str) -> None:
+        self._segments[path] = _Segment(path)
+
+
+def fsync_dir(path: str) -> None:
+    # Makes a rename durable. Not supported on Windows, where it's unnecessary anyway.
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,329 @@
+"""
+Serialisation of Polls.
+
+* encode() / decode() - a compact binary format, for storage and replication.
+
+* iter_json() / write_json() / decode_json() - JSON, written incrementally, for debugging and export.
+
+Both formats record Poll.version, and decoding picks the decoder for the version that was written.
+"""
+from __future__ import annotations
+
+import json
+import struct
+import sys
+
+from array import array
+
+from datetime import datetime, timedelta
+from typing import Callable, Dict, IO, Iterator, Optional
+
+from vote.enums import VoteChoice, PollType, PollStatus, EventType
+from vote.event import Event
+from vote.poll import Poll, PEOPLE_ATTRS, _event_times
+from vote.slackuser import SlackUser
+
+MAGIC = b"VBP"
+_HEADER = struct.Struct("<3sH")  # MAGIC, Poll.version
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+_VOTE_EVENTS = frozenset([EventType.VOTED, EventType.CHANGED_VOTE])
+
+
+class CodecError(ValueError):
+    pass
+
+
+def encode(poll: Poll, events: bool = True) -> bytes:
+    """
+    :param poll:
+    :param events: Whether to include the Poll's events. Without them, it's just the Poll's current state,
+        whose size doesn't grow with its history, e.g. for snapshots.
+    :return: The Poll in the binary format.
+    """
+    w = _Writer()
+
+    # Each person is written once, in a table, and referred to by index everywhere else.
+    # Index 0 means no-one, so the table starts at 1.
+    people: Dict[Optional[SlackUser], int] = {None: 0}
+    for p in [poll.created_by, *poll.people_eligible_to_vote, *poll.people_who_must_vote,
+              *poll.votes.keys(), *(e.person for e in (poll.events if events else ()))]:
+        if p not in people:
+            people[p] = len(people)
+
+    w.varint(len(people) - 1)
+    for p in list(people)[1:]:
+        w.str(p.slack_id)
+
+    w.str(poll.poll_id)
+    w.str(poll.channel)
+    w.str(poll.message_ts)
+    w.varint(poll.poll_type.code)
+    w.varint(poll.status.code)
+    w.varint(people[poll.created_by])
+    w.str(poll.public_text)
+    w.str(poll.private_text)
+    w.varint(poll.number_of_people_who_must_vote)
+    w.datetime(poll.closes_at)
+    w.datetime(poll.reminder_at)
+    w.datetime(poll.opened_at)
+    w.datetime(poll.changed_at)
+    w.varint(poll.events_base if events else poll.revision)
+
+    for attr in PEOPLE_ATTRS:
+        people_list = getattr(poll, attr)
+        w.varint(len(people_list))
+        w.array("I", [people[p] for p in people_list])
+
+    votes = poll.votes
+    w.varint(len(votes))
+    w.array("I", [people[voter] for voter in votes])
+    w.bytes(bytes(choice.code for choice in votes.values()))
+
+    # Events are written a column at a time, so that each column is packed and unpacked in one go.
+    events = poll.events if events else []
+    w.varint(len(events))
+    w.bytes(bytes(e.event_type.code for e in events))
+    w.array("I", [people[e.person] for e in events])
+    w.array("q", [(e.timestamp - _EPOCH) // _MICROSECOND for e in events])
+
+    # Votes are by far the most common events, so store just their choice rather than their data as JSON.
+    w.bytes(bytes(VoteChoice(e.data["choice"]).code for e in events if e.event_type in _VOTE_EVENTS))
+    for e in events:
+        if e.event_type not in _VOTE_EVENTS:
+            w.str(json.dumps(e.data, separators=(",", ":")))
+
+    return _HEADER.pack(MAGIC, Poll.version) + w.getvalue()
+
+
+def decode(data: bytes) -> Poll:
+    """
+    Inverse of encode().
+    :param data:
+    :return:
+    """
+    if len(data) < _HEADER.size:
+        raise CodecError("Too short to be an encoded Poll.")
+
+    magic, version = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CodecError("Not an encoded Poll.")
+
+    decoder = _DECODERS.get(version)
+    if decoder is None:
+        raise CodecError(f"Can't decode a poll of version {version}; this code supports {sorted(_DECODERS)}.")
+
+    try:
+        return decoder(_Reader(data, _HEADER.size))
+    except (IndexError, KeyError, ValueError) as e:
+        raise CodecError(f"Corrupt data: {e}") from e
+
+
+def _decode_v1(r: _Reader) -> Poll:
+    return _decode(r, version=1)
+
+
+def _decode_v2(r: _Reader) -> Poll:
+    return _decode(r, version=2)
+
+
+def _decode_v3(r: _Reader) -> Poll:
+    return _decode(r, version=3)
+
+
+def _decode(r: _Reader, version: int) -> Poll:
+    people = [None] + [SlackUser.intern(r.str()) for _ in range(r.varint())]
+
+    poll_id = r.str()
+    channel, message_ts = (r.str(), r.str()) if version >= 2 else ("", "")
+
+    poll = Poll(poll_id=poll_id,
+                channel=channel,
+                poll_type=PollType.from_code(r.varint()),
+                status=PollStatus.from_code(r.varint()),
+                created_by=people[r.varint()],
+                public_text=r.str(),
+                private_text=r.str(),
+                number_of_people_who_must_vote=r.varint(),
+                closes_at=r.datetime(),
+                reminder_at=r.datetime(),
+                )
+    if version >= 3:
+        poll.opened_at, poll.changed_at, poll.events_base = r.datetime(), r.datetime(), r.varint()
+    poll.people_eligible_to_vote = [people[i] for i in r.array("I", r.varint())]
+    poll.people_who_must_vote = [people[i] for i in r.array("I", r.varint())]
+
+    vote_choices = VoteChoice._members()
+    n = r.varint()
+    voters = r.array("I", n)
+    votes = {people[i]: vote_choices[c] for i, c in zip(voters, r.bytes(n))}
+
+    n = r.varint()
+    event_types = [EventType.from_code(c) for c in r.bytes(n)]
+    persons = r.array("I", n)
+    timestamps = r.array("q", n)
+    choices = iter(r.bytes(sum(1 for t in event_types if t in _VOTE_EVENTS)))
+
+    events = []
+    for event_type, person, us in zip(event_types, persons, timestamps):
+        if event_type in _VOTE_EVENTS:
+            data = {"choice": str(vote_choices[next(choices)])}
+        else:
+            data = json.loads(r.str())
+        events.append(Event(person=people[person],
+                            event_type=event_type,
+                            timestamp=_EPOCH + timedelta(microseconds=us),
+                            data=data))
+
+    # As Poll.from_json_dict() does.
+    poll.message_ts = message_ts
+    poll.events = events
+    if version < 3:
+        poll.opened_at, poll.changed_at = _event_times(events)
+    poll._rebuild_indexes(votes)
+
+    return poll
+
+
+# Poll.version -> decoder for polls written by that version.
+_DECODERS: Dict[int, Callable[[_Reader], Poll]] = {
+    1: _decode_v1,
+    2: _decode_v2,
+    3: _decode_v3,
+}
+
+
+def iter_json(poll: Poll) -> Iterator[str]:
+    """
+    The Poll as JSON, in the same form as Poll.to_json_dict(), generated a piece at a time.
+    Events are generated one by one, so the whole document is never held in memory at once.
+    :param poll:
+    :return: Pieces of JSON, to be concatenated.
+    """
+    # Everything but the events, without its closing brace.
+    head = poll.to_json_dict(events=False)
+    head["events_base"] = poll.events_base
+    yield json.dumps(head)[:-1]
+
+    yield ', "events": ['
+    for i, e in enumerate(poll.events):
+        yield (", " if i else "") + json.dumps(e.to_json_dict())
+    yield "]}"
+
+
+def write_json(poll: Poll, fp: IO[str]) -> None:
+    for piece in iter_json(poll):
+        fp.write(piece)
+
+
+def decode_json(s: str) -> Poll:
+    """
+    Inverse of iter_json() and Poll.to_json_dict().
+    :param s:
+    :return:
+    """
+    d = json.loads(s)
+    if d.get("version", 1) not in _DECODERS:
+        raise CodecError(f"Can't decode a poll of version {d['version']}; this code supports {sorted(_DECODERS)}.")
+
+    return Poll.from_json_dict(d)
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self._buf = bytearray()
+
+    def varint(self, n: int) -> None:
+        # Unsigned LEB128.
+        if n < 0:
+            raise CodecError(f"Can't encode negative number {n}.")
+        while n >= 0x80:
+            self._buf.append((n & 0x7F) | 0x80)
+            n >>= 7
+        self._buf.append(n)
+
+    def str(self, s: str) -> None:
+        b = s.encode("utf-8")
+        self.varint(len(b))
+        self._buf += b
+
+    def datetime(self, dt: Optional[datetime]) -> None:
+        # 0 is None, otherwise microseconds since 1970 (zigzag encoded, so earlier dates work too) plus one.
+        if dt is None:
+            self.varint(0)
+            return
+        us = (dt - _EPOCH) // timedelta(microseconds=1)
+        self.varint(((us << 1) ^ (us >> 63)) + 1)
+
+    def bytes(self, b: bytes) -> None:
+        # The length is written separately, or known from context.
+        self._buf += b
+
+    def array(self, typecode: str, values) -> None:
+        # The length is written separately, or known from context. Always little-endian.
+        a = array(typecode, values)
+        if sys.byteorder == "big":
+            a.byteswap()
+        self._buf += a.tobytes()
+
+    def getvalue(self) -> bytes:
+        return bytes(self._buf)
+
+
+class _Reader:
+    def __init__(self, data: bytes, offset: int = 0) -> None:
+        self._data = memoryview(data)
+        self._pos = offset
+
+    def varint(self) -> int:
+        n = 0
+        shift = 0
+        data = self._data
+        pos = self._pos
+        try:
+            while True:
+                b = data[pos]
+                pos += 1
+                n |= (b & 0x7F) << shift
+                if b < 0x80:
+                    break
+                shift += 7
+        except IndexError:
+            raise CodecError("Truncated data.") from None
+
+        self._pos = pos
+        return n
+
+    def str(self) -> str:
+        n = self.varint()
+        end = self._pos + n
+        if end > len(self._data):
+            raise CodecError("Truncated data.")
+        s = str(self._data[self._pos:end], "utf-8")
+        self._pos = end
+        return s
+
+    def bytes(self, n: int) -> bytes:
+        end = self._pos + n
+        if end > len(self._data):
+            raise CodecError("Truncated data.")
+        b = bytes(self._data[self._pos:end])
+        self._pos = end
+        return b
+
+    def array(self, typecode: str, n: int) -> array:
+        a = array(typecode)
+        a.frombytes(self.bytes(n * a.itemsize))
+        if sys.byteorder == "big":
+            a.byteswap()
+        return a
+
+    def datetime(self) -> Optional[datetime]:
+        z = self.varint()
+        if z == 0:
+            return None
+        z -= 1
+        us = (z >> 1) ^ -(z & 1)
+        return _EPOCH + timedelta(microseconds=us)
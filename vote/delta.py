@@ -0,0 +1,75 @@
+"""
+Compact, reversible deltas between two versions of a piece of text, e.g. a Poll's public_text before and after an edit.
+
+A delta is a list of [position, removed, inserted] operations, in ascending position order,
+where position is an offset into the old text. It's plain JSON, so it can be stored in an Event's data.
+Each operation records the text it removes as well as the text it inserts, so a delta can be inverted
+and applied backwards, to get from a newer version to an older one.
+"""
+from __future__ import annotations
+
+import difflib
+from typing import List
+
+Delta = List[list]
+
+
+def diff(old: str, new: str) -> Delta:
+    """
+    :return: A delta which turns old into new.
+    """
+    # Trim the common prefix and suffix first: most edits touch one spot, and this keeps the matcher's work small.
+    start = 0
+    limit = min(len(old), len(new))
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old[-1 - end] == new[-1 - end]:
+        end += 1
+    old_mid, new_mid = old[start:len(old) - end], new[start:len(new) - end]
+
+    if not old_mid and not new_mid:
+        return []
+
+    delta = []
+    matcher = difflib.SequenceMatcher(None, old_mid, new_mid, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            delta.append([start + i1, old_mid[i1:i2], new_mid[j1:j2]])
+
+    # A rewrite can fragment into many small operations. Don't let it cost more than replacing the lot.
+    if sum(len(removed) + len(inserted) + 8 for _, removed, inserted in delta) > len(old_mid) + len(new_mid) + 8:
+        delta = [[start, old_mid, new_mid]]
+
+    return delta
+
+
+def apply(text: str, delta: Delta) -> str:
+    """
+    :return: text, changed by delta.
+    :raises ValueError: If delta wasn't made from text.
+    """
+    out = []
+    pos = 0
+    for at, removed, inserted in delta:
+        if at < pos or text[at:at + len(removed)] != removed:
+            raise ValueError(f"Delta doesn't apply at position {at}.")
+        out.append(text[pos:at])
+        out.append(inserted)
+        pos = at + len(removed)
+    out.append(text[pos:])
+
+    return "".join(out)
+
+
+def invert(delta: Delta) -> Delta:
+    """
+    :return: A delta which undoes delta, i.e. turns its new text back into its old text.
+    """
+    out = []
+    shift = 0
+    for at, removed, inserted in delta:
+        out.append([at + shift, inserted, removed])
+        shift += len(inserted) - len(removed)
+
+    return out
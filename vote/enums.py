@@ -1,20 +1,47 @@
 from __future__ import annotations
 
 from enum import StrEnum, auto
+from functools import cache
 
 
-class VoteChoice(StrEnum):
+class CodedStrEnum(StrEnum):
+    """
+    A StrEnum whose members also have a small integer code (their position in the class),
+    for compact storage, e.g. one byte per vote.
+    Only ever add new members at the end, or stored codes will change meaning.
+    """
+
+    @classmethod
+    @cache
+    def _members(cls) -> tuple:
+        return tuple(cls)
+
+    @classmethod
+    @cache
+    def _codes(cls) -> dict:
+        return {member: i for i, member in enumerate(cls)}
+
+    @property
+    def code(self) -> int:
+        return self._codes()[self]
+
+    @classmethod
+    def from_code(cls, code: int):
+        return cls._members()[code]
+
+
+class VoteChoice(CodedStrEnum):
     AYE = auto()
     NAY = auto()
     ABSTAIN = auto()
 
 
-class PollType(StrEnum):
+class PollType(CodedStrEnum):
     COMMITTEE_MOTION = auto()
     COMMITTEE_APPROVAL = auto()
 
 
-class PollStatus(StrEnum):
+class PollStatus(CodedStrEnum):
     OPEN = auto()
     PASSED = auto()
     REJECTED = auto()
@@ -22,7 +49,7 @@ class PollStatus(StrEnum):
     LAPSED = auto()
 
 
-class EventType(StrEnum):
+class EventType(CodedStrEnum):
     CREATED = auto()
     EDITED = auto()
     VOTED = auto()
@@ -31,3 +58,5 @@ class EventType(StrEnum):
     MANUALLY_REOPENED = auto()
     AUTO_CLOSED = auto()
     SENT_REMINDER_TO_VOTE = auto()
+    POSTED = auto()
+    ELIGIBILITY_CHANGED = auto()
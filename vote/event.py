@@ -1,25 +1,82 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 
 from vote.enums import EventType
 from vote.slackuser import SlackUser
 
 
-@dataclass
+@dataclass(slots=True)
 class Event:
     person: SlackUser | None
     event_type: EventType
-    timestamp: datetime  # i.e. datetime.utc_now().isoformat()
-    details: str
+    timestamp: datetime  # i.e. datetime.utcnow()
+    data: dict = field(default_factory=dict)  # Structured payload, used to replay the event onto a Poll.
+
+    @property
+    def details(self) -> str:
+        """
+        A human-readable description of the event.
+        Generated from data when needed, rather than stored with every event.
+        :return:
+        """
+        if self.event_type in (EventType.VOTED, EventType.CHANGED_VOTE):
+            return f"Cast vote of {self.data['choice']}"
+
+        if self.event_type is EventType.EDITED and "delta" in self.data:
+            # Just the changed parts. See vote.poll.Poll.value_at() for the whole text.
+            changes = []
+            for _, removed, inserted in self.data["delta"]:
+                if not inserted:
+                    changes.append(f"Removed: {removed!r}")
+                elif not removed:
+                    changes.append(f"Added: {inserted!r}")
+                else:
+                    changes.append(f"Replaced: {removed!r} with {inserted!r}")
+            return f"{self.data['attr']} changed.\n\n" + "\n".join(changes)
+
+        if self.event_type is EventType.EDITED:
+            return (f"{self.data['attr']} changed.\n\n"
+                    f"From:\n\n"
+                    f"{self.data['old']}\n\n"
+                    f"To:\n\n"
+                    f"{self.data['new']}")
+
+        if self.event_type is EventType.SENT_REMINDER_TO_VOTE:
+            return "Reminded people to vote"
+
+        if self.event_type is EventType.POSTED:
+            return "Posted poll message"
+
+        if self.event_type is EventType.ELIGIBILITY_CHANGED:
+            return f"{len(self.data['joined'])} people joined and {len(self.data['left'])} left the channel"
+
+        if "status" in self.data:
+            return f"Poll closed with result {self.data['status']}"
+
+        return str(self.event_type)
 
     def to_json_dict(self) -> dict:
         out = {
-            "person": None if self.person is None else str[self.person],
+            "person": None if self.person is None else str(self.person),
             "event_type": str(self.event_type),
             "timestamp": self.timestamp.isoformat(),
             "details": self.details,
+            "data": self.data,
         }
 
         return out
+
+    @staticmethod
+    def from_json_dict(d: dict) -> Event:
+        """
+        Inverse of to_json_dict().
+        :param d:
+        :return:
+        """
+        return Event(person=None if d["person"] is None else SlackUser.intern(d["person"]),
+                     event_type=EventType(d["event_type"]),
+                     timestamp=datetime.fromisoformat(d["timestamp"]),
+                     data=d.get("data", {}),
+                     )
@@ -0,0 +1,220 @@
+"""
+Exports poll results, votes and audit trails, e.g. for committee minutes.
+
+    python -m vote.export [--store polls] [--kind polls|votes|events] [--format jsonl|csv]
+                          [--since 2023-01-01] [--until 2024-01-01] [--channel C0123] [--status passed] > out
+
+Polls are loaded one at a time, live ones then archived ones, and each row is written as soon as it's generated,
+so memory use doesn't grow with the size of the export. Output goes to stdout, to pipe to a file or compressor.
+If --store holds the per-worker stores of cluster.py, every worker's polls are exported.
+
+The store is opened read-only, so exporting never changes it. An event the bot is part way through appending
+is left out. For an export that's exactly as of one moment, export from a copy of the store, or while the bot is stopped.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import sys
+
+import itertools
+import os
+
+from datetime import datetime
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Union
+
+from vote.enums import PollStatus, VoteChoice
+from vote.poll import Poll
+from vote.store import PollStore
+
+# Columns of each kind of export, in order.
+FIELDS: Dict[str, List[str]] = {
+    "polls": ["poll_id", "channel", "poll_type", "status", "created_by", "public_text",
+              "opened_at", "closed_at", "eligible", *(f"{choice}_votes" for choice in VoteChoice)],
+    "votes": ["poll_id", "voter", "choice"],
+    "events": ["poll_id", "timestamp", "event_type", "person", "details", "data"],
+}
+
+
+def select(polls: Iterable[Poll],
+           since: Optional[datetime] = None,
+           until: Optional[datetime] = None,
+           channel: Optional[str] = None,
+           status: Optional[PollStatus] = None,
+           ) -> Iterator[Poll]:
+    """
+    :param polls:
+    :param since: Only Polls with activity (i.e. events) at or after this time...
+    :param until: ... and before this time.
+    :param channel: Only Polls in this channel.
+    :param status: Only Polls with this status.
+    :return: The matching Polls.
+    """
+    for poll in polls:
+        if channel is not None and poll.channel != channel:
+            continue
+        if status is not None and poll.status is not status:
+            continue
+        if since is not None or until is not None:
+            if poll.opened_at is None:
+                continue
+            if since is not None and poll.changed_at < since:
+                continue
+            if until is not None and poll.opened_at >= until:
+                continue
+        yield poll
+
+
+def poll_rows(polls: Iterable[Poll]) -> Iterator[dict]:
+    """
+    One row per Poll: what it was, and its result.
+    """
+    for poll in polls:
+        row = {
+            "poll_id": poll.poll_id,
+            "channel": poll.channel,
+            "poll_type": str(poll.poll_type),
+            "status": str(poll.status),
+            "created_by": str(poll.created_by),
+            "public_text": poll.public_text,
+            "opened_at": poll.opened_at.isoformat() if poll.opened_at else "",
+            "closed_at": poll.changed_at.isoformat() if poll.changed_at and poll.status is not PollStatus.OPEN else "",
+            "eligible": len(poll.people_eligible_to_vote),
+        }
+        for choice in VoteChoice:
+            row[f"{choice}_votes"] = poll.tallies[choice]
+        yield row
+
+
+def vote_rows(polls: Iterable[Poll]) -> Iterator[dict]:
+    """
+    One row per vote: each person's final vote in each Poll.
+    """
+    for poll in polls:
+        for voter, choice in poll.votes.items():
+            yield {"poll_id": poll.poll_id, "voter": str(voter), "choice": str(choice)}
+
+
+def event_rows(polls: Iterable[Poll],
+               since: Optional[datetime] = None,
+               until: Optional[datetime] = None,
+               ) -> Iterator[dict]:
+    """
+    One row per Event: the audit trail.
+    :param since: Only events at or after this time...
+    :param until: ... and before this time.
+    """
+    for poll in polls:
+        for event in poll.events:
+            if since is not None and event.timestamp < since:
+                continue
+            if until is not None and event.timestamp >= until:
+                continue
+            d = event.to_json_dict()
+            yield {
+                "poll_id": poll.poll_id,
+                "timestamp": d["timestamp"],
+                "event_type": d["event_type"],
+                "person": d["person"] or "",
+                "details": d["details"],
+                "data": json.dumps(d["data"], separators=(",", ":")),
+            }
+
+
+def write_jsonl(rows: Iterable[dict], fp: IO[str]) -> int:
+    """
+    :return: The number of rows written.
+    """
+    n = 0
+    for row in rows:
+        fp.write(json.dumps(row) + "\n")
+        n += 1
+    return n
+
+
+def write_csv(rows: Iterable[dict], fp: IO[str], fields: List[str]) -> int:
+    """
+    :return: The number of rows written.
+    """
+    writer = csv.DictWriter(fp, fieldnames=fields)
+    writer.writeheader()
+    n = 0
+    for row in rows:
+        writer.writerow(row)
+        n += 1
+    return n
+
+
+def open_stores(root: str) -> List[PollStore]:
+    """
+    Open a PollStore read-only, or if root holds the per-worker stores of cluster.py, each of those.
+    """
+    # cluster.py keeps each worker's store in root/worker-N.
+    workers = sorted(name for name in os.listdir(root)
+                     if name.startswith("worker-") and os.path.isdir(os.path.join(root, name)))
+    if not workers:
+        return [PollStore(root, read_only=True)]
+    return [PollStore(os.path.join(root, name), read_only=True) for name in workers]
+
+
+def export(store: Union[PollStore, Iterable[PollStore]],
+           fp: IO[str],
+           kind: str = "polls",
+           fmt: str = "jsonl",
+           since: Optional[datetime] = None,
+           until: Optional[datetime] = None,
+           channel: Optional[str] = None,
+           status: Optional[PollStatus] = None,
+           ) -> int:
+    """
+    Write an export of the Polls in store, live and archived, to fp.
+    :param store: A PollStore, or several, e.g. one per worker. See open_stores().
+    :param fp:
+    :param kind: "polls", "votes" or "events". See FIELDS.
+    :param fmt: "jsonl" or "csv".
+    :return: The number of rows written.
+    """
+    stores = [store] if isinstance(store, PollStore) else store
+    polls = select(itertools.chain.from_iterable(s.iter_all() for s in stores), since=since, until=until, channel=channel, status=status)
+
+    if kind == "polls":
+        rows = poll_rows(polls)
+    elif kind == "votes":
+        rows = vote_rows(polls)
+    elif kind == "events":
+        rows = event_rows(polls, since=since, until=until)
+    else:
+        raise ValueError(f"Unknown kind of export {kind}; expected one of {list(FIELDS)}.")
+
+    if fmt == "jsonl":
+        return write_jsonl(rows, fp)
+    if fmt == "csv":
+        return write_csv(rows, fp, FIELDS[kind])
+    raise ValueError(f"Unknown format {fmt}; expected jsonl or csv.")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export poll results, votes and audit trails.")
+    parser.add_argument("--store", default="polls", help="PollStore directory.")
+    parser.add_argument("--kind", choices=list(FIELDS), default="polls")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="UTC, e.g. 2023-07-01")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="UTC, exclusive.")
+    parser.add_argument("--channel", help="Channel ID")
+    parser.add_argument("--status", type=PollStatus, choices=list(PollStatus))
+    args = parser.parse_args(argv)
+
+    stores = open_stores(args.store)
+    try:
+        n = export(stores, sys.stdout, kind=args.kind, fmt=args.format,
+                   since=args.since, until=args.until, channel=args.channel, status=args.status)
+    finally:
+        for store in stores:
+            store.close()
+
+    print(f"Exported {n} rows.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
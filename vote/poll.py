@@ -2,18 +2,95 @@
 # https://stackoverflow.com/questions/33533148/how-do-i-type-hint-a-method-with-the-type-of-the-enclosing-class
 from __future__ import annotations
 
-import json
+import functools
+import threading
+import uuid
 
 from datetime import datetime
-from typing import List, Dict, Optional
+from enum import Enum
+from typing import Any, Callable, Iterable, List, Dict, Optional, Set
 
+from vote import delta
 from vote.enums import VoteChoice, PollType, PollStatus, EventType
 from vote.event import Event
+from vote.rules import RULES, OutcomeRule
 from vote.slackuser import SlackUser
 
 
+# Attributes which hold lists of SlackUsers, and so need converting to and from JSON.
+PEOPLE_ATTRS = ("people_eligible_to_vote", "people_who_must_vote")
+
+# Attributes which hold enums, and the enum each holds. Stored as their plain str values.
+ENUM_ATTRS = {
+    "poll_type": PollType,
+    "status": PollStatus,
+}
+
+
+def _to_json_value(value: Any) -> Any:
+    """
+    Converts an attribute value of a Poll to something JSON serialisable.
+    :param value:
+    :return:
+    """
+    if isinstance(value, (SlackUser, Enum)):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(v) for v in value]
+    return value
+
+
+def _from_json_value(attr: str, value: Any) -> Any:
+    """
+    Inverse of _to_json_value(), for the Poll attribute named attr.
+    :param attr:
+    :param value:
+    :return:
+    """
+    if attr in PEOPLE_ATTRS:
+        return [SlackUser.intern(v) for v in value]
+    if attr == "created_by":
+        return SlackUser.intern(value)
+    if attr in ENUM_ATTRS:
+        return ENUM_ATTRS[attr](value)
+    if attr in ("closes_at", "reminder_at", "opened_at", "changed_at") and value is not None:
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _event_times(events: List[Event]) -> tuple:
+    """
+    :return: (opened_at, changed_at) of a Poll with these events, for versions which didn't store them.
+    """
+    return (events[0].timestamp, events[-1].timestamp) if events else (None, None)
+
+
+# Polls are locked by stripe, i.e. many Polls share each lock, rather than each Poll having a lock of its own.
+# Changes to different Polls rarely contend, without an extra object per Poll.
+_LOCK_STRIPES = 64
+_LOCKS = [threading.RLock() for _ in range(_LOCK_STRIPES)]
+
+
+def _locked(method):
+    """
+    Runs a Poll method while holding the Poll's lock, so that its check-then-change is atomic.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class Poll:
-    version: int = 1
+    # Version history:
+    # 1 - Initial version.
+    # 2 - Added channel and message_ts.
+    # 3 - Added events_base, opened_at and changed_at, so that a Poll can be stored without its history.
+    version: int = 3
 
     def __init__(self,
                  poll_type: PollType,
@@ -24,38 +101,297 @@ class Poll:
                  number_of_people_who_must_vote: int = 0,
                  people_who_can_vote: Optional[List[SlackUser]] = None,
                  people_who_must_vote: Optional[List[SlackUser]] = None,
+                 poll_id: Optional[str] = None,
+                 closes_at: Optional[datetime] = None,
+                 reminder_at: Optional[datetime] = None,
+                 channel: str = "",
                  ) -> None:
 
+        self.poll_id = uuid.uuid4().hex if poll_id is None else poll_id
         self.poll_type = poll_type
         self.created_by = created_by
         self.status = status
         self.public_text = public_text
         self.private_text = private_text
         self.number_of_people_who_must_vote = number_of_people_who_must_vote
+        self.closes_at = closes_at  # UTC. If the outcome is still undecided at this time, the Poll lapses.
+        self.reminder_at = reminder_at  # UTC. When to remind people who haven't voted yet. Cleared once sent.
+        self.channel = channel  # Slack channel ID the Poll is posted in.
+        self.message_ts = ""  # Timestamp (i.e. ID) of the poll message in the channel, once posted.
 
         self.people_eligible_to_vote: List[SlackUser] = [] if people_who_can_vote is None else people_who_can_vote
         self.people_who_must_vote: List[SlackUser] = [] if people_who_must_vote is None else people_who_must_vote
 
-        self.votes: Dict[SlackUser, VoteChoice] = dict()
         self.events: List[Event] = list()
-
-    def to_json_dict(self) -> str:
+        # How many events came before those in events, e.g. when loaded from a snapshot without its history.
+        # See vote.store.PollStore.load().
+        self.events_base = 0
+        self.opened_at: Optional[datetime] = None  # UTC. When the first event happened.
+        self.changed_at: Optional[datetime] = None  # UTC. When the latest event happened.
+
+        # Called as listener(poll, event) after each event is applied, e.g. to keep indexes up to date.
+        # Not serialised; whoever loads a Poll attaches their own.
+        self.listeners: List[Callable[[Poll, Event], None]] = list()
+
+        # Votes are stored compactly: each eligible voter has a slot (their index in people_eligible_to_vote),
+        # and _vote_codes holds one byte per slot: 0 for no vote, otherwise VoteChoice.code + 1.
+        # Votes by anyone without a slot (e.g. no longer eligible after an edit) go in _other_votes.
+        # Use vote_of() or the votes property to read them.
+        self._slots: Dict[SlackUser, int] = dict()
+        self._vote_codes = bytearray()
+        self._other_votes: Dict[SlackUser, VoteChoice] = dict()
+
+        # Indexes derived from the above, kept up to date by apply_event() so that checks are O(1) per vote.
+        # people_eligible_to_vote and people_who_must_vote should only be changed via edit(), which keeps these in step.
+        self._must_vote_outstanding: Set[SlackUser] = set()
+        self._eligible_voted: int = 0
+        self.tallies: Dict[VoteChoice, int] = dict()
+        self._rebuild_indexes(votes={})
+
+    def to_json_dict(self, events: bool = True) -> dict:
+        """
+        :param events: Whether to include the events. See also vote.codec.iter_json(), which streams them.
+        :return: The Poll as a JSON serialisable dict.
+        """
         out = dict()
 
-        # out["poll_type"] = str(self.poll_type)
+        out["version"] = self.version
+        out["poll_id"] = self.poll_id
 
         for attr in ["poll_type", "status", "created_by"]:
             out[attr] = str(self.__dict__[attr])
 
-        for attr in ["public_text", "private_text", "number_of_people_who_must_vote"]:
+        for attr in ["public_text", "private_text", "number_of_people_who_must_vote", "channel", "message_ts"]:
             out[attr] = self.__dict__[attr]
 
+        for attr in PEOPLE_ATTRS + ("closes_at", "reminder_at"):
+            out[attr] = _to_json_value(self.__dict__[attr])
+
         out["votes"] = {str(slack_user): str(vote_choice) for slack_user, vote_choice in self.votes.items()}
 
-        out["events"] = [event.to_json_dict() for event in self.events]
+        out["opened_at"] = _to_json_value(self.opened_at)
+        out["changed_at"] = _to_json_value(self.changed_at)
+        # Without its events, the Poll still knows how many it had.
+        out["events_base"] = self.events_base if events else self.revision
+        if events:
+            out["events"] = [event.to_json_dict() for event in self.events]
+
+        return out
+
+    @staticmethod
+    def from_json_dict(d: dict) -> Poll:
+        """
+        Inverse of to_json_dict().
+        :param d:
+        :return:
+        """
+        if d.get("version", 1) > Poll.version:
+            raise ValueError(f"Can't load a poll of version {d['version']}; this code supports up to {Poll.version}.")
+
+        poll = Poll(poll_type=PollType(d["poll_type"]),
+                    created_by=SlackUser.intern(d["created_by"]),
+                    status=PollStatus(d["status"]),
+                    public_text=d["public_text"],
+                    private_text=d["private_text"],
+                    number_of_people_who_must_vote=d["number_of_people_who_must_vote"],
+                    people_who_can_vote=_from_json_value("people_eligible_to_vote", d["people_eligible_to_vote"]),
+                    people_who_must_vote=_from_json_value("people_who_must_vote", d["people_who_must_vote"]),
+                    poll_id=d["poll_id"],
+                    closes_at=_from_json_value("closes_at", d.get("closes_at")),
+                    reminder_at=_from_json_value("reminder_at", d.get("reminder_at")),
+                    channel=d.get("channel", ""),
+                    )
+        poll.message_ts = d.get("message_ts", "")
+
+        poll.events = [Event.from_json_dict(e) for e in d.get("events", ())]
+        poll.events_base = d.get("events_base", 0)
+        poll.opened_at, poll.changed_at = _event_times(poll.events)
+        if "opened_at" in d:
+            poll.opened_at = _from_json_value("opened_at", d["opened_at"])
+            poll.changed_at = _from_json_value("changed_at", d["changed_at"])
+        poll._rebuild_indexes(votes={SlackUser.intern(k): VoteChoice(v) for k, v in d["votes"].items()})
+
+        return poll
+
+    @_locked
+    def apply_event(self, event: Event) -> None:
+        """
+        Applies an Event's change of state to this Poll, and appends it to the Poll's history.
+        All mutations of a Poll go through here, so that a Poll can be rebuilt by replaying its events,
+        e.g. by vote.store.PollStore.
+        :param event:
+        :return:
+        """
+        if event.event_type in (EventType.VOTED, EventType.CHANGED_VOTE):
+            voter = event.person
+            choice = VoteChoice(event.data["choice"])
+
+            old_choice = self.vote_of(voter)
+            if old_choice is None:
+                if voter in self._slots:
+                    self._eligible_voted += 1
+            else:
+                self.tallies[old_choice] -= 1
+
+            self._set_vote(voter, choice)
+            self.tallies[choice] += 1
+            self._must_vote_outstanding.discard(voter)
+
+        elif event.event_type is EventType.EDITED:
+            k = event.data["attr"]
+            if "delta" in event.data:
+                self.__dict__[k] = delta.apply(self.__dict__[k], event.data["delta"])
+            elif k in PEOPLE_ATTRS:
+                votes = self.votes
+                self.__dict__[k] = _from_json_value(k, event.data["new"])
+                self._rebuild_indexes(votes)
+            else:
+                self.__dict__[k] = _from_json_value(k, event.data["new"])
+
+        elif event.event_type is EventType.SENT_REMINDER_TO_VOTE:
+            self.reminder_at = None
+
+        elif event.event_type is EventType.POSTED:
+            self.channel = event.data["channel"]
+            self.message_ts = event.data["ts"]
+
+        elif event.event_type is EventType.ELIGIBILITY_CHANGED:
+            votes = self.votes
+            left = {SlackUser.intern(p) for p in event.data["left"]}
+            people = [p for p in self.people_eligible_to_vote if p not in left]
+            existing = set(people)
+            people.extend(p for p in map(SlackUser.intern, event.data["joined"]) if p not in existing)
+            self.people_eligible_to_vote = people
+            self._rebuild_indexes(votes)
+
+        if "status" in event.data:
+            self.status = PollStatus(event.data["status"])
+
+        self.events.append(event)
+        if self.opened_at is None:
+            self.opened_at = event.timestamp
+        self.changed_at = event.timestamp
+
+        for listener in self.listeners:
+            listener(self, event)
+
+    def _rebuild_indexes(self, votes: Dict[SlackUser, VoteChoice]) -> None:
+        """
+        Recomputes vote slots, the eligibility index and vote tallies from scratch.
+        Only needed when the lists of people change, or after loading.
+        :param votes: Every vote cast so far.
+        :return:
+        """
+        self._slots = dict()
+        for p in self.people_eligible_to_vote:
+            self._slots.setdefault(p, len(self._slots))
+
+        self._vote_codes = bytearray(len(self._slots))
+        self._other_votes = dict()
+        for voter, choice in votes.items():
+            self._set_vote(voter, choice)
+
+        self._must_vote_outstanding = set(self.people_who_must_vote) - votes.keys()
+        self._eligible_voted = sum(1 for voter in votes if voter in self._slots)
+
+        self.tallies = {choice: 0 for choice in VoteChoice}
+        for choice in votes.values():
+            self.tallies[choice] += 1
+
+    def _set_vote(self, voter: SlackUser, choice: VoteChoice) -> None:
+        slot = self._slots.get(voter)
+        if slot is None:
+            self._other_votes[voter] = choice
+        else:
+            self._vote_codes[slot] = choice.code + 1
+
+    def vote_of(self, voter: SlackUser) -> Optional[VoteChoice]:
+        """
+        :param voter:
+        :return: The person's vote, or None if they haven't voted.
+        """
+        slot = self._slots.get(voter)
+        if slot is None:
+            return self._other_votes.get(voter)
+
+        code = self._vote_codes[slot]
+        return None if code == 0 else VoteChoice.from_code(code - 1)
+
+    @property
+    def votes(self) -> Dict[SlackUser, VoteChoice]:
+        """
+        :return: Everyone's votes, as a new dict. Use vote_of() to look up one person.
+        """
+        out = dict()
+        for voter, slot in self._slots.items():
+            code = self._vote_codes[slot]
+            if code:
+                out[voter] = VoteChoice.from_code(code - 1)
+        out.update(self._other_votes)
 
         return out
 
+    @property
+    def lock(self) -> threading.RLock:
+        """
+        Held while the Poll changes. Hold it to read several attributes consistently, e.g. to render the Poll.
+        Votes on different Polls don't wait for each other, except when they happen to share a lock stripe.
+        """
+        return _LOCKS[hash(self.poll_id) % _LOCK_STRIPES]
+
+    @property
+    def revision(self) -> int:
+        """
+        :return: A number which increases with every change to the Poll, i.e. how many events it has.
+        """
+        return self.events_base + len(self.events)
+
+    @_locked
+    def value_at(self, attr: str, revision: int) -> Any:
+        """
+        An attribute's value as it was at an earlier revision, e.g. to show an edit in full.
+        Undoes the edits made since then, newest first.
+        :param attr: E.g. "public_text"
+        :param revision: Number of events, e.g. the index of an EDITED event for its value before the edit,
+            or one more for its value after.
+        :return:
+        :raises ValueError: If the events since revision aren't loaded. See events_base.
+        """
+        if revision < self.events_base:
+            raise ValueError(f"Revision {revision} is before the loaded events, which start at {self.events_base}.")
+
+        value = _to_json_value(self.__dict__[attr])
+        for event in reversed(self.events[revision - self.events_base:]):
+            if event.event_type is EventType.EDITED and event.data["attr"] == attr:
+                if "delta" in event.data:
+                    value = delta.apply(value, delta.invert(event.data["delta"]))
+                else:
+                    value = event.data["old"]
+
+        return _from_json_value(attr, value)
+
+    @property
+    def outcome_rule(self) -> OutcomeRule:
+        return RULES[self.poll_type]
+
+    def is_eligible(self, voter: SlackUser) -> bool:
+        return voter in self._slots
+
+    @property
+    def must_vote_outstanding(self) -> Set[SlackUser]:
+        """
+        :return: The people who must vote but haven't voted yet. Don't modify the returned set.
+        """
+        return self._must_vote_outstanding
+
+    @property
+    def number_yet_to_vote(self) -> int:
+        """
+        :return: How many eligible people haven't voted yet.
+        """
+        return len(self._slots) - self._eligible_voted
+
+    @_locked
     def cast_vote(self, voter: SlackUser, choice: VoteChoice) -> None:
         """
         Records a person's vote in a Poll.
@@ -68,22 +404,24 @@ class Poll:
         if self.status is not PollStatus.OPEN:
             raise ValueError(f"Can't vote on a poll whose status is {self.status}.")
 
-        if voter not in self.people_eligible_to_vote:
+        if not self.is_eligible(voter):
             raise ValueError(f"Voter {voter} is not eligible to vote in this poll.")
 
-        if voter not in self.votes:
+        if self.vote_of(voter) is None:
             event_type = EventType.VOTED
         else:
             event_type = EventType.CHANGED_VOTE
 
-        self.votes[voter] = choice
-
         event = Event(person=voter,
                       event_type=event_type,
-                      timestamp=datetime.utcnow().isoformat(),
-                      details=f"Cast vote of {choice}"
+                      timestamp=datetime.utcnow(),
+                      data={"choice": str(choice)},
                       )
+        self.apply_event(event)
+
+        self._close_if_decided()
 
+    @_locked
     def edit(self, person: SlackUser, **changes) -> None:
         """
         Records an edit made to any of the parameters of a Poll.
@@ -102,23 +440,29 @@ class Poll:
             assert k in self.__dict__
 
             old_v = self.__dict__[k]
+            if k in ENUM_ATTRS:
+                new_v = ENUM_ATTRS[k](new_v)
+
+            if isinstance(old_v, str) and isinstance(new_v, str) and k not in ENUM_ATTRS:
+                # Only the changed parts of the text, rather than two full copies. See value_at().
+                data = {"attr": k, "delta": delta.diff(old_v, new_v)}
+            else:
+                data = {"attr": k, "old": _to_json_value(old_v), "new": _to_json_value(new_v)}
 
             event = Event(person=person,
                           event_type=EventType.EDITED,
-                          timestamp=datetime.utcnow().isoformat(),
-                          details=f"{k} changed.\n\n"
-                                  f"From:\n\n"
-                                  f"{old_v}\n\n"
-                                  f"To:\n\n"
-                                  f"{new_v}",
+                          timestamp=datetime.utcnow(),
+                          data=data,
                           )
-            self.events.append(event)
+            self.apply_event(event)
 
             # FIXME: Advertise change as a threaded reply to the poll message
 
-            self.__dict__[k] = new_v
+        # E.g. lowering the number of approvers needed may mean the Poll has now passed.
+        self._close_if_decided()
 
-    def cron(self) -> None:
+    @_locked
+    def cron(self, now: Optional[datetime] = None) -> None:
         """
         Perform regular scheduled actions.
 
@@ -126,11 +470,93 @@ class Poll:
 
         * Remind people to vote if they haven't voted yet.
 
+        :param now: Current UTC time. Defaults to datetime.utcnow().
         :return: None.
         """
-        pass
+        if self.status is not PollStatus.OPEN:
+            return
+
+        now = datetime.utcnow() if now is None else now
+
+        if self.closes_at is not None and now >= self.closes_at:
+            self._set_outcome(self.outcome_rule.at_deadline(self), EventType.AUTO_CLOSED, person=None, now=now)
+            return
+
+        if self.reminder_at is not None and now >= self.reminder_at:
+            self.remind(now=now)
 
-    def close(self, person: SlackUser):
+    @_locked
+    def posted(self, channel: str, ts: str) -> None:
+        """
+        Records where the poll message was posted, so that it can be updated later.
+        :param channel: Channel ID
+        :param ts: The message's timestamp, as returned by chat.postMessage.
+        :return:
+        """
+        event = Event(person=None,
+                      event_type=EventType.POSTED,
+                      timestamp=datetime.utcnow(),
+                      data={"channel": channel, "ts": ts},
+                      )
+        self.apply_event(event)
+
+    @_locked
+    def update_eligibility(self,
+                           joined: Iterable[SlackUser] = (),
+                           left: Iterable[SlackUser] = (),
+                           now: Optional[datetime] = None,
+                           ) -> None:
+        """
+        Follows changes to the channel's membership: people who join can vote, people who leave no longer need to.
+        Votes already cast by people who leave still count.
+        :param joined:
+        :param left: Including people whose accounts were deactivated.
+        :param now:
+        :return:
+        """
+        if self.status is not PollStatus.OPEN:
+            return
+
+        joined = [str(p) for p in joined if not self.is_eligible(p)]
+        left = [str(p) for p in left if self.is_eligible(p)]
+        if not joined and not left:
+            return
+
+        event = Event(person=None,
+                      event_type=EventType.ELIGIBILITY_CHANGED,
+                      timestamp=datetime.utcnow() if now is None else now,
+                      data={"joined": joined, "left": left},
+                      )
+        self.apply_event(event)
+
+        # E.g. the last person yet to vote may have left.
+        self._close_if_decided()
+
+    def people_yet_to_vote(self) -> List[SlackUser]:
+        """
+        :return: Eligible people who haven't voted, in the order they're listed in people_eligible_to_vote.
+        """
+        return [p for p in self.people_eligible_to_vote if self.vote_of(p) is None]
+
+    @_locked
+    def remind(self, now: Optional[datetime] = None) -> Event:
+        """
+        Records that the people who haven't voted yet have been reminded to vote.
+        The reminders themselves are sent by whoever handles the returned Event, e.g. as DMs.
+        :param now:
+        :return: The SENT_REMINDER_TO_VOTE Event. data["to"] lists the Slack IDs to remind.
+        """
+        event = Event(person=None,
+                      event_type=EventType.SENT_REMINDER_TO_VOTE,
+                      timestamp=datetime.utcnow() if now is None else now,
+                      data={"to": [str(p) for p in self.people_yet_to_vote()]},
+                      )
+        self.apply_event(event)
+
+        return event
+
+    @_locked
+    def close(self, person: SlackUser, now: Optional[datetime] = None) -> None:
         """
         Closes a Poll so that:
 
@@ -145,27 +571,39 @@ class Poll:
         The event is advertised as a thread reply to the poll message.
         :return:
         """
-        pass
-
-    # @staticmethod
-    # def from_json(json_str: str) -> Poll:
-    #     """
-    #     Deserialise.
-    #     (Or will jsonpickle do this for us??)
-    #     :param json_str:
-    #     :return:
-    #     """
-    #     return Poll(poll_type=None,
-    #                 public_text=None,
-    #                 private_text=None,
-    #                 number_of_people_who_must_vote=None,
-    #                 people_eligible_to_vote=None,
-    #                 people_who_must_vote=None,
-    #                 votes=None,
-    #                 events=None,
-    #                 version=None,
-    #                 )
-    #     pass
+        if self.status is not PollStatus.OPEN:
+            raise ValueError(f"Can't close a poll whose status is {self.status}.")
+
+        if person != self.created_by:
+            raise ValueError(f"Person {person} can't close this poll. "
+                             f"Only the creator, {self.created_by}, can close this poll.")
+
+        status = self.outcome_rule.evaluate(self) or PollStatus.CLOSED_EARLY
+        self._set_outcome(status, EventType.MANUALLY_CLOSED, person=person, now=now)
+
+        # FIXME: Advertise result as a threaded reply to the poll message
+
+    def _close_if_decided(self) -> None:
+        """
+        Closes the Poll as soon as its outcome is certain, e.g. on the first `Nay` to a motion.
+        :return:
+        """
+        status = self.outcome_rule.evaluate(self)
+        if status is not None:
+            self._set_outcome(status, EventType.AUTO_CLOSED, person=None)
+
+    def _set_outcome(self,
+                     status: PollStatus,
+                     event_type: EventType,
+                     person: Optional[SlackUser],
+                     now: Optional[datetime] = None,
+                     ) -> None:
+        event = Event(person=person,
+                      event_type=event_type,
+                      timestamp=datetime.utcnow() if now is None else now,
+                      data={"status": str(status)},
+                      )
+        self.apply_event(event)
 
 # a = Vote(vote_type="a",
 #          vote_public_text="b",
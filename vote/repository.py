@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import bisect
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from vote.enums import PollStatus, PollType
+from vote.event import Event
+from vote.poll import Poll
+from vote.slackuser import SlackUser
+
+
+class _Keys(NamedTuple):
+    # The attributes of a Poll which it's indexed by.
+    channel: str
+    created_by: SlackUser
+    status: PollStatus
+    poll_type: PollType
+    closes_at: Optional[datetime]
+
+    @staticmethod
+    def of(poll: Poll) -> _Keys:
+        return _Keys(poll.channel, poll.created_by, poll.status, poll.poll_type, poll.closes_at)
+
+
+class PollRepository:
+    """
+    Every Poll, by ID, with secondary indexes on channel, creator, status, type and deadline.
+
+    The indexes are kept up to date by listening to each Poll's events, so lookups never scan every Poll,
+    however many closed Polls pile up. Most events (e.g. votes) don't change any indexed attribute,
+    and cost one tuple comparison.
+
+    Only open Polls are in the deadline index, as it's used to find Polls which are about to close.
+    """
+
+    def __init__(self) -> None:
+        self._polls: Dict[str, Poll] = dict()
+        self._keys: Dict[str, _Keys] = dict()
+
+        self._by_channel: Dict[str, Set[str]] = defaultdict(set)
+        self._by_creator: Dict[SlackUser, Set[str]] = defaultdict(set)
+        self._by_status: Dict[PollStatus, Set[str]] = defaultdict(set)
+        self._by_type: Dict[PollType, Set[str]] = defaultdict(set)
+        self._deadlines: List[tuple] = []  # Sorted (closes_at, poll_id) of open Polls.
+
+        self._lock = threading.RLock()
+
+    def add(self, poll: Poll) -> None:
+        """
+        Start indexing a Poll, and keep indexing it as it changes.
+        :param poll:
+        :return:
+        """
+        with self._lock:
+            if poll.poll_id in self._polls:
+                return
+            self._polls[poll.poll_id] = poll
+            self._index(poll.poll_id, _Keys.of(poll))
+
+        poll.listeners.append(self._on_event)
+
+    def discard(self, poll_id: str) -> None:
+        """
+        Stop holding and indexing a Poll, e.g. once it's been archived.
+        """
+        with self._lock:
+            poll = self._polls.pop(poll_id, None)
+            if poll is None:
+                return
+            self._unindex(poll_id, self._keys.pop(poll_id))
+
+        if self._on_event in poll.listeners:
+            poll.listeners.remove(self._on_event)
+
+    def get(self, poll_id: str) -> Poll | None:
+        return self._polls.get(poll_id)
+
+    def __contains__(self, poll_id: str) -> bool:
+        return poll_id in self._polls
+
+    def __len__(self) -> int:
+        return len(self._polls)
+
+    def find(self,
+             channel: Optional[str] = None,
+             created_by: Optional[SlackUser] = None,
+             status: Optional[PollStatus] = None,
+             poll_type: Optional[PollType] = None,
+             ) -> List[Poll]:
+        """
+        Polls matching all of the given criteria, e.g. find(channel=..., status=PollStatus.OPEN).
+        Costs in proportion to the smallest matching index, not the number of Polls.
+        :return: In no particular order.
+        """
+        with self._lock:
+            candidates = []
+            if channel is not None:
+                candidates.append(self._by_channel.get(channel, set()))
+            if created_by is not None:
+                candidates.append(self._by_creator.get(created_by, set()))
+            if status is not None:
+                candidates.append(self._by_status.get(status, set()))
+            if poll_type is not None:
+                candidates.append(self._by_type.get(poll_type, set()))
+
+            if not candidates:
+                return list(self._polls.values())
+
+            candidates.sort(key=len)
+            ids = candidates[0].intersection(*candidates[1:])
+            return [self._polls[i] for i in ids]
+
+    def closing_between(self, start: datetime, end: datetime) -> List[Poll]:
+        """
+        Open Polls whose closes_at is at or after start, and before end, e.g. those lapsing in the next hour.
+        :return: Soonest first.
+        """
+        with self._lock:
+            lo = bisect.bisect_left(self._deadlines, (start,))
+            hi = bisect.bisect_left(self._deadlines, (end,))
+            return [self._polls[poll_id] for _, poll_id in self._deadlines[lo:hi]]
+
+    def _on_event(self, poll: Poll, event: Event) -> None:
+        keys = _Keys.of(poll)
+        with self._lock:
+            old = self._keys.get(poll.poll_id)
+            if old == keys:
+                return
+            self._unindex(poll.poll_id, old)
+            self._index(poll.poll_id, keys)
+
+    def _index(self, poll_id: str, keys: _Keys) -> None:
+        self._keys[poll_id] = keys
+        self._by_channel[keys.channel].add(poll_id)
+        self._by_creator[keys.created_by].add(poll_id)
+        self._by_status[keys.status].add(poll_id)
+        self._by_type[keys.poll_type].add(poll_id)
+        if keys.status is PollStatus.OPEN and keys.closes_at is not None:
+            bisect.insort(self._deadlines, (keys.closes_at, poll_id))
+
+    def _unindex(self, poll_id: str, keys: _Keys) -> None:
+        self._by_channel[keys.channel].discard(poll_id)
+        self._by_creator[keys.created_by].discard(poll_id)
+        self._by_status[keys.status].discard(poll_id)
+        self._by_type[keys.poll_type].discard(poll_id)
+        if keys.status is PollStatus.OPEN and keys.closes_at is not None:
+            i = bisect.bisect_left(self._deadlines, (keys.closes_at, poll_id))
+            if i < len(self._deadlines) and self._deadlines[i] == (keys.closes_at, poll_id):
+                del self._deadlines[i]
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from typing import Dict, Optional, TYPE_CHECKING
+
+from vote.enums import VoteChoice, PollType, PollStatus
+
+if TYPE_CHECKING:
+    from vote.poll import Poll
+
+
+class OutcomeRule:
+    """
+    Decides the outcome of a Poll.
+
+    evaluate() is called after every change to a Poll, so it must only use the Poll's running tallies and indexes,
+    never recount its votes.
+    """
+
+    def evaluate(self, poll: Poll) -> Optional[PollStatus]:
+        """
+        :param poll:
+        :return: The outcome, if it's already certain no matter how anyone else votes. Otherwise None.
+        """
+        raise NotImplementedError
+
+    def at_deadline(self, poll: Poll) -> PollStatus:
+        """
+        :param poll:
+        :return: The outcome of a Poll which has reached its deadline.
+        """
+        return self.evaluate(poll) or PollStatus.LAPSED
+
+
+class OnlineMotionRule(OutcomeRule):
+    """
+    * To pass, every person in the channel must vote `Aye` or `Abstain`.
+    * To pass, at least min_ayes people must vote `Aye`.
+    * Any `Nay` vote causes the motion to fail.
+    """
+
+    def __init__(self, min_ayes: int = 4) -> None:
+        self.min_ayes = min_ayes
+
+    def evaluate(self, poll: Poll) -> Optional[PollStatus]:
+        if poll.tallies[VoteChoice.NAY] > 0:
+            return PollStatus.REJECTED
+
+        if poll.number_yet_to_vote > 0:
+            return None
+
+        if poll.tallies[VoteChoice.AYE] >= self.min_ayes:
+            return PollStatus.PASSED
+
+        # Everyone has voted, but too many abstained.
+        return PollStatus.REJECTED
+
+
+class ApprovalRule(OutcomeRule):
+    """
+    * To pass, number_of_people_who_must_vote people must vote `Approve` (i.e. VoteChoice.AYE).
+    * Every one of people_who_must_vote must vote `Approve`.
+    * Voting `Object` (i.e. VoteChoice.NAY) records an objection, but doesn't fail the Poll.
+    """
+
+    def evaluate(self, poll: Poll) -> Optional[PollStatus]:
+        if poll.tallies[VoteChoice.AYE] < poll.number_of_people_who_must_vote:
+            return None
+
+        if poll.must_vote_outstanding:
+            return None
+
+        # Everyone required has voted, so check they approved. This is a handful of people, e.g. the office holders.
+        for person in poll.people_who_must_vote:
+            if poll.vote_of(person) is not VoteChoice.AYE:
+                return None
+
+        return PollStatus.PASSED
+
+
+RULES: Dict[PollType, OutcomeRule] = {
+    PollType.COMMITTEE_MOTION: OnlineMotionRule(),
+    PollType.COMMITTEE_APPROVAL: ApprovalRule(),
+}
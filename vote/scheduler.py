@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import heapq
+import json
+import logging as log
+import os
+import threading
+
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from util.metrics import REGISTRY
+from vote.enums import PollStatus
+from vote.event import Event
+from vote.poll import Poll
+
+LAG_SECONDS = REGISTRY.histogram("scheduler_lag_seconds", "How late timers fired, after their due time.",
+                                 labels=("kind",), buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 3600.0))
+
+# The kinds of timer a Poll can have, and the Poll attribute holding each one's due time.
+TIMER_ATTRS = {
+    "close": "closes_at",
+    "remind": "reminder_at",
+}
+
+
+class Scheduler:
+    """
+    Calls Poll.cron() on Polls whose deadline or reminder is due, and only on those.
+
+    Pending timers are kept in a heap ordered by due time, so a tick costs O(log n) per timer that fires,
+    and nothing for Polls which have nothing due.
+    Rescheduling a timer leaves the old heap entry in place; it's recognised as stale and skipped when it surfaces.
+
+    If state_path is given, the pending timers are saved there, and reloaded by load(),
+    so that deadlines which fall due while the bot is down are caught up on restart.
+    Polls are the authority on their own timers: schedule() overrides anything load() restored for the same Poll.
+    """
+
+    def __init__(self,
+                 get_poll: Callable[[str], Optional[Poll]],
+                 on_fired: Optional[Callable[[Poll, List[Event]], None]] = None,
+                 state_path: Optional[str] = None,
+                 ) -> None:
+        """
+        :param get_poll: Looks up a Poll by its ID. Returns None if the Poll no longer exists.
+        :param on_fired: Called with the Poll and the Events it added, if Poll.cron() did anything,
+            e.g. to save the Poll and send reminders.
+        :param state_path: JSON file to persist pending timers in.
+        """
+        self.get_poll = get_poll
+        self.on_fired = on_fired
+        self.state_path = state_path
+
+        self._heap: List[Tuple[datetime, str, str]] = []
+        self._due: Dict[Tuple[str, str], datetime] = dict()
+        self._dirty = False
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+
+        self.stats = {
+            "fired": 0,
+            "last_lag_seconds": 0.0,
+            "max_lag_seconds": 0.0,
+        }
+
+    def schedule(self, poll: Poll) -> None:
+        """
+        (Re)schedule a Poll's timers from its closes_at and reminder_at. Call this whenever those change.
+        :param poll:
+        :return:
+        """
+        with self._lock:
+            for kind, attr in TIMER_ATTRS.items():
+                due = getattr(poll, attr) if poll.status is PollStatus.OPEN else None
+                self._set(poll.poll_id, kind, due)
+
+            self._wakeup.notify()
+
+    def unschedule(self, poll_id: str) -> None:
+        with self._lock:
+            for kind in TIMER_ATTRS:
+                self._set(poll_id, kind, None)
+
+    def pending(self) -> int:
+        return len(self._due)
+
+    def next_due(self) -> Optional[datetime]:
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def run_due(self, now: Optional[datetime] = None) -> int:
+        """
+        Fire every timer which is due.
+        :param now: Current UTC time. Defaults to datetime.utcnow().
+        :return: The number of timers fired.
+        """
+        now = datetime.utcnow() if now is None else now
+        fired = 0
+
+        while True:
+            with self._lock:
+                self._drop_stale()
+                if not self._heap or self._heap[0][0] > now:
+                    break
+
+                due, poll_id, kind = heapq.heappop(self._heap)
+                del self._due[(poll_id, kind)]
+                self._dirty = True
+
+            lag = (now - due).total_seconds()
+            self.stats["fired"] += 1
+            self.stats["last_lag_seconds"] = lag
+            self.stats["max_lag_seconds"] = max(self.stats["max_lag_seconds"], lag)
+            LAG_SECONDS.observe(lag, kind=kind)
+            fired += 1
+
+            poll = self.get_poll(poll_id)
+            if poll is None:
+                log.warning(f"Scheduler: {kind} timer fired for unknown poll {poll_id}")
+                continue
+
+            try:
+                with poll.lock:
+                    n_events = len(poll.events)
+                    poll.cron(now=now)
+                    new_events = poll.events[n_events:]
+                if new_events and self.on_fired is not None:
+                    self.on_fired(poll, new_events)
+            except Exception as e:
+                log.error(f"Scheduler: {kind} timer for poll {poll_id} failed: {e}")
+
+            # E.g. a reminder may have fired, leaving the close timer still to come.
+            self.schedule(poll)
+
+        self.save()
+
+        return fired
+
+    def run_forever(self, stop: threading.Event, max_sleep: float = 60.0) -> None:
+        """
+        Fire timers as they fall due, until stop is set. Intended to run in its own thread.
+        :param stop:
+        :param max_sleep: Upper bound on how long to sleep, so that stop is noticed promptly.
+        :return:
+        """
+        while not stop.is_set():
+            self.run_due()
+
+            with self._lock:
+                self._drop_stale()
+                timeout = max_sleep
+                if self._heap:
+                    timeout = min(max_sleep, max(0.0, (self._heap[0][0] - datetime.utcnow()).total_seconds()))
+                self._wakeup.wait(timeout=timeout)
+
+    def save(self) -> None:
+        """
+        Persist pending timers to state_path, if they've changed since the last save.
+        :return:
+        """
+        if self.state_path is None:
+            return
+
+        with self._lock:
+            if not self._dirty:
+                return
+            timers = [[poll_id, kind, due.isoformat()] for (poll_id, kind), due in self._due.items()]
+            self._dirty = False
+
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"timers": timers}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def load(self) -> None:
+        """
+        Restore pending timers saved by save().
+        :return:
+        """
+        if self.state_path is None or not os.path.exists(self.state_path):
+            return
+
+        with open(self.state_path, "r") as f:
+            timers = json.load(f)["timers"]
+
+        with self._lock:
+            for poll_id, kind, due in timers:
+                self._set(poll_id, kind, datetime.fromisoformat(due))
+            self._dirty = False
+
+    def _set(self, poll_id: str, kind: str, due: Optional[datetime]) -> None:
+        key = (poll_id, kind)
+        if self._due.get(key) == due:
+            return
+
+        self._dirty = True
+        if due is None:
+            self._due.pop(key, None)
+        else:
+            self._due[key] = due
+            heapq.heappush(self._heap, (due, poll_id, kind))
+
+    def _drop_stale(self) -> None:
+        # Heap entries which have been rescheduled or unscheduled since they were pushed.
+        while self._heap:
+            due, poll_id, kind = self._heap[0]
+            if self._due.get((poll_id, kind)) == due:
+                return
+            heapq.heappop(self._heap)
@@ -1,12 +1,31 @@
 from __future__ import annotations
 
+import sys
+import weakref
 from dataclasses import dataclass
 
 
-@dataclass
+# Frozen so that it is hashable, e.g. as a key in Poll.votes.
+@dataclass(frozen=True, slots=True, weakref_slot=True)
 class SlackUser:
     slack_id: str
 
+    @staticmethod
+    def intern(slack_id: str) -> SlackUser:
+        """
+        Returns the one shared SlackUser for the given Slack ID, creating it if needed.
+        Use this rather than SlackUser(...) when loading many users, so that every Poll
+        referring to a person shares one object, rather than each having its own copy.
+        :param slack_id:
+        :return:
+        """
+        user = _registry.get(slack_id)
+        if user is None:
+            user = SlackUser(slack_id=sys.intern(slack_id))
+            _registry[user.slack_id] = user
+
+        return user
+
     def lookup(self):
         """
         Looks up a Slack user's details (e.g. display name).
@@ -19,7 +38,12 @@ class SlackUser:
         :param format_spec:
         :return: Slack user's name and ID in a human-readable format, e.g. "Jane Doe (DEADBEEF01)".
         """
-        pass
+        # FIXME: Include the user's name, once lookup() is implemented.
+        return format(str(self), format_spec)
 
     def __str__(self) -> str:
-        return self.slack_id
\ No newline at end of file
+        return self.slack_id
+
+
+# Slack ID -> SlackUser, for SlackUser.intern(). Entries disappear once nothing else refers to the SlackUser.
+_registry: weakref.WeakValueDictionary[str, SlackUser] = weakref.WeakValueDictionary()
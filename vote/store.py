@@ -0,0 +1,446 @@
+from __future__ import annotations
+
+import json
+import logging as log
+import os
+import shutil
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from vote import codec
+from vote.archive import PollArchive, fsync_dir
+from vote.enums import PollStatus
+from vote.event import Event
+from vote.poll import Poll
+
+
+# Subdirectory of the store's root holding the archive. Poll IDs are hex, so can't clash with it.
+ARCHIVE_DIR = "archive"
+
+# Each Poll's files are written under one of this many locks, as Polls themselves are locked (see Poll.lock).
+_IO_LOCK_STRIPES = 64
+
+
+class PollStore:
+    """
+    Durable, append-only storage for Polls.
+
+    Each Poll gets its own directory under root, containing:
+
+    * snapshot-NNNNNNNNNN.bin - the Poll's state as at its first N events, encoded by vote.codec without the events,
+      so its size doesn't grow with the Poll's history.
+
+    * segment-NNNNNNNNNN.log - one JSON line per Event, starting at event N. Together, the segments are the history.
+
+    New Events are buffered and written to the current segment in batches, with one fsync per batch.
+    Files are written and synced under a lock for the Poll's files, not the store's own lock,
+    so that saving one Poll doesn't wait for another's fsync.
+    Every snapshot_every events a new snapshot is taken and a new segment is started,
+    so loading a Poll only has to read its latest snapshot and replay the events since.
+    Older segments are only read for the full history, with load(history=True), e.g. to archive or export a Poll.
+
+    Events which have been buffered but not yet flushed are lost if the process dies.
+    Run flush_forever() in a thread so that they're flushed within sync_interval even if nothing else is saved,
+    and call close() at shutdown.
+
+    Polls which have been closed for archive_after are moved, by archive_closed(), into a vote.archive.PollArchive
+    under root/archive. They're no longer returned by poll_ids() or load_all(), so they aren't loaded at startup,
+    but load() still finds them.
+
+    A store opened read_only, e.g. to export from, never writes: it creates no directories, can't save or archive,
+    and stops reading a segment at a torn record rather than cutting the record off.
+    """
+
+    def __init__(self,
+                 root: str,
+                 snapshot_every: int = 100,
+                 sync_every: int = 32,
+                 sync_interval: float = 1.0,
+                 archive_after: timedelta = timedelta(days=7),
+                 read_only: bool = False,
+                 ) -> None:
+        """
+        :param root: Directory to store polls in. Created if it doesn't exist, unless read_only.
+        :param snapshot_every: Take a new snapshot of a Poll after this many events.
+        :param sync_every: Flush to disk once this many events are buffered...
+        :param sync_interval: ... or once the oldest buffered event is this many seconds old.
+        :param archive_after: How long a Poll stays live after closing, before archive_closed() archives it.
+        :param read_only: Only read what's already in root, which must exist.
+        """
+        self.root = root
+        self.snapshot_every = snapshot_every
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.archive_after = archive_after
+        self.read_only = read_only
+
+        if read_only:
+            if not os.path.isdir(root):
+                raise FileNotFoundError(f"No poll store at {root}.")
+        else:
+            os.makedirs(root, exist_ok=True)
+        self.archive = PollArchive(os.path.join(root, ARCHIVE_DIR), read_only=read_only)
+
+        # Guards the bookkeeping below. Never held while writing files.
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        # Held while writing a Poll's files, so that its writes stay in order. Taken before self._lock.
+        self._io_locks = [threading.Lock() for _ in range(_IO_LOCK_STRIPES)]
+
+        # poll_id -> number of the poll's events which have been handed to the store (buffered or written).
+        self._saved: Dict[str, int] = dict()
+        # poll_id -> number of events included in the poll's latest snapshot.
+        self._snapshot_at: Dict[str, int] = dict()
+        # poll_id -> encoded event lines waiting to be written.
+        self._pending: Dict[str, List[str]] = dict()
+        self._pending_count = 0
+        self._pending_since: float | None = None
+        # poll_id -> when the poll closed, for polls which are closed but not yet archived.
+        self._closed: Dict[str, datetime] = dict()
+
+    def save(self, poll: Poll) -> None:
+        """
+        Persist any of a Poll's events which haven't been saved yet.
+        The first save of a Poll writes a snapshot, which captures the Poll's initial state.
+        Takes the Poll's lock, after the store's own, so don't call this while holding a Poll's lock.
+        :param poll:
+        :return:
+        """
+        self._check_writable()
+        poll_id = poll.poll_id
+        flush_all = False
+        snapshot = None
+
+        with self._io_lock(poll_id):
+            with self._lock, poll.lock:
+                if poll_id not in self._saved:
+                    self._discover(poll_id)
+
+                if poll.status is not PollStatus.OPEN and poll.changed_at is not None:
+                    self._closed.setdefault(poll_id, poll.changed_at)
+
+                first_save = poll_id not in self._snapshot_at
+                if first_save:
+                    # The history so far goes in the first segment, and the first snapshot follows it.
+                    self._saved[poll_id] = self._snapshot_at[poll_id] = poll.events_base
+
+                start = self._saved[poll_id]
+                new_events = poll.events[start - poll.events_base:]
+                if new_events:
+                    lines = self._pending.setdefault(poll_id, [])
+                    for seq, event in enumerate(new_events, start=start):
+                        record = event.to_json_dict()
+                        record["seq"] = seq
+                        lines.append(json.dumps(record, separators=(",", ":")))
+
+                    self._saved[poll_id] = poll.revision
+                    self._pending_count += len(new_events)
+                    if self._pending_since is None:
+                        self._pending_since = time.monotonic()
+                        self._wakeup.notify()
+
+                if first_save or poll.revision - self._snapshot_at[poll_id] >= self.snapshot_every:
+                    # Anything buffered belongs in the old segment, before the snapshot supersedes it.
+                    snapshot = (self._take(poll_id), poll.revision, codec.encode(poll, events=False))
+                    self._snapshot_at[poll_id] = poll.revision
+
+                elif new_events and (self._pending_count >= self.sync_every
+                                     or time.monotonic() - self._pending_since >= self.sync_interval):
+                    flush_all = True
+
+            if snapshot is not None:
+                self._write_snapshot(poll_id, *snapshot)
+
+        # Not holding this Poll's files' lock, as flushing takes every Poll's in turn.
+        if flush_all:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write all buffered events to their segments, and fsync them.
+        :return:
+        """
+        with self._lock:
+            poll_ids = list(self._pending)
+
+        for poll_id in poll_ids:
+            self._flush_poll(poll_id)
+
+        with self._lock:
+            if not self._pending:
+                self._pending_since = None
+
+    def flush_forever(self, stop: threading.Event, max_sleep: float = 1.0) -> None:
+        """
+        Flush buffered events once the oldest is sync_interval old, until stop is set.
+        Intended to run in its own thread, so that events are written on time even if no more saves come.
+        :param stop:
+        :param max_sleep: Upper bound on how long to sleep, so that stop is noticed promptly.
+        :return:
+        """
+        while not stop.is_set():
+            with self._wakeup:
+                timeout = max_sleep
+                if self._pending_since is not None:
+                    timeout = self._pending_since + self.sync_interval - time.monotonic()
+                if timeout > 0:
+                    self._wakeup.wait(timeout=min(timeout, max_sleep))
+                    continue
+
+            # Without the store's lock, which flushing doesn't hold while writing.
+            self.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.archive.close()
+
+    def poll_ids(self) -> List[str]:
+        """
+        :return: The IDs of all live (i.e. not archived) Polls in the store.
+        """
+        return sorted(d for d in os.listdir(self.root)
+                      if d != ARCHIVE_DIR and os.path.isdir(os.path.join(self.root, d)))
+
+    def archive_closed(self, now: Optional[datetime] = None) -> List[str]:
+        """
+        Move Polls which closed more than archive_after ago into the archive, in one new segment.
+        :param now: Current UTC time. Defaults to datetime.utcnow().
+        :return: The IDs of the Polls archived.
+        """
+        self._check_writable()
+        cutoff = (datetime.utcnow() if now is None else now) - self.archive_after
+
+        self.flush()
+        with self._lock:
+            due = sorted(poll_id for poll_id, closed_at in self._closed.items() if closed_at <= cutoff)
+        if not due:
+            return []
+
+        # Archive what's on disk, which is everything, now it's flushed.
+        self.archive.write_segment(self.load(poll_id, history=True) for poll_id in due)
+
+        # The segment is durable, so the live copies can go.
+        for poll_id in due:
+            with self._io_lock(poll_id):
+                shutil.rmtree(self._path(poll_id))
+                with self._lock:
+                    del self._closed[poll_id]
+                    self._saved.pop(poll_id, None)
+                    self._snapshot_at.pop(poll_id, None)
+        self._fsync_dir(self.root)
+
+        log.info(f"PollStore: archived {len(due)} polls")
+        return due
+
+    def load(self, poll_id: str, history: bool = False) -> Poll:
+        """
+        Rebuild a Poll from its latest snapshot, plus the events written after that snapshot.
+        The files are read without holding the store's lock, so Polls can be loaded in parallel,
+        but a Poll mustn't be saved while it's being loaded.
+        :param poll_id:
+        :param history: Whether to read the Poll's whole history from its older segments too.
+            Otherwise Poll.events only holds the events since the snapshot. See Poll.events_base.
+        :return:
+        """
+        with self._lock:
+            pending = poll_id in self._pending
+        if pending:
+            self._flush_poll(poll_id)
+
+        snapshots = self._files(poll_id, "snapshot-")
+        if not snapshots:
+            poll = self.archive.get(poll_id)
+            if poll is None:
+                raise KeyError(f"No poll with ID {poll_id} in {self.root}.")
+            return poll
+
+        snapshot_at, snapshot_name = snapshots[-1]
+        with open(self._path(poll_id, snapshot_name), "rb") as f:
+            poll = codec.decode(f.read())
+
+        segments = self._files(poll_id, "segment-")
+        for start, segment_name in segments:
+            if start < snapshot_at:
+                continue
+            for record in self._read_segment(self._path(poll_id, segment_name), repair=not self.read_only):
+                # Skip anything the snapshot already has.
+                if record["seq"] == poll.revision:
+                    poll.apply_event(Event.from_json_dict(record))
+
+        if history and poll.events_base:
+            self._load_history(poll, [name for start, name in segments if start < snapshot_at])
+
+        with self._lock:
+            self._saved[poll_id] = poll.revision
+            self._snapshot_at[poll_id] = snapshot_at
+            if poll.status is not PollStatus.OPEN and poll.changed_at is not None:
+                self._closed.setdefault(poll_id, poll.changed_at)
+
+        return poll
+
+    def load_all(self, workers: int = 1, history: bool = False) -> Iterator[Poll]:
+        """
+        Every live Poll.
+        :param workers: Load this many Polls at a time, e.g. to restore them quickly at startup.
+            With more than one, every Poll may be loaded before the first is returned.
+        :param history: As for load().
+        """
+        if workers <= 1:
+            for poll_id in self.poll_ids():
+                yield self.load(poll_id, history=history)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="poll-load") as pool:
+            yield from pool.map(lambda poll_id: self.load(poll_id, history=history), self.poll_ids())
+
+    def iter_all(self) -> Iterator[Poll]:
+        """
+        Every Poll in the store, live then archived, loaded one at a time with its whole history.
+        """
+        yield from self.load_all(history=True)
+        yield from self.archive
+
+    def _load_history(self, poll: Poll, segment_names: List[str]) -> None:
+        """
+        Prepend the events before a Poll's snapshot, from the segments written before it.
+        """
+        earlier = []
+        for name in segment_names:
+            for record in self._read_segment(self._path(poll.poll_id, name), repair=not self.read_only):
+                if record["seq"] == len(earlier):
+                    earlier.append(Event.from_json_dict(record))
+
+        if len(earlier) < poll.events_base:
+            log.warning(f"PollStore: poll {poll.poll_id} has only {len(earlier)} of its {poll.events_base} "
+                        f"events before its snapshot; loading it without them")
+            return
+
+        poll.events = earlier[:poll.events_base] + poll.events
+        poll.events_base = 0
+
+    def _discover(self, poll_id: str) -> None:
+        """
+        Pick up the on-disk state of a Poll which this store instance hasn't seen yet,
+        e.g. a Poll saved before a restart.
+        """
+        snapshots = self._files(poll_id, "snapshot-")
+        if snapshots:
+            self.load(poll_id)
+
+    def _write_snapshot(self, poll_id: str, taken: Optional[Tuple[str, List[str]]], seq: int, data: bytes) -> None:
+        """
+        Call holding the Poll's files' lock.
+        :param taken: From _take(), for the segment before the snapshot.
+        :param seq: The number of events the snapshot includes.
+        :param data: The encoded snapshot.
+        """
+        os.makedirs(self._path(poll_id), exist_ok=True)
+        self._append(taken)
+
+        path = self._path(poll_id, f"snapshot-{seq:010d}.bin")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._fsync_dir(self._path(poll_id))
+
+        # The new snapshot supersedes older ones. Older segments stay, as the Poll's history.
+        for _, name in self._files(poll_id, "snapshot-"):
+            if name != os.path.basename(path):
+                os.remove(self._path(poll_id, name))
+
+        log.debug(f"PollStore: snapshot of poll {poll_id} at event {seq}")
+
+    def _flush_poll(self, poll_id: str) -> None:
+        with self._io_lock(poll_id):
+            with self._lock:
+                taken = self._take(poll_id)
+            self._append(taken)
+
+    def _take(self, poll_id: str) -> Optional[Tuple[str, List[str]]]:
+        """
+        Take a Poll's buffered lines, to write them. Call holding the store's lock, and the Poll's files' lock,
+        so that they're written in the order they're taken.
+        :return: (path of the segment they belong in, lines), or None if there are none.
+        """
+        lines = self._pending.pop(poll_id, None)
+        if not lines:
+            return None
+        self._pending_count -= len(lines)
+
+        return self._path(poll_id, f"segment-{self._snapshot_at[poll_id]:010d}.log"), lines
+
+    def _append(self, taken: Optional[Tuple[str, List[str]]]) -> None:
+        """
+        Write lines from _take() to their segment, and fsync it. Call holding the Poll's files' lock.
+        """
+        if taken is None:
+            return
+        path, lines = taken
+
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with open(path, "a+b") as f:
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # A crash lost the last record's newline, but not the record. End its line, so ours don't run on.
+                    data = b"\n" + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _io_lock(self, poll_id: str) -> threading.Lock:
+        return self._io_locks[hash(poll_id) % _IO_LOCK_STRIPES]
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise ValueError(f"PollStore at {self.root} was opened read-only.")
+
+    @staticmethod
+    def _read_segment(path: str, repair: bool = True) -> Iterator[dict]:
+        """
+        :param repair: Whether to cut off a torn record at the end, or just stop reading at it.
+        """
+        with open(path, "rb+" if repair else "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    if not repair:
+                        # A torn write, or one still in progress.
+                        log.warning(f"PollStore: ignoring partial record at byte {offset} of {path}")
+                        return
+                    # A torn write from a crash mid-append. Cut it off, so that later appends start on a clean line.
+                    log.warning(f"PollStore: truncating partial record at byte {offset} of {path}")
+                    f.truncate(offset)
+                    return
+                offset += len(line)
+                yield record
+
+    def _files(self, poll_id: str, prefix: str) -> List[tuple[int, str]]:
+        """
+        :return: (sequence number, file name) of the poll's files with the given prefix, in sequence order.
+        """
+        try:
+            names = os.listdir(self._path(poll_id))
+        except FileNotFoundError:
+            return []
+
+        out = []
+        for name in names:
+            if name.startswith(prefix) and not name.endswith(".tmp"):
+                out.append((int(name[len(prefix):].split(".")[0]), name))
+
+        return sorted(out)
+
+    def _path(self, poll_id: str, *names: str) -> str:
+        return os.path.join(self.root, poll_id, *names)
+
+    _fsync_dir = staticmethod(fsync_dir)
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict, Hashable, List, Set
+
+from vote.enums import EventType, PollStatus
+from vote.event import Event
+from vote.poll import Poll, PEOPLE_ATTRS
+from vote.slackuser import SlackUser
+
+
+class PendingVotesIndex:
+    """
+    For each person: the open Polls they can vote in, the ones still waiting on their vote,
+    and the most recent results of Polls they could vote in or created.
+
+    Kept up to date incrementally, by listening to each tracked Poll's events,
+    so that answering "what's waiting for me?" never scans every Poll.
+
+    Each person also has a view key, which changes whenever any of their entries change,
+    so that anything rendered from the index (e.g. the Home tab) can be cached until it's out of date.
+    It's built when it's asked for, from the revision of each Poll they see, so a change to a Poll
+    (e.g. a vote) costs nothing here however many people see it. Only changes to who sees which Polls
+    are counted per person.
+    """
+
+    def __init__(self, recent_results: int = 5) -> None:
+        """
+        :param recent_results: How many recent results to keep per person.
+        """
+        self.recent_results_per_person = recent_results
+
+        self._polls: Dict[str, Poll] = dict()
+        self._members: Dict[str, Set[SlackUser]] = dict()  # poll_id -> people the Poll is indexed under
+
+        self._open: Dict[SlackUser, Set[str]] = defaultdict(set)
+        self._awaiting: Dict[SlackUser, Set[str]] = defaultdict(set)
+        self._recent: Dict[SlackUser, Deque[str]] = defaultdict(lambda: deque(maxlen=self.recent_results_per_person))
+        self._revisions: Dict[SlackUser, int] = defaultdict(int)  # Bumped when the Polls a person sees change.
+
+        self._lock = threading.RLock()
+
+    def track(self, poll: Poll) -> None:
+        """
+        Start indexing a Poll, and keep indexing it as it changes.
+        :param poll:
+        :return:
+        """
+        with self._lock:
+            self._polls[poll.poll_id] = poll
+            self._index(poll)
+            if poll.status is not PollStatus.OPEN:
+                self._add_result(poll)
+
+        poll.listeners.append(self._on_event)
+
+    def untrack(self, poll_id: str) -> None:
+        """
+        Stop indexing a Poll, e.g. once it's archived, dropping it from everyone's entries, including their results.
+        :param poll_id:
+        :return:
+        """
+        with self._lock:
+            poll = self._polls.pop(poll_id, None)
+            if poll is None:
+                return
+
+            self._unindex(poll)
+            people = set(poll.people_eligible_to_vote)
+            people.add(poll.created_by)
+            for person in people:
+                recent = self._recent.get(person)
+                if recent is not None and poll_id in recent:
+                    recent.remove(poll_id)
+                    self._revisions[person] += 1
+
+        try:
+            poll.listeners.remove(self._on_event)
+        except ValueError:
+            pass
+
+    def get_poll(self, poll_id: str) -> Poll | None:
+        return self._polls.get(poll_id)
+
+    def open_polls(self, person: SlackUser) -> List[Poll]:
+        with self._lock:
+            return [self._polls[i] for i in self._open.get(person, ())]
+
+    def awaiting_vote(self, person: SlackUser) -> List[Poll]:
+        with self._lock:
+            return [self._polls[i] for i in self._awaiting.get(person, ())]
+
+    def recent_results(self, person: SlackUser) -> List[Poll]:
+        """
+        :return: Most recent first.
+        """
+        with self._lock:
+            return [self._polls[i] for i in reversed(self._recent.get(person, ()))]
+
+    def view_key(self, person: SlackUser) -> Hashable:
+        """
+        :return: Equal to an earlier view key for the person only if nothing they'd see has changed since.
+        """
+        with self._lock:
+            poll_ids = self._open.get(person, set()).union(self._recent.get(person, ()))
+            return self._revisions.get(person, 0), tuple(sorted((i, self._polls[i].revision) for i in poll_ids))
+
+    def _on_event(self, poll: Poll, event: Event) -> None:
+        # Any other change, e.g. a vote's tally or an edited text, only changes the Poll's own revision.
+        with self._lock:
+            if event.event_type is EventType.VOTED:
+                self._awaiting[event.person].discard(poll.poll_id)
+
+            elif (event.event_type is EventType.ELIGIBILITY_CHANGED
+                  or event.event_type is EventType.EDITED and event.data["attr"] in PEOPLE_ATTRS):
+                self._unindex(poll)
+                self._index(poll)
+
+            elif "status" in event.data:
+                self._unindex(poll)
+                if poll.status is PollStatus.OPEN:
+                    self._index(poll)
+                else:
+                    self._members[poll.poll_id] = set()
+                    self._add_result(poll)
+
+    def _index(self, poll: Poll) -> None:
+        members = set(poll.people_eligible_to_vote)
+        members.add(poll.created_by)
+        self._members[poll.poll_id] = members
+
+        for person in members:
+            self._revisions[person] += 1
+
+        if poll.status is not PollStatus.OPEN:
+            return
+
+        for person in poll.people_eligible_to_vote:
+            self._open[person].add(poll.poll_id)
+            if poll.vote_of(person) is None:
+                self._awaiting[person].add(poll.poll_id)
+
+        self._open[poll.created_by].add(poll.poll_id)
+
+    def _unindex(self, poll: Poll) -> None:
+        for person in self._members.pop(poll.poll_id, ()):
+            self._open[person].discard(poll.poll_id)
+            self._awaiting[person].discard(poll.poll_id)
+            self._revisions[person] += 1
+
+    def _add_result(self, poll: Poll) -> None:
+        people = set(poll.people_eligible_to_vote)
+        people.add(poll.created_by)
+
+        for person in people:
+            recent = self._recent[person]
+            if poll.poll_id not in recent:
+                recent.append(poll.poll_id)
+            self._revisions[person] += 1